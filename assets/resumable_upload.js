@@ -0,0 +1,142 @@
+// Browser client for the backend's resumable upload routes (tus 1.0.0 core
+// and creation). Files are sent in offset-addressed chunks. Upload URLs are
+// kept in localStorage, so that after a dropped connection, or a reload and
+// picking the same file again, the upload continues from the offset the
+// server has committed instead of starting over.
+(function () {
+  const CHUNK_SIZE = 8 * 1024 * 1024;
+  // Waits (ms) between retries of a failing upload; the count starts over
+  // whenever a chunk gets through.
+  const RETRY_DELAYS = [1000, 3000, 5000, 10000, 20000, 30000];
+  const TUS_HEADERS = { "Tus-Resumable": "1.0.0" };
+
+  class UploadError extends Error {
+    constructor(message, status) {
+      super(message);
+      this.status = status;
+    }
+  }
+
+  function storageKey(file) {
+    return `video_to_mp4.upload:${file.name}:${file.size}:${file.lastModified}`;
+  }
+
+  async function check(response) {
+    if (!response.ok) {
+      const text = await response.text();
+      throw new UploadError(text || response.statusText, response.status);
+    }
+    return response;
+  }
+
+  async function createUpload(endpoint, file) {
+    const filename = btoa(String.fromCharCode(...new TextEncoder().encode(file.name)));
+    const response = await check(
+      await fetch(endpoint, {
+        method: "POST",
+        headers: {
+          ...TUS_HEADERS,
+          "Upload-Length": String(file.size),
+          "Upload-Metadata": `filename ${filename}`,
+        },
+      })
+    );
+    return new URL(response.headers.get("Location"), endpoint).href;
+  }
+
+  async function committedOffset(url) {
+    const response = await fetch(url, {
+      method: "HEAD",
+      headers: TUS_HEADERS,
+      cache: "no-store",
+    });
+    if (response.status === 404 || response.status === 410) {
+      return null;
+    }
+    await check(response);
+    return Number(response.headers.get("Upload-Offset"));
+  }
+
+  async function sendChunks(url, file, offset, onProgress) {
+    while (offset < file.size) {
+      const response = await check(
+        await fetch(url, {
+          method: "PATCH",
+          headers: {
+            ...TUS_HEADERS,
+            "Upload-Offset": String(offset),
+            "Content-Type": "application/offset+octet-stream",
+          },
+          body: file.slice(offset, offset + CHUNK_SIZE),
+        })
+      );
+      offset = Number(response.headers.get("Upload-Offset"));
+      onProgress(offset);
+    }
+  }
+
+  async function uploadFile(endpoint, file, onProgress) {
+    const key = storageKey(file);
+    let url = localStorage.getItem(key);
+    let failures = 0;
+    for (;;) {
+      try {
+        let offset = url ? await committedOffset(url) : null;
+        if (offset === null) {
+          url = await createUpload(endpoint, file);
+          localStorage.setItem(key, url);
+          offset = 0;
+        }
+        await sendChunks(url, file, offset, (committed) => {
+          failures = 0;
+          onProgress(committed);
+        });
+        localStorage.removeItem(key);
+        return url.split("/").pop();
+      } catch (error) {
+        // Client errors other than an offset conflict will not go away by
+        // retrying; network errors and server errors might.
+        const permanent = error.status && error.status < 500 && error.status !== 409;
+        if (permanent || failures >= RETRY_DELAYS.length) {
+          throw error;
+        }
+        await new Promise((resolve) => setTimeout(resolve, RETRY_DELAYS[failures]));
+        failures += 1;
+      }
+    }
+  }
+
+  // Upload the files picked in the input with id inputId to endpoint,
+  // showing progress in the element with id progressId. Resolves with one
+  // {filename, upload_id} or {filename, error} entry per file.
+  async function resumableUpload(inputId, endpoint, progressId) {
+    const input = document.getElementById(inputId);
+    const progress = document.getElementById(progressId);
+    const files = Array.from((input && input.files) || []);
+    const total = files.reduce((sum, file) => sum + file.size, 0) || 1;
+    let done = 0;
+    const results = [];
+    for (const file of files) {
+      try {
+        const uploadId = await uploadFile(endpoint, file, (committed) => {
+          if (progress) {
+            progress.textContent = `${Math.floor(((done + committed) / total) * 100)}%`;
+          }
+        });
+        results.push({ filename: file.name, upload_id: uploadId });
+      } catch (error) {
+        results.push({ filename: file.name, error: String(error.message || error) });
+      }
+      done += file.size;
+    }
+    if (input) {
+      input.value = "";
+    }
+    if (progress) {
+      progress.textContent = "";
+    }
+    return results;
+  }
+
+  window.videoToMp4 = Object.assign(window.videoToMp4 || {}, { resumableUpload });
+})();
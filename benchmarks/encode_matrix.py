@@ -0,0 +1,335 @@
+"""Encode benchmark over the container x resolution x quality matrix.
+
+Synthetic clips are generated locally with ffmpeg lavfi sources, one per
+input container, and each case is converted through the same convert_job
+path the job runner uses. Every case runs in a fresh subprocess so that
+CPU time and peak RSS cover only that conversion's ffmpeg processes.
+
+    python -m benchmarks.encode_matrix --output results.json
+    python -m benchmarks.encode_matrix --output new.json --baseline results.json
+
+With --baseline the run is compared case by case and the exit status is 1
+if wall time, CPU time, peak RSS or output size got worse by more than
+--tolerance.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import ffmpeg
+
+from video_to_mp4.services.converter import (
+    MAX_BITRATE,
+    QUALITY_OPTIONS,
+    RESOLUTION_OPTIONS,
+    TARGET_SIZE,
+)
+
+# How each input container is generated. mov and mkv hold H.264/AAC, which
+# Original resolution remuxes; the others always go through the encoder.
+CONTAINERS = {
+    "avi": {"vcodec": "mpeg4", "acodec": "pcm_s16le"},
+    "mov": {"vcodec": "libx264", "acodec": "aac"},
+    "mkv": {"vcodec": "libx264", "acodec": "aac"},
+    "wmv": {"vcodec": "wmv2", "acodec": "wmav2"},
+    "mp4": {"vcodec": "mpeg4", "acodec": "aac"},
+    "webm": {"vcodec": "libvpx", "acodec": "libvorbis"},
+}
+
+SOURCES = ["testsrc2", "mandelbrot"]
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Metrics compared against a baseline; higher is worse for all of them.
+COMPARED_METRICS = ["wall_seconds", "cpu_seconds", "peak_rss_kb", "output_size"]
+
+
+def generate_clip(path: Path, source: str, size: str, rate: int, duration: float):
+    video = ffmpeg.input(
+        f"{source}=size={size}:rate={rate}:duration={duration}", f="lavfi"
+    )
+    audio = ffmpeg.input(
+        f"sine=frequency=440:sample_rate=48000:duration={duration}", f="lavfi"
+    )
+    codecs = CONTAINERS[path.suffix[1:]]
+    ffmpeg.output(video, audio, str(path), pix_fmt="yuv420p", **codecs).run(
+        overwrite_output=True, capture_stdout=True, capture_stderr=True
+    )
+
+
+def _children_usage() -> tuple[float, int]:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    peak_rss = usage.ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+    return usage.ru_utime + usage.ru_stime, peak_rss
+
+
+def run_case(case: dict) -> dict:
+    """Convert one clip in this process; meant to run in a fresh subprocess."""
+    from video_to_mp4.services.converter import convert_job
+
+    clip = Path(case["clip"])
+    job = {
+        "id": f"bench_{uuid.uuid4().hex[:12]}",
+        "filename": clip.name,
+        # A fresh hash per run keeps the output dedup from reusing results.
+        "content_hash": uuid.uuid4().hex,
+        "resolution": case["resolution"],
+        "quality": case["quality"],
+        "target_size": case["target_size"],
+        "max_bitrate": case["max_bitrate"],
+    }
+    started = time.perf_counter()
+    result = convert_job(job, clip.parent, case["threads"])
+    wall = time.perf_counter() - started
+    cpu, peak_rss = _children_usage()
+    (clip.parent / result["converted_filename"]).unlink(missing_ok=True)
+    return {
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "peak_rss_kb": peak_rss,
+        "output_size": result["converted_size"],
+        "remuxed": result["remuxed"],
+    }
+
+
+def _run_case_subprocess(case: dict, data_dir: Path) -> dict:
+    env = dict(os.environ, VIDEO_TO_MP4_DATA_DIR=str(data_dir))
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.encode_matrix"]
+        + ["--run-case", json.dumps(case)],
+        cwd=_REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        detail = completed.stderr.strip().splitlines()[-1:] or ["unknown error"]
+        return {"error": detail[0]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _median_run(runs: list[dict]) -> dict:
+    """The run with the median wall time, with how much wall time varied."""
+    runs = sorted(runs, key=lambda run: run["wall_seconds"])
+    result = dict(runs[len(runs) // 2])
+    if len(runs) > 1:
+        result["wall_stdev"] = round(
+            statistics.stdev(run["wall_seconds"] for run in runs), 3
+        )
+    return result
+
+
+def _ffmpeg_version() -> str:
+    try:
+        output = subprocess.run(
+            ["ffmpeg", "-version"], capture_output=True, text=True
+        ).stdout
+    except OSError:
+        return "unknown"
+    return output.splitlines()[0] if output else "unknown"
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def run_matrix(args: argparse.Namespace) -> dict:
+    frames = round(args.duration * args.rate)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="encode_bench_") as tmp:
+        tmp = Path(tmp)
+        clips_dir = tmp / "clips"
+        clips_dir.mkdir()
+        for container in args.containers:
+            clip = clips_dir / f"{args.source}.{container}"
+            try:
+                generate_clip(clip, args.source, args.size, args.rate, args.duration)
+            except ffmpeg.Error as e:
+                message = e.stderr.decode(errors="ignore").strip().splitlines()[-1:]
+                print(f"skipping {container}: {message}", file=sys.stderr)
+                continue
+            for resolution in args.resolutions:
+                for quality in args.qualities:
+                    case = {
+                        "clip": str(clip),
+                        "resolution": resolution,
+                        "quality": quality,
+                        "target_size": (
+                            args.target_size_mb * 1024 * 1024
+                            if quality == TARGET_SIZE
+                            else None
+                        ),
+                        "max_bitrate": (
+                            args.max_bitrate_kbps if quality == MAX_BITRATE else None
+                        ),
+                        "threads": args.threads,
+                    }
+                    runs = []
+                    for _ in range(args.repeat):
+                        run = _run_case_subprocess(case, tmp / "data")
+                        if "error" in run:
+                            runs = [run]
+                            break
+                        runs.append(run)
+                    result = runs[0] if "error" in runs[0] else _median_run(runs)
+                    if "wall_seconds" in result:
+                        wall = result["wall_seconds"]
+                        result["fps"] = round(frames / wall, 2)
+                        result["speed"] = round(args.duration / wall, 3)
+                    result.update(
+                        container=container, resolution=resolution, quality=quality
+                    )
+                    results.append(result)
+                    print(_format_result(result), file=sys.stderr)
+    return {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "ffmpeg": _ffmpeg_version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "source": args.source,
+            "size": args.size,
+            "rate": args.rate,
+            "duration": args.duration,
+            "threads": args.threads,
+            "repeat": args.repeat,
+            "target_size_mb": args.target_size_mb,
+            "max_bitrate_kbps": args.max_bitrate_kbps,
+        },
+        "results": results,
+    }
+
+
+def _case_key(result: dict) -> tuple:
+    return result["container"], result["resolution"], result["quality"]
+
+
+def _format_result(result: dict) -> str:
+    name = "{container:>4} {resolution:>8} {quality:>11}".format(**result)
+    if "error" in result:
+        return f"{name}  error: {result['error']}"
+    return (
+        f"{name}  {result['wall_seconds']:8.2f}s {result['fps']:8.1f} fps"
+        f" {result['speed']:6.2f}x {result['cpu_seconds']:8.2f} cpu-s"
+        f" {result['peak_rss_kb'] // 1024:6d} MiB {result['output_size']:>12d} B"
+    )
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions of current against baseline, one line per metric."""
+    previous = {
+        _case_key(result): result
+        for result in baseline["results"]
+        if "error" not in result
+    }
+    regressions = []
+    for result in current["results"]:
+        before = previous.get(_case_key(result))
+        if before is None or "error" in result:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = before[metric], result[metric]
+            if old and (new - old) / old > tolerance:
+                regressions.append(
+                    "{} {} {}: {} {} -> {} ({:+.1%})".format(
+                        *_case_key(result), metric, old, new, (new - old) / old
+                    )
+                )
+    return regressions
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", type=Path, help="write results JSON here")
+    parser.add_argument("--baseline", type=Path, help="results JSON to compare to")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.10,
+        help="relative worsening counted as a regression (default: %(default)s)",
+    )
+    parser.add_argument("--source", choices=SOURCES, default="testsrc2")
+    parser.add_argument("--size", default="1280x720", help="clip frame size")
+    parser.add_argument("--rate", type=int, default=30, help="clip frame rate")
+    parser.add_argument(
+        "--duration", type=float, default=5.0, help="clip length in seconds"
+    )
+    parser.add_argument(
+        "--containers", nargs="+", choices=list(CONTAINERS), default=list(CONTAINERS)
+    )
+    parser.add_argument(
+        "--resolutions",
+        nargs="+",
+        choices=RESOLUTION_OPTIONS,
+        default=RESOLUTION_OPTIONS,
+    )
+    parser.add_argument(
+        "--qualities", nargs="+", choices=QUALITY_OPTIONS, default=QUALITY_OPTIONS
+    )
+    parser.add_argument(
+        "--target-size-mb",
+        type=int,
+        default=2,
+        help="output size of Target Size cases (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-bitrate-kbps",
+        type=int,
+        default=2000,
+        help="bitrate cap of Max Bitrate cases (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="thread budget per conversion (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="runs per case; the median is kept"
+    )
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return 0
+    args.repeat = max(1, args.repeat)
+    results = run_matrix(args)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+    if args.baseline:
+        regressions = compare(
+            results, json.loads(args.baseline.read_text()), args.tolerance
+        )
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
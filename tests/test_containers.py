@@ -0,0 +1,159 @@
+import struct
+
+import pytest
+
+from video_to_mp4.services.containers import (
+    ASF,
+    AVI,
+    ISO_BMFF,
+    MATROSKA,
+    InvalidContainer,
+    check_complete,
+    check_head,
+    detect_container,
+)
+
+ASF_GUID = bytes.fromhex("3026b2758e66cf11a6d900aa0062ce6c")
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+SEGMENT_ID = b"\x18\x53\x80\x67"
+
+
+def box(box_type: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def ebml_header(doc_type: bytes) -> bytes:
+    # DocType element (0x4282) inside the EBML header, sizes as 1 byte vints.
+    doc = b"\x42\x82" + bytes([0x80 | len(doc_type)]) + doc_type
+    return EBML_MAGIC + bytes([0x80 | len(doc)]) + doc
+
+
+def segment(declared_size: int, payload: bytes = b"") -> bytes:
+    # 8 byte size vint: marker 0x01 followed by 7 bytes of size.
+    size = (1 << 56) | declared_size
+    return SEGMENT_ID + size.to_bytes(8, "big") + payload
+
+
+def avi(declared_size: int, payload: bytes = b"") -> bytes:
+    return b"RIFF" + struct.pack("<I", declared_size) + b"AVI " + payload
+
+
+def write(tmp_path, data: bytes):
+    path = tmp_path / "upload"
+    path.write_bytes(data)
+    return path
+
+
+@pytest.mark.parametrize(
+    "head, container",
+    [
+        (avi(4), AVI),
+        (ASF_GUID + struct.pack("<Q", 24), ASF),
+        (ebml_header(b"matroska"), MATROSKA),
+        (ebml_header(b"webm"), MATROSKA),
+        (box(b"ftyp", b"isom"), ISO_BMFF),
+        (box(b"moov"), ISO_BMFF),
+        (struct.pack(">I4sQ", 1, b"mdat", 16), ISO_BMFF),
+    ],
+)
+def test_detect_container(head, container):
+    assert detect_container(head) == container
+
+
+@pytest.mark.parametrize(
+    "head",
+    [
+        b"PK\x03\x04" + b"\x00" * 26,  # zip archive
+        b"%PDF-1.7\n",
+        b"RIFF\x04\x00\x00\x00WAVE",
+        ebml_header(b"other"),
+        box(b"abcd"),  # printable but not a known first box
+        struct.pack(">I4s", 4, b"ftyp"),  # size smaller than its header
+        b"\x00\x00\x00\x08ft",  # cut inside the box header
+    ],
+)
+def test_detect_container_rejects_other_files(head):
+    assert detect_container(head) is None
+    with pytest.raises(InvalidContainer):
+        check_head(head)
+
+
+def test_check_head_rejects_empty_file():
+    with pytest.raises(InvalidContainer, match="empty"):
+        check_head(b"")
+
+
+def test_complete_mp4(tmp_path):
+    path = write(tmp_path, box(b"ftyp", b"isom") + box(b"moov", b"x" * 32))
+    check_complete(path)
+
+
+def test_mp4_mdat_running_to_end_of_file(tmp_path):
+    data = box(b"ftyp", b"isom") + box(b"moov") + struct.pack(">I4s", 0, b"mdat")
+    check_complete(write(tmp_path, data + b"x" * 100))
+
+
+def test_truncated_mp4(tmp_path):
+    data = box(b"ftyp", b"isom") + box(b"moov") + box(b"mdat", b"x" * 100)
+    with pytest.raises(InvalidContainer, match="truncated"):
+        check_complete(write(tmp_path, data[:-10]))
+
+
+def test_mp4_without_moov(tmp_path):
+    data = box(b"ftyp", b"isom") + box(b"mdat", b"x" * 100)
+    with pytest.raises(InvalidContainer, match="moov"):
+        check_complete(write(tmp_path, data))
+
+
+def test_mp4_with_garbage_after_a_box(tmp_path):
+    data = box(b"ftyp", b"isom") + b"\xff" * 16
+    with pytest.raises(InvalidContainer, match="corrupt"):
+        check_complete(write(tmp_path, data))
+
+
+def test_complete_matroska(tmp_path):
+    data = ebml_header(b"webm") + segment(100, b"x" * 100)
+    check_complete(write(tmp_path, data))
+
+
+def test_truncated_matroska(tmp_path):
+    data = ebml_header(b"matroska") + segment(100, b"x" * 60)
+    with pytest.raises(InvalidContainer, match="truncated"):
+        check_complete(write(tmp_path, data))
+
+
+def test_matroska_of_unknown_size(tmp_path):
+    # All size bits set marks a Segment written without knowing its length.
+    data = ebml_header(b"matroska") + SEGMENT_ID + b"\x01" + b"\xff" * 7
+    check_complete(write(tmp_path, data + b"x" * 10))
+
+
+def test_matroska_without_segment(tmp_path):
+    with pytest.raises(InvalidContainer, match="segment"):
+        check_complete(write(tmp_path, ebml_header(b"matroska")))
+
+
+def test_matroska_cut_inside_an_element_header(tmp_path):
+    data = ebml_header(b"matroska") + SEGMENT_ID + b"\x01\x00"
+    with pytest.raises(InvalidContainer, match="truncated"):
+        check_complete(write(tmp_path, data))
+
+
+def test_complete_avi(tmp_path):
+    check_complete(write(tmp_path, avi(4 + 20, b"x" * 20)))
+
+
+def test_truncated_avi(tmp_path):
+    with pytest.raises(InvalidContainer, match="truncated"):
+        check_complete(write(tmp_path, avi(4 + 20, b"x" * 10)))
+
+
+def test_complete_asf(tmp_path):
+    data = ASF_GUID + struct.pack("<Q", 40)
+    check_complete(write(tmp_path, data + b"x" * 16))
+
+
+def test_truncated_asf(tmp_path):
+    data = ASF_GUID + struct.pack("<Q", 400)
+    with pytest.raises(InvalidContainer, match="truncated"):
+        check_complete(write(tmp_path, data + b"x" * 16))
@@ -0,0 +1,70 @@
+import pytest
+
+from video_to_mp4.services.media import can_remux, duration_from_probe, has_audio
+
+H264 = {"codec_type": "video", "codec_name": "h264"}
+AAC = {"codec_type": "audio", "codec_name": "aac"}
+COVER = {
+    "codec_type": "video",
+    "codec_name": "mjpeg",
+    "disposition": {"attached_pic": 1},
+}
+
+
+def probe(format_name="mov,mp4,m4a,3gp,3g2,mj2", streams=(H264, AAC)):
+    return {"format": {"format_name": format_name}, "streams": list(streams)}
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        probe(),
+        probe(format_name="matroska,webm"),
+        probe(streams=[H264]),
+        probe(streams=[H264, AAC, AAC]),
+        probe(streams=[COVER, H264, AAC]),
+    ],
+)
+def test_can_remux(source):
+    assert can_remux(source, "Original")
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        None,
+        {},
+        probe(format_name="avi"),
+        probe(format_name="asf"),
+        probe(streams=[{"codec_type": "video", "codec_name": "hevc"}, AAC]),
+        probe(streams=[H264, {"codec_type": "audio", "codec_name": "mp3"}]),
+        probe(streams=[H264, H264, AAC]),
+        probe(streams=[AAC]),
+    ],
+)
+def test_cannot_remux(source):
+    assert not can_remux(source, "Original")
+
+
+def test_scaling_needs_an_encode():
+    assert not can_remux(probe(), "720p")
+
+
+def test_has_audio():
+    assert has_audio(probe())
+    assert not has_audio(probe(streams=[H264]))
+    assert not has_audio(None)
+
+
+@pytest.mark.parametrize(
+    "source, duration",
+    [
+        ({"format": {"duration": "12.5"}}, 12.5),
+        ({"format": {}, "streams": [{}, {"duration": "3"}]}, 3.0),
+        ({"format": {"duration": "N/A"}}, None),
+        ({"streams": []}, None),
+        (None, None),
+    ],
+)
+def test_duration_from_probe(source, duration):
+    assert duration_from_probe(source) == duration
@@ -0,0 +1,72 @@
+from video_to_mp4.services import media_index
+from video_to_mp4.services.media_index import (
+    content_fingerprint,
+    media_info_from_probe,
+)
+
+PROBE = {
+    "format": {"format_name": "mov,mp4,m4a", "duration": "12.5", "bit_rate": "900"},
+    "streams": [
+        {
+            "codec_type": "video",
+            "codec_name": "mjpeg",
+            "disposition": {"attached_pic": 1},
+        },
+        {
+            "codec_type": "video",
+            "codec_name": "h264",
+            "width": 1920,
+            "height": "1080",
+            "avg_frame_rate": "30000/1001",
+            "bit_rate": "800",
+        },
+        {"codec_type": "audio", "codec_name": "aac", "bit_rate": "128"},
+    ],
+}
+
+
+def test_media_info_from_probe():
+    assert media_info_from_probe(PROBE) == {
+        "duration": 12.5,
+        "format_name": "mov,mp4,m4a",
+        "video_codec": "h264",
+        "audio_codec": "aac",
+        "width": 1920,
+        "height": 1080,
+        "frame_rate": 29.97,
+        "video_bitrate": 800,
+        "audio_bitrate": 128,
+        "bit_rate": 900,
+    }
+
+
+def test_media_info_falls_back_to_r_frame_rate():
+    probe = {
+        "streams": [
+            {"codec_type": "video", "avg_frame_rate": "0/0", "r_frame_rate": "25/1"}
+        ]
+    }
+    assert media_info_from_probe(probe)["frame_rate"] == 25.0
+
+
+def test_media_info_of_an_empty_probe():
+    info = media_info_from_probe({})
+    assert set(info.values()) == {None}
+
+
+def test_fingerprint_depends_on_sampled_content(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_index, "_SAMPLE_SIZE", 4)
+    a = tmp_path / "a"
+    b = tmp_path / "b"
+    a.write_bytes(b"0123456789abcdef")
+    b.write_bytes(b"0123456789abcdeX")
+    assert content_fingerprint(a, 16) != content_fingerprint(b, 16)
+    # Bytes outside the start, middle and end samples are not read.
+    b.write_bytes(b"0123X56789abcdef")
+    assert content_fingerprint(a, 16) == content_fingerprint(b, 16)
+
+
+def test_fingerprint_depends_on_size(tmp_path):
+    path = tmp_path / "a"
+    path.write_bytes(b"same")
+    assert content_fingerprint(path, 4) != content_fingerprint(path, 5)
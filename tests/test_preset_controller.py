@@ -0,0 +1,80 @@
+import pytest
+
+from video_to_mp4.services import preset_controller
+from video_to_mp4.services.preset_controller import PresetController
+
+NOW = 1_000_000.0
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    monkeypatch.setattr(preset_controller.time, "time", lambda: NOW)
+    # Until an encode is measured, medium runs at 0.5 media seconds per
+    # second and thread.
+    return PresetController(target_seconds=60)
+
+
+def choose(
+    controller,
+    preset="medium",
+    duration=10.0,
+    threads=1,
+    backlog=0,
+    slots=1,
+    waited=0.0,
+):
+    return controller.choose(preset, duration, threads, backlog, slots, NOW - waited)
+
+
+def test_keeps_the_preset_when_on_target(controller):
+    assert choose(controller, duration=10.0) == "medium"
+
+
+def test_long_job_gets_a_faster_preset(controller):
+    assert choose(controller, duration=100.0) == "veryfast"
+
+
+def test_more_threads_keep_the_preset(controller):
+    assert choose(controller, duration=100.0, threads=4) == "medium"
+
+
+def test_backlog_behind_the_job_counts(controller):
+    assert choose(controller, backlog=9) == "veryfast"
+    assert choose(controller, backlog=9, slots=10) == "medium"
+
+
+def test_time_already_waited_counts(controller):
+    assert choose(controller, waited=45.0) == "fast"
+
+
+def test_never_slower_than_requested(controller):
+    assert choose(controller, preset="veryfast", duration=1.0) == "veryfast"
+
+
+def test_falls_back_to_the_fastest_preset(controller):
+    assert choose(controller, duration=10_000.0) == "ultrafast"
+
+
+@pytest.mark.parametrize("preset, duration", [("custom", 100.0), ("medium", None)])
+def test_unknown_preset_or_duration_is_left_alone(controller, preset, duration):
+    assert choose(controller, preset=preset, duration=duration) == preset
+
+
+def test_measured_speed_replaces_the_default(controller):
+    controller.record("medium", 100.0, 1, 50.0)
+    assert choose(controller, duration=100.0) == "medium"
+
+
+def test_speed_is_measured_relative_to_medium(controller):
+    # ultrafast is 8 times medium, so this is medium at 0.25 per second.
+    controller.record("ultrafast", 20.0, 1, 10.0)
+    assert choose(controller, duration=20.0) == "fast"
+
+
+@pytest.mark.parametrize(
+    "preset, duration, seconds",
+    [("custom", 10.0, 5.0), ("medium", 0.0, 5.0), ("medium", 10.0, 0.0)],
+)
+def test_invalid_measurements_are_ignored(controller, preset, duration, seconds):
+    controller.record(preset, duration, 1, seconds)
+    assert choose(controller, duration=100.0) == "veryfast"
@@ -0,0 +1,98 @@
+import pytest
+
+from video_to_mp4.services import progress
+from video_to_mp4.services.progress import ProgressEstimator, ProgressThrottle
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(progress.time, "monotonic", clock)
+    return clock
+
+
+def test_snapshot_before_any_report(clock):
+    assert ProgressEstimator().snapshot() == {
+        "speed": None,
+        "fps": None,
+        "eta_seconds": None,
+        "projected_size": None,
+    }
+
+
+def test_eta_from_progress_rate(clock):
+    estimator = ProgressEstimator()
+    estimator.add_progress(10.0)
+    clock.now += 10
+    estimator.add_progress(20.0)
+    assert estimator.snapshot()["eta_seconds"] == pytest.approx(80.0)
+
+
+def test_rate_is_smoothed(clock):
+    estimator = ProgressEstimator(smoothing=0.5)
+    estimator.add_progress(0.0)
+    clock.now += 1
+    estimator.add_progress(2.0)  # 2 %/s
+    clock.now += 1
+    estimator.add_progress(6.0)  # 4 %/s, averaged to 3 %/s
+    assert estimator.snapshot()["eta_seconds"] == pytest.approx(94.0 / 3.0)
+
+
+def test_progress_going_back_keeps_the_rate(clock):
+    # A second encoding pass restarts its own percentage.
+    estimator = ProgressEstimator()
+    estimator.add_progress(50.0)
+    clock.now += 10
+    estimator.add_progress(60.0)
+    clock.now += 10
+    estimator.add_progress(40.0)
+    assert estimator.snapshot()["eta_seconds"] == pytest.approx(60.0)
+
+
+def test_speed_and_fps_are_smoothed(clock):
+    estimator = ProgressEstimator(smoothing=0.5)
+    estimator.add_stats({"speed": 2.0, "fps": 50.0})
+    estimator.add_stats({"speed": 4.0, "fps": None})
+    snapshot = estimator.snapshot()
+    assert snapshot["speed"] == 3.0
+    assert snapshot["fps"] == 50.0
+
+
+def test_projected_size_from_media_written(clock):
+    estimator = ProgressEstimator(duration=100.0)
+    estimator.add_progress(80.0)
+    estimator.add_stats({"total_size": 1000, "out_time": 25.0})
+    assert estimator.snapshot()["projected_size"] == 4000
+
+
+def test_projected_size_from_progress_without_duration(clock):
+    estimator = ProgressEstimator()
+    estimator.add_progress(25.0)
+    estimator.add_stats({"total_size": 1000, "out_time": 10.0})
+    assert estimator.snapshot()["projected_size"] == 4000
+
+
+def test_projected_size_waits_for_output(clock):
+    estimator = ProgressEstimator(duration=100.0)
+    estimator.add_progress(0.5)
+    estimator.add_stats({"total_size": 48, "out_time": 0.0})
+    assert estimator.snapshot()["projected_size"] is None
+
+
+def test_throttle_drops_values_within_the_interval(clock):
+    sent = []
+    throttle = ProgressThrottle(sent.append, hz=2)
+    throttle(1.0)
+    clock.now += 0.2
+    throttle(2.0)
+    clock.now += 0.4
+    throttle(3.0)
+    assert sent == [1.0, 3.0]
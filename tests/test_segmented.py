@@ -0,0 +1,96 @@
+import pytest
+
+from video_to_mp4.services import segmented
+from video_to_mp4.services.segmented import _SegmentProgress, keyframe_boundaries
+
+
+def packets(keyframes, start, window):
+    """ffprobe packet entries in [start, start + window], one per second."""
+    found = []
+    for second in range(int(start), int(start + window) + 1):
+        flags = "K_" if second in keyframes else "__"
+        found.append({"pts_time": f"{second:.6f}", "flags": flags})
+    return {"packets": found}
+
+
+@pytest.fixture
+def probe_keyframes(monkeypatch):
+    monkeypatch.setattr(segmented.settings, "SEGMENT_MIN_LENGTH", 30)
+    calls = []
+
+    def use(keyframes):
+        def probe(path, read_intervals, **kwargs):
+            start, _, window = read_intervals.partition("%+")
+            calls.append(float(start))
+            return packets(set(keyframes), float(start), int(window))
+
+        monkeypatch.setattr(segmented.ffmpeg, "probe", probe)
+        return calls
+
+    return use
+
+
+def test_cuts_snap_to_the_next_keyframe(probe_keyframes):
+    probe_keyframes(range(0, 600, 7))
+    assert keyframe_boundaries("in.mkv", 600.0, 4) == [0.0, 154.0, 301.0, 455.0, 600.0]
+
+
+def test_cut_points_account_for_the_start_time(probe_keyframes):
+    calls = probe_keyframes(range(10, 610, 7))
+    boundaries = keyframe_boundaries("in.mkv", 600.0, 2, start_time=10.0)
+    assert calls == [310.0]
+    assert boundaries == [0.0, 301.0, 600.0]
+
+
+def test_no_keyframe_in_the_window_stops_splitting(probe_keyframes):
+    probe_keyframes([0, 150])
+    assert keyframe_boundaries("in.mkv", 600.0, 4) == [0.0, 150.0, 600.0]
+
+
+def test_short_last_segment_is_dropped(probe_keyframes):
+    probe_keyframes([0, 580])
+    assert keyframe_boundaries("in.mkv", 600.0, 2) == [0.0, 600.0]
+
+
+def test_segments_keep_the_minimum_length(probe_keyframes):
+    calls = probe_keyframes(range(0, 200))
+    assert keyframe_boundaries("in.mkv", 100.0, 10) == [0.0, 30.0, 60.0, 100.0]
+    assert calls == [30.0, 60.0, 90.0]
+
+
+def test_segment_progress_is_weighted_by_length():
+    reported = []
+    progress = _SegmentProgress(100.0, reported.append)
+    first = progress.for_segment(0, 25.0)
+    second = progress.for_segment(1, 75.0)
+    first(100.0)
+    second(50.0)
+    assert reported == [25.0, 62.5]
+    second(100.0)
+    assert reported[-1] == 99.99
+
+
+def test_segment_stats_add_up_over_running_segments():
+    reported = []
+    progress = _SegmentProgress(100.0, None, reported.append)
+
+    def stats(fps, size, out_time, finished):
+        return {
+            "fps": fps,
+            "speed": fps / 25,
+            "bitrate_kbps": 1000.0,
+            "total_size": size,
+            "out_time": out_time,
+            "finished": finished,
+        }
+
+    progress.stats_for_segment(0)(stats(50.0, 100, 10.0, True))
+    progress.stats_for_segment(1)(stats(25.0, 300, 5.0, False))
+    assert reported[-1] == {
+        "fps": 25.0,
+        "speed": 1.0,
+        "bitrate_kbps": None,
+        "total_size": 400,
+        "out_time": 15.0,
+        "finished": False,
+    }
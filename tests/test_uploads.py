@@ -0,0 +1,64 @@
+import asyncio
+import base64
+import hashlib
+import io
+
+import pytest
+
+from video_to_mp4.services.uploads import UploadTooLarge, _iter_base64, write_upload
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 5, 6, 7, 100, 1024, 4096])
+def test_base64_chunks_decode_to_the_payload(size):
+    chunks = list(_iter_base64(base64.b64encode(DATA).decode(), size))
+    assert b"".join(chunks) == DATA
+    assert all(len(chunk) <= max(3, size) for chunk in chunks)
+
+
+@pytest.mark.parametrize("length", [1, 2, 3, 4])
+def test_base64_padding_in_the_last_chunk(length):
+    text = base64.b64encode(DATA[:length]).decode()
+    assert b"".join(_iter_base64(text, 3)) == DATA[:length]
+
+
+def test_non_base64_text_is_taken_as_utf8():
+    text = "not base64 ü"
+    assert b"".join(_iter_base64(text, 4)) == text.encode("utf-8")
+
+
+def test_padding_inside_the_payload_is_not_base64():
+    text = base64.b64encode(b"a").decode() + "AAAA"
+    assert b"".join(_iter_base64(text, 3)) == text.encode("utf-8")
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        DATA,
+        list(DATA),
+        base64.b64encode(DATA).decode(),
+        io.BytesIO(DATA),
+    ],
+)
+def test_write_upload(tmp_path, source):
+    path = tmp_path / "upload"
+    hasher = hashlib.sha256()
+    written = asyncio.run(write_upload(source, path, chunk_size=100, hasher=hasher))
+    assert written == len(DATA)
+    assert path.read_bytes() == DATA
+    assert hasher.hexdigest() == hashlib.sha256(DATA).hexdigest()
+
+
+def test_write_upload_past_max_bytes_removes_the_file(tmp_path):
+    path = tmp_path / "upload"
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(write_upload(DATA, path, chunk_size=100, max_bytes=500))
+    assert not path.exists()
+
+
+def test_write_upload_checks_the_head_of_short_uploads(tmp_path):
+    heads = []
+    asyncio.run(write_upload(DATA, tmp_path / "upload", check_head=heads.append))
+    assert heads == [DATA]
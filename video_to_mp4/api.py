@@ -0,0 +1,345 @@
+"""Plain HTTP routes served by the backend next to the Reflex app."""
+
+import asyncio
+import base64
+import binascii
+import os
+
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+import reflex as rx
+from starlette.applications import Starlette
+from starlette.requests import ClientDisconnect, Request
+from starlette.responses import (
+    FileResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from starlette.routing import Route
+
+from video_to_mp4 import settings
+from video_to_mp4.services import (
+    blob_store,
+    capacity,
+    job_store,
+    metrics,
+    previews,
+    resumable,
+)
+from video_to_mp4.services.containers import InvalidContainer
+from video_to_mp4.services.converter import job_resolutions, partial_output_path
+
+# Read size for range requests. Whole-file responses are handed to the
+# server with the ASGI pathsend extension instead, which granian sends with
+# sendfile.
+_RANGE_CHUNK_SIZE = 1024 * 1024
+
+# Read size and idle poll interval (seconds) when following an output that
+# is still being written.
+_STREAM_CHUNK_SIZE = 256 * 1024
+_STREAM_POLL_INTERVAL = 0.5
+
+TUS_VERSION = "1.0.0"
+# Sent with every resumable upload response. The browser client talks to
+# the backend cross-origin, so it may only read headers exposed to it.
+_TUS_HEADERS = {
+    "tus-resumable": TUS_VERSION,
+    "access-control-expose-headers": (
+        "Location, Upload-Offset, Upload-Length, Tus-Resumable"
+    ),
+}
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """Prometheus scrape target."""
+    body = await asyncio.to_thread(metrics.render, rx.get_upload_dir())
+    return Response(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in tags
+
+
+async def _output_response(request: Request, filename: str) -> Response:
+    output = await asyncio.to_thread(blob_store.get_output, filename)
+    if output is None:
+        return PlainTextResponse("Not found", status_code=404)
+    # pathsend needs an absolute path.
+    path = (rx.get_upload_dir() / output["converted_filename"]).resolve()
+    try:
+        stat_result = await asyncio.to_thread(os.stat, path)
+    except FileNotFoundError:
+        return PlainTextResponse("Not found", status_code=404)
+    if request.method == "GET":
+        # Eviction under the lru policy goes by when outputs were last read.
+        await asyncio.to_thread(blob_store.touch_output, output["converted_filename"])
+    etag = f'"{output["output_key"]}"'
+    headers = {"etag": etag, "cache-control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response = FileResponse(
+        path,
+        headers=headers,
+        media_type="video/mp4",
+        filename=output["converted_filename"],
+        stat_result=stat_result,
+    )
+    response.chunk_size = _RANGE_CHUNK_SIZE
+    return response
+
+
+async def download_endpoint(request: Request) -> Response:
+    """Serve a converted output with Range, If-Range and ETag support.
+
+    Only files registered as conversion outputs are served. Outputs are
+    content addressed, so their output key is a strong ETag that survives
+    the file being rewritten with identical content.
+    """
+    return await _output_response(request, request.path_params["filename"])
+
+
+# Raised when a followed encode fails or restarts. The response must then
+# end with an error rather than cleanly, or the client would keep the
+# truncated file as if it were complete.
+class _StreamAborted(Exception):
+    pass
+
+
+def _rendition_filename(job: dict, index: int) -> Optional[str]:
+    """The converted file of a Complete job's index-th rendition."""
+    outputs = job_store.job_outputs([job["id"]]).get(job["id"])
+    if outputs:
+        return outputs[index]["converted_filename"] if index < len(outputs) else None
+    return job["converted_filename"] if index == 0 else None
+
+
+async def _follow_output(upload_dir: Path, job_id: str, index: int):
+    """Yield a job's index-th output while it is written, until it finishes."""
+    file = None
+    started_at = None
+    try:
+        while file is None:
+            job = await asyncio.to_thread(job_store.get_job, job_id)
+            if job is None or job["status"] == job_store.ERROR:
+                raise _StreamAborted(job_id)
+            if job["status"] == job_store.COMPLETE:
+                # Finished (or reused an earlier output) before we got to it.
+                filename = await asyncio.to_thread(_rendition_filename, job, index)
+                if filename is None:
+                    raise _StreamAborted(job_id)
+                path = upload_dir / filename
+            elif job["status"] == job_store.PROCESSING:
+                path = partial_output_path(upload_dir, job_id, index)
+                started_at = job["started_at"]
+            else:
+                await asyncio.sleep(_STREAM_POLL_INTERVAL)
+                continue
+            try:
+                file = await asyncio.to_thread(open, path, "rb")
+            except FileNotFoundError:
+                await asyncio.sleep(_STREAM_POLL_INTERVAL)
+        while True:
+            chunk = await asyncio.to_thread(file.read, _STREAM_CHUNK_SIZE)
+            if chunk:
+                yield chunk
+                continue
+            if started_at is None:
+                return
+            job = await asyncio.to_thread(job_store.get_job, job_id)
+            if job is None or job["started_at"] != started_at:
+                raise _StreamAborted(job_id)
+            if job["status"] == job_store.COMPLETE:
+                # The partial file was renamed into place; the open handle
+                # still reads it to the end.
+                started_at = None
+            elif job["status"] != job_store.PROCESSING:
+                raise _StreamAborted(job_id)
+            else:
+                await asyncio.sleep(_STREAM_POLL_INTERVAL)
+    finally:
+        if file is not None:
+            file.close()
+
+
+async def stream_endpoint(request: Request) -> Response:
+    """Serve a job's fragmented MP4 output while it is being encoded.
+
+    The rendition query parameter picks the output of a job with several
+    resolutions, by position; it defaults to the first. The response
+    starts with whatever has been written and stays open until the encode
+    finishes. Jobs that are already complete are served like a download.
+    """
+    job_id = request.path_params["job_id"]
+    try:
+        index = int(request.query_params.get("rendition", "0"))
+    except ValueError:
+        return PlainTextResponse("Invalid rendition", status_code=400)
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    if job is None or job["status"] == job_store.ERROR:
+        return PlainTextResponse("Not found", status_code=404)
+    resolutions = job_resolutions(job)
+    if not 0 <= index < len(resolutions):
+        return PlainTextResponse("Not found", status_code=404)
+    if job["status"] == job_store.COMPLETE:
+        filename = await asyncio.to_thread(_rendition_filename, job, index)
+        if filename is None:
+            return PlainTextResponse("Not found", status_code=404)
+        return await _output_response(request, filename)
+    if not settings.FRAGMENTED_MP4:
+        return PlainTextResponse(
+            "Progressive downloads are disabled", status_code=409
+        )
+    label = f"_{resolutions[index]}" if len(resolutions) > 1 else ""
+    filename = f"converted_{Path(job['filename']).stem}{label}.mp4"
+    return StreamingResponse(
+        _follow_output(rx.get_upload_dir(), job_id, index),
+        media_type="video/mp4",
+        headers={
+            "content-disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+            "cache-control": "no-store",
+        },
+    )
+
+
+async def preview_endpoint(request: Request) -> Response:
+    """Thumbnail or sprite sheet of a job's source, made on first request."""
+    kind = request.path_params["kind"]
+    job = await asyncio.to_thread(job_store.get_job, request.path_params["job_id"])
+    if job is None or kind not in previews.KINDS:
+        return PlainTextResponse("Not found", status_code=404)
+    source = rx.get_upload_dir() / job["filename"]
+    if not source.exists():
+        return PlainTextResponse("Not found", status_code=404)
+    path = await previews.get_preview(source, kind)
+    if path is None:
+        return PlainTextResponse("No preview available", status_code=404)
+    return FileResponse(
+        path,
+        media_type="image/jpeg",
+        headers={"cache-control": "private, max-age=86400"},
+    )
+
+
+def _tus_error(message: str, status_code: int) -> Response:
+    return PlainTextResponse(message, status_code=status_code, headers=_TUS_HEADERS)
+
+
+def _upload_metadata(header: str) -> dict[str, str]:
+    """Decode an Upload-Metadata header of "key base64value" pairs."""
+    metadata = {}
+    for pair in header.split(","):
+        key, _, value = pair.strip().partition(" ")
+        if not key:
+            continue
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            raise ValueError(f"Invalid metadata value for {key}")
+    return metadata
+
+
+async def create_upload_endpoint(request: Request) -> Response:
+    """Create a resumable upload (tus creation extension)."""
+    if request.method == "OPTIONS":
+        headers = {
+            **_TUS_HEADERS,
+            "tus-version": TUS_VERSION,
+            "tus-extension": "creation,termination",
+        }
+        return Response(status_code=204, headers=headers)
+    try:
+        length = int(request.headers["upload-length"])
+        metadata = _upload_metadata(request.headers.get("upload-metadata", ""))
+    except (KeyError, ValueError):
+        return _tus_error("Missing or invalid Upload-Length", 400)
+    if length < 0:
+        return _tus_error("Missing or invalid Upload-Length", 400)
+    filename = Path(metadata.get("filename") or "upload").name
+    upload_dir = rx.get_upload_dir()
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        await asyncio.to_thread(capacity.upload_allowance, upload_dir, length)
+    except capacity.QuotaExceeded as e:
+        return _tus_error(str(e), 413)
+    upload_id = await asyncio.to_thread(
+        resumable.create_upload, upload_dir, filename, length
+    )
+    headers = {
+        **_TUS_HEADERS,
+        "location": f"{request.url.path.rstrip('/')}/{upload_id}",
+        "upload-offset": "0",
+    }
+    return Response(status_code=201, headers=headers)
+
+
+async def upload_endpoint(request: Request) -> Response:
+    """Report, append to or terminate a resumable upload (tus core).
+
+    PATCH bodies are written at their Upload-Offset. Bytes received before
+    a dropped connection are kept, and HEAD reports how far the upload got.
+    """
+    upload_id = request.path_params["upload_id"]
+    upload_dir = rx.get_upload_dir()
+    if request.method == "DELETE":
+        if not await asyncio.to_thread(resumable.delete_upload, upload_dir, upload_id):
+            return _tus_error("Not found", 404)
+        return Response(status_code=204, headers=_TUS_HEADERS)
+    if request.method == "HEAD":
+        upload = await asyncio.to_thread(resumable.get_upload, upload_id)
+        if upload is None:
+            return Response(status_code=404, headers=_TUS_HEADERS)
+        headers = {
+            **_TUS_HEADERS,
+            "upload-offset": str(upload["committed"]),
+            "upload-length": str(upload["length"]),
+            "cache-control": "no-store",
+        }
+        return Response(status_code=200, headers=headers)
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        return _tus_error("Expected application/offset+octet-stream", 415)
+    try:
+        offset = int(request.headers["upload-offset"])
+    except (KeyError, ValueError):
+        return _tus_error("Missing or invalid Upload-Offset", 400)
+    try:
+        committed = await resumable.write_chunk(
+            upload_dir, upload_id, offset, request.stream()
+        )
+    except ClientDisconnect:
+        # What arrived is committed; the client resumes from a HEAD request.
+        return Response(status_code=400, headers=_TUS_HEADERS)
+    except resumable.UploadNotFound:
+        return _tus_error("Not found", 404)
+    except resumable.OffsetMismatch as e:
+        return _tus_error(str(e), 409)
+    except InvalidContainer as e:
+        # The upload has been dropped, so the client does not retry.
+        return _tus_error(str(e), 415)
+    except ValueError as e:
+        return _tus_error(str(e), 400)
+    return Response(
+        status_code=204, headers={**_TUS_HEADERS, "upload-offset": str(committed)}
+    )
+
+
+api = Starlette(
+    routes=[
+        Route("/metrics", metrics_endpoint),
+        Route("/download/{filename}", download_endpoint),
+        Route("/stream/{job_id}", stream_endpoint),
+        Route("/preview/{job_id}/{kind}", preview_endpoint),
+        Route("/uploads", create_upload_endpoint, methods=["POST", "OPTIONS"]),
+        Route(
+            "/uploads/{upload_id}",
+            upload_endpoint,
+            methods=["HEAD", "PATCH", "DELETE"],
+        ),
+    ]
+)
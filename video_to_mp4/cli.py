@@ -0,0 +1,433 @@
+"""Headless batch conversion.
+
+Converts files on disk through the same pipeline as the web app, without
+the job queue or the web server:
+
+    python -m video_to_mp4.cli /data/incoming/*.avi --resolution 1080p 720p
+    python -m video_to_mp4.cli /data/incoming -o /data/mp4 -j 4 --summary run.json
+
+Inputs may be files, glob patterns or directories (their video files).
+Outputs are named like the app's, converted_<name>[_<resolution>].mp4,
+next to each input or in --output-dir. Inputs whose outputs are all newer
+than the input are skipped unless --force is given. The exit status is 1
+if any file failed.
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Optional
+
+from video_to_mp4 import settings
+from video_to_mp4.services.converter import (
+    MAX_BITRATE,
+    QUALITY_OPTIONS,
+    RESOLUTION_OPTIONS,
+    TARGET_SIZE,
+    convert_file,
+)
+from video_to_mp4.services.transcode import ConversionCancelled, get_media_duration
+
+# Mirrors AppState.allowed_extensions.
+EXTENSIONS = {".avi", ".mov", ".mkv", ".wmv", ".mp4", ".webm"}
+
+# Seconds between refreshes of the progress line.
+_PROGRESS_INTERVAL = 0.5
+
+
+def _is_candidate(path: Path) -> bool:
+    # Outputs written next to their inputs must not become inputs of the
+    # next run.
+    return (
+        path.is_file()
+        and path.suffix.lower() in EXTENSIONS
+        and not path.name.startswith(("converted_", "."))
+    )
+
+
+def expand_inputs(patterns: list[str], recursive: bool) -> list[Path]:
+    """Files named by paths, globs and directories, without duplicates.
+
+    Glob matches and directory entries that are not video files, or are
+    converted outputs or hidden temporary files, are passed over; a path
+    named explicitly must exist and be a video file.
+    """
+    files: dict[Path, None] = {}
+    for pattern in patterns:
+        if not glob.has_magic(pattern):
+            path = Path(pattern)
+            if path.is_dir():
+                matches = [path]
+            elif not path.is_file():
+                raise FileNotFoundError(f"No such file or directory: {pattern}")
+            elif path.suffix.lower() not in EXTENSIONS:
+                raise ValueError(f"Not a supported video file: {pattern}")
+            else:
+                files[path.resolve()] = None
+                continue
+        else:
+            matches = [
+                Path(match) for match in sorted(glob.glob(pattern, recursive=True))
+            ]
+        for path in matches:
+            if path.is_dir():
+                entries = path.rglob("*") if recursive else path.iterdir()
+                for entry in sorted(entries):
+                    if _is_candidate(entry):
+                        files[entry.resolve()] = None
+            elif _is_candidate(path):
+                files[path.resolve()] = None
+    return list(files)
+
+
+def output_paths(
+    input_path: Path, resolutions: list[str], output_dir: Optional[Path]
+) -> list[tuple[str, Path]]:
+    directory = output_dir or input_path.parent
+    outputs = []
+    for resolution_mode in resolutions:
+        label = f"_{resolution_mode}" if len(resolutions) > 1 else ""
+        name = f"converted_{input_path.stem}{label}.mp4"
+        outputs.append((resolution_mode, directory / name))
+    return outputs
+
+
+def is_up_to_date(input_path: Path, outputs: list[tuple[str, Path]]) -> bool:
+    input_mtime = input_path.stat().st_mtime
+    for _, output_path in outputs:
+        try:
+            stat_result = output_path.stat()
+        except FileNotFoundError:
+            return False
+        if stat_result.st_size == 0 or stat_result.st_mtime < input_mtime:
+            return False
+    return True
+
+
+class BatchProgress:
+    """Aggregate progress of a batch, weighted by input size."""
+
+    def __init__(self, sizes: dict[Path, int], stream):
+        self._sizes = sizes
+        self._total = sum(sizes.values()) or 1
+        self._percent: dict[Path, float] = {}
+        self._counts = {"converted": 0, "skipped": 0, "failed": 0}
+        self._running = 0
+        self._stream = stream
+        self._live = stream.isatty()
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def start(self, path: Path):
+        with self._lock:
+            self._running += 1
+            self._percent[path] = 0.0
+
+    def update(self, path: Path, percent: float):
+        with self._lock:
+            self._percent[path] = min(100.0, max(0.0, percent))
+
+    def finish(self, path: Path, status: str, detail: str, running: bool):
+        with self._lock:
+            if running:
+                self._running -= 1
+            self._percent[path] = 100.0
+            self._counts[status] += 1
+            if not self._live or status == "failed":
+                self._clear()
+                print(f"{status:>9} {path} {detail}".rstrip(), file=self._stream)
+
+    def _fraction(self) -> float:
+        done = sum(self._sizes[path] * pct / 100 for path, pct in self._percent.items())
+        return done / self._total
+
+    def _clear(self):
+        if self._live:
+            print("\r\033[K", end="", file=self._stream)
+
+    def render(self):
+        if not self._live:
+            return
+        with self._lock:
+            fraction = self._fraction()
+            finished = sum(self._counts.values())
+            elapsed = time.monotonic() - self._started
+            eta = ""
+            if 0 < fraction < 1:
+                eta = f" | ETA {_format_seconds(elapsed / fraction - elapsed)}"
+            line = (
+                f"[{finished}/{len(self._sizes)}] {fraction:6.1%}"
+                f" | {self._running} running | {self._counts['skipped']} skipped"
+                f" | {self._counts['failed']} failed{eta}"
+            )
+            print(f"\r\033[K{line}", end="", file=self._stream, flush=True)
+
+    def close(self):
+        self.render()
+        if self._live:
+            print(file=self._stream)
+
+
+def _format_seconds(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+def convert_one(
+    input_path: Path,
+    outputs: list[tuple[str, Path]],
+    args: argparse.Namespace,
+    threads: int,
+    progress: BatchProgress,
+    cancel: threading.Event,
+) -> dict:
+    """Convert one input; returns its entry in the summary."""
+    entry = {
+        "input": str(input_path),
+        "status": "converted",
+        "outputs": [],
+        "duration": None,
+        "wall_seconds": 0.0,
+        "error": None,
+    }
+    if cancel.is_set():
+        entry["status"] = "cancelled"
+        return entry
+    if not args.force and is_up_to_date(input_path, outputs):
+        entry["status"] = "skipped"
+        entry["outputs"] = [
+            {"resolution": resolution_mode, "path": str(path), "size": path.stat().st_size}
+            for resolution_mode, path in outputs
+        ]
+        progress.finish(input_path, "skipped", "", running=False)
+        return entry
+    progress.start(input_path)
+    started = time.perf_counter()
+    try:
+        entry["duration"] = get_media_duration(input_path)
+        for _, output_path in outputs:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+        remuxed = convert_file(
+            input_path,
+            outputs,
+            args.quality,
+            threads,
+            target_size=(
+                args.target_size_mb * 1024 * 1024 if args.quality == TARGET_SIZE else None
+            ),
+            max_bitrate=args.max_bitrate_kbps if args.quality == MAX_BITRATE else None,
+            progress_callback=lambda pct: progress.update(input_path, pct),
+            cancel=cancel,
+        )
+        entry["outputs"] = [
+            {
+                "resolution": resolution_mode,
+                "path": str(path),
+                "size": path.stat().st_size,
+                "remuxed": was_remuxed,
+            }
+            for (resolution_mode, path), was_remuxed in zip(outputs, remuxed)
+        ]
+    except ConversionCancelled:
+        entry["status"] = "cancelled"
+    except Exception as e:
+        entry["status"] = "failed"
+        stderr = getattr(e, "stderr", None)
+        entry["error"] = (
+            stderr.decode(errors="ignore").strip().splitlines()[-1]
+            if stderr
+            else str(e)
+        )
+    entry["wall_seconds"] = round(time.perf_counter() - started, 3)
+    if entry["status"] != "cancelled":
+        detail = entry["error"] or f"({entry['wall_seconds']:.1f}s)"
+        progress.finish(input_path, entry["status"], detail, running=True)
+    return entry
+
+
+def run_batch(args: argparse.Namespace) -> dict:
+    """Convert every input; returns the summary."""
+    resolutions = list(dict.fromkeys(args.resolution))
+    inputs = expand_inputs(args.inputs, args.recursive)
+    planned: dict[Path, list[tuple[str, Path]]] = {}
+    claimed: dict[Path, Path] = {}
+    entries: dict[Path, dict] = {}
+    for input_path in inputs:
+        outputs = output_paths(input_path, resolutions, args.output_dir)
+        clash = next((claimed[p] for _, p in outputs if p in claimed), None)
+        if clash is not None:
+            entries[input_path] = {
+                "input": str(input_path),
+                "status": "failed",
+                "outputs": [],
+                "duration": None,
+                "wall_seconds": 0.0,
+                "error": f"Output name collides with {clash}",
+            }
+            continue
+        claimed.update((path, input_path) for _, path in outputs)
+        planned[input_path] = outputs
+    threads = args.threads_per_job or max(1, settings.CPU_COUNT // args.jobs)
+    sizes = {path: path.stat().st_size for path in planned}
+    progress = BatchProgress(sizes, sys.stderr)
+    cancel = threading.Event()
+    started_at = datetime.datetime.now().isoformat(timespec="seconds")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            pool.submit(
+                convert_one, path, outputs, args, threads, progress, cancel
+            ): path
+            for path, outputs in planned.items()
+        }
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(
+                    pending, timeout=_PROGRESS_INTERVAL, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    entries[futures[future]] = future.result()
+                progress.render()
+        except KeyboardInterrupt:
+            # Running encodes are stopped; files not started are reported
+            # as cancelled.
+            cancel.set()
+            for future in pending:
+                future.cancel()
+            for future in pending:
+                if not future.cancelled():
+                    entries[futures[future]] = future.result()
+            args.interrupted = True
+    progress.close()
+    files = []
+    for path in inputs:
+        entry = entries.get(path)
+        if entry is None:
+            entry = {
+                "input": str(path),
+                "status": "cancelled",
+                "outputs": [],
+                "duration": None,
+                "wall_seconds": 0.0,
+                "error": None,
+            }
+        files.append(entry)
+    totals = {
+        status: sum(1 for entry in files if entry["status"] == status)
+        for status in ("converted", "skipped", "failed", "cancelled")
+    }
+    totals.update(
+        files=len(files),
+        input_bytes=sum(sizes.values()),
+        output_bytes=sum(
+            output["size"]
+            for entry in files
+            if entry["status"] == "converted"
+            for output in entry["outputs"]
+        ),
+        wall_seconds=round(time.perf_counter() - started, 3),
+    )
+    return {
+        "started_at": started_at,
+        "finished_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "settings": {
+            "resolutions": resolutions,
+            "quality": args.quality,
+            "target_size_mb": args.target_size_mb if args.quality == TARGET_SIZE else None,
+            "max_bitrate_kbps": (
+                args.max_bitrate_kbps if args.quality == MAX_BITRATE else None
+            ),
+            "jobs": args.jobs,
+            "threads_per_job": threads,
+        },
+        "totals": totals,
+        "files": files,
+    }
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="files, glob patterns or directories")
+    parser.add_argument(
+        "-o", "--output-dir", type=Path, help="write outputs here instead of next to inputs"
+    )
+    parser.add_argument(
+        "-r", "--recursive", action="store_true", help="descend into subdirectories"
+    )
+    parser.add_argument(
+        "--resolution",
+        nargs="+",
+        choices=RESOLUTION_OPTIONS,
+        default=["Original"],
+        help="one output per resolution (default: Original)",
+    )
+    parser.add_argument("--quality", choices=QUALITY_OPTIONS, default="High")
+    parser.add_argument(
+        "--target-size-mb", type=int, default=100, help="for --quality 'Target Size'"
+    )
+    parser.add_argument(
+        "--max-bitrate-kbps", type=int, default=5000, help="for --quality 'Max Bitrate'"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=settings.MAX_CONCURRENT_ENCODES,
+        help="conversions run at once (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--threads-per-job",
+        type=int,
+        default=settings.THREADS_PER_JOB,
+        help="encoder threads per conversion, 0 to split the cores (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="convert even if outputs are up to date"
+    )
+    parser.add_argument(
+        "--summary", help="write a JSON summary to this file, or - for stdout"
+    )
+    args = parser.parse_args(argv)
+    args.jobs = max(1, args.jobs)
+    args.threads_per_job = max(0, args.threads_per_job)
+    args.interrupted = False
+    return args
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    try:
+        summary = run_batch(args)
+    except (FileNotFoundError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    text = json.dumps(summary, indent=2) + "\n"
+    if args.summary == "-":
+        sys.stdout.write(text)
+    elif args.summary:
+        Path(args.summary).write_text(text)
+    totals = summary["totals"]
+    print(
+        f"{totals['converted']} converted, {totals['skipped']} skipped,"
+        f" {totals['failed']} failed, {totals['cancelled']} cancelled"
+        f" in {_format_seconds(totals['wall_seconds'])}",
+        file=sys.stderr,
+    )
+    if args.interrupted:
+        return 130
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,98 @@
 import reflex as rx
-from video_to_mp4.states.app_state import AppState, FileJob
+from reflex.constants import Dirs
+from reflex.utils.imports import ImportVar
+from reflex.vars import VarData
+from reflex.vars.function import FunctionStringVar
+from video_to_mp4 import settings
+from video_to_mp4.states.app_state import AppState, FileJob, JobOutput
+
+
+def backend_route(route: str) -> rx.Var[str]:
+    """URL of a backend route; they are mounted next to /_upload."""
+    return rx.Var(
+        _js_expr=f"new URL('{route}', getBackendURL(env.UPLOAD)).href",
+        _var_data=VarData(
+            imports={
+                f"$/{Dirs.STATE_PATH}": [ImportVar(tag="getBackendURL")],
+                "$/env.json": [ImportVar(tag="env", is_default=True)],
+            }
+        ),
+    ).to(str)
+
+
+def uri_component(value: rx.Var[str]) -> rx.Var[str]:
+    """value escaped for use as one segment of a URL path."""
+    return FunctionStringVar.create("encodeURIComponent").call(value).to(str)
+
+
+def download_url(filename: rx.Var[str]) -> rx.Var[str]:
+    """URL of a converted output on the backend's download route."""
+    # Output names come from upload names, which may hold # ? or %.
+    return rx.Var.create(f"{backend_route('download')}/{uri_component(filename)}")
+
+
+def stream_url(job_id: rx.Var[str], rendition: rx.Var[int]) -> rx.Var[str]:
+    """URL that follows one of a job's outputs while it is being encoded."""
+    return rx.Var.create(
+        f"{backend_route('stream')}/{uri_component(job_id)}?rendition={rendition}"
+    )
+
+
+def preview_url(job_id: rx.Var[str], kind: str) -> rx.Var[str]:
+    """URL of a job's thumbnail or sprite sheet."""
+    return rx.Var.create(
+        f"{backend_route('preview')}/{uri_component(job_id)}/{kind}"
+    )
+
+
+def job_preview(job: FileJob) -> rx.Component:
+    # The icon shows until the thumbnail has loaded, and stays if there is
+    # none. The sprite sheet is lazy and hidden, so it is only requested
+    # once the row is hovered.
+    return rx.el.div(
+        rx.icon("file-video", class_name="w-8 h-8 text-indigo-200"),
+        rx.el.img(
+            src=preview_url(job["id"], "thumbnail"),
+            alt="",
+            loading="lazy",
+            class_name="absolute inset-0 w-full h-full object-cover rounded",
+        ),
+        rx.el.img(
+            src=preview_url(job["id"], "sprite"),
+            alt="",
+            loading="lazy",
+            class_name="hidden group-hover:block absolute left-full top-0 ml-2 w-80 max-w-none rounded-lg shadow-lg border border-gray-200 bg-white z-30",
+        ),
+        class_name="relative group w-16 h-9 mr-3 shrink-0 flex items-center justify-center",
+    )
+
+
+def stream_link(job: FileJob) -> rx.Component:
+    if not settings.FRAGMENTED_MP4:
+        return rx.fragment()
+    return rx.cond(
+        job["status"] == "Processing",
+        rx.foreach(
+            job["resolutions"],
+            lambda resolution, index: rx.el.a(
+                rx.icon("download", class_name="w-4 h-4 text-indigo-400"),
+                href=stream_url(job["id"], index),
+                class_name="p-2 hover:bg-indigo-50 rounded-lg transition-colors block",
+                title=f"Download {resolution} while converting",
+            ),
+        ),
+    )
+
+
+def download_link(output: JobOutput) -> rx.Component:
+    return rx.el.a(
+        rx.icon("download", class_name="w-4 h-4 text-indigo-600"),
+        rx.el.span(output["resolution"], class_name="text-xs font-medium text-indigo-600"),
+        href=download_url(output["converted_filename"]),
+        download=output["converted_filename"],
+        class_name="p-2 hover:bg-indigo-50 rounded-lg transition-colors border border-transparent hover:border-indigo-100 flex items-center gap-1",
+        title=f"Download {output['resolution']} ({output['converted_size_str']})",
+    )
 
 
 def status_badge(status: str) -> rx.Component:
@@ -40,11 +133,44 @@ def status_badge(status: str) -> rx.Component:
     )
 
 
+def live_stats(job: FileJob) -> rx.Component:
+    """Encode speed, ETA and projected size of a running job."""
+    live = AppState.job_progress[job["id"]]
+    return rx.cond(
+        AppState.job_progress.contains(job["id"]),
+        rx.el.div(
+            rx.cond(
+                live["stalled"],
+                rx.el.span(
+                    "Stalled",
+                    title="No progress reported for a while",
+                    class_name="px-1.5 py-0.5 rounded bg-amber-50 text-amber-700 font-semibold",
+                ),
+                None,
+            ),
+            rx.cond(live["speed_str"], rx.el.span(live["speed_str"]), None),
+            rx.cond(live["eta_str"], rx.el.span("ETA " + live["eta_str"]), None),
+            rx.cond(
+                live["projected_size_str"],
+                rx.el.span(live["projected_size_str"], title="Projected output size"),
+                None,
+            ),
+            class_name="flex items-center gap-2 text-xs text-gray-400 mt-0.5",
+        ),
+        None,
+    )
+
+
 def job_row(job: FileJob) -> rx.Component:
+    progress = rx.cond(
+        AppState.job_progress.contains(job["id"]),
+        AppState.job_progress[job["id"]]["progress"],
+        job["progress"],
+    )
     return rx.el.tr(
         rx.el.td(
             rx.el.div(
-                rx.icon("file-video", class_name="w-8 h-8 text-indigo-200 mr-3"),
+                job_preview(job),
                 rx.el.div(
                     rx.el.p(
                         job["filename"],
@@ -64,6 +190,15 @@ def job_row(job: FileJob) -> rx.Component:
                             f" • {job['resolution']} • {job['quality']}",
                             class_name="text-indigo-500 font-medium ml-1",
                         ),
+                        rx.cond(
+                            job["remuxed"],
+                            rx.el.span(
+                                "Fast remux",
+                                title="Source was already H.264/AAC and was copied into MP4 without re-encoding",
+                                class_name="ml-2 px-1.5 py-0.5 rounded bg-emerald-50 text-emerald-700 font-semibold",
+                            ),
+                            None,
+                        ),
                         class_name="text-xs text-gray-500 flex items-center",
                     ),
                     rx.cond(
@@ -85,14 +220,15 @@ def job_row(job: FileJob) -> rx.Component:
             rx.el.div(
                 rx.el.div(
                     class_name="h-1.5 rounded-full bg-indigo-600 transition-all duration-500",
-                    style={"width": f"{job['progress']}%"},
+                    style={"width": f"{progress}%"},
                 ),
                 class_name="w-full h-1.5 bg-gray-100 rounded-full overflow-hidden",
             ),
             rx.el.span(
-                f"{job['progress']:.2f}%",
+                f"{progress:.2f}%",
                 class_name="text-xs text-gray-500 mt-1 block",
             ),
+            live_stats(job),
             class_name="px-4 py-4",
         ),
         rx.el.td(
@@ -105,13 +241,7 @@ def job_row(job: FileJob) -> rx.Component:
                 (
                     "Complete",
                     rx.el.div(
-                        rx.el.a(
-                            rx.icon("download", class_name="w-4 h-4 text-indigo-600"),
-                            href=rx.get_upload_url(job["converted_filename"]),
-                            download=job["converted_filename"],
-                            class_name="p-2 hover:bg-indigo-50 rounded-lg transition-colors border border-transparent hover:border-indigo-100 block",
-                            title="Download",
-                        ),
+                        rx.foreach(job["outputs"], download_link),
                         rx.el.button(
                             rx.icon("trash-2", class_name="w-4 h-4 text-red-400"),
                             on_click=lambda: AppState.remove_job(job["id"]),
@@ -140,13 +270,14 @@ def job_row(job: FileJob) -> rx.Component:
                     ),
                 ),
                 rx.el.div(
+                    stream_link(job),
                     rx.el.button(
                         rx.icon("trash-2", class_name="w-4 h-4 text-gray-400"),
                         on_click=lambda: AppState.remove_job(job["id"]),
                         class_name="p-2 hover:bg-gray-100 rounded-lg transition-colors",
                         title="Cancel",
                     ),
-                    class_name="flex justify-end",
+                    class_name="flex gap-1 justify-end items-center",
                 ),
             ),
             class_name="px-4 py-4 whitespace-nowrap text-right",
@@ -155,6 +286,37 @@ def job_row(job: FileJob) -> rx.Component:
     )
 
 
+def pagination() -> rx.Component:
+    return rx.el.div(
+        rx.el.span(
+            f"{AppState.job_count} jobs",
+            class_name="text-xs text-gray-500",
+        ),
+        rx.el.div(
+            rx.el.button(
+                rx.icon("chevron-left", class_name="w-4 h-4"),
+                on_click=AppState.prev_job_page,
+                disabled=AppState.job_page == 0,
+                class_name="p-2 rounded-lg text-gray-500 hover:bg-gray-100 disabled:opacity-40",
+                title="Newer jobs",
+            ),
+            rx.el.span(
+                f"Page {AppState.job_page + 1} of {AppState.page_count}",
+                class_name="text-xs font-medium text-gray-600",
+            ),
+            rx.el.button(
+                rx.icon("chevron-right", class_name="w-4 h-4"),
+                on_click=AppState.next_job_page,
+                disabled=AppState.job_page + 1 >= AppState.page_count,
+                class_name="p-2 rounded-lg text-gray-500 hover:bg-gray-100 disabled:opacity-40",
+                title="Older jobs",
+            ),
+            class_name="flex items-center gap-2",
+        ),
+        class_name="flex justify-between items-center mt-4 pt-4 border-t border-gray-50",
+    )
+
+
 def job_list() -> rx.Component:
     return rx.el.div(
         rx.el.div(
@@ -191,10 +353,15 @@ def job_list() -> rx.Component:
                         ),
                     )
                 ),
-                rx.el.tbody(rx.foreach(AppState.recent_jobs, job_row)),
+                rx.el.tbody(rx.foreach(AppState.page_jobs, job_row)),
                 class_name="w-full",
             ),
             class_name="overflow-x-auto",
         ),
+        rx.cond(
+            AppState.page_count > 1,
+            pagination(),
+            None,
+        ),
         class_name="bg-white p-6 sm:p-8 rounded-2xl shadow-sm border border-gray-100",
     )
\ No newline at end of file
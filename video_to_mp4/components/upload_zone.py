@@ -1,7 +1,64 @@
 import reflex as rx
+from video_to_mp4.components.job_list import backend_route
 from video_to_mp4.states.app_state import AppState
 
 
+def limit_input(label: str, value, on_change) -> rx.Component:
+    return rx.el.label(
+        rx.el.span(label, class_name="text-xs text-gray-500"),
+        rx.el.input(
+            type="number",
+            min=1,
+            default_value=value.to_string(),
+            on_blur=on_change,
+            class_name="w-28 px-2 py-1 rounded-lg border border-gray-200 text-sm text-gray-900",
+        ),
+        class_name="flex items-center justify-between gap-3 mt-3",
+    )
+
+
+def resumable_upload() -> rx.Component:
+    """File picker sent through the resumable upload routes.
+
+    The browser client in assets/resumable_upload.js does the uploading
+    and hands the finished uploads to the confirm dialog.
+    """
+    script = rx.Var.create(
+        "window.videoToMp4.resumableUpload('resumable_input',"
+        f" '{backend_route('uploads')}', 'resumable_progress')"
+    )
+    return rx.el.div(
+        rx.el.p(
+            "Very large file? Upload it resumably: after a dropped connection or a reload, pick the same file again to continue where it stopped.",
+            class_name="text-xs text-gray-500 mb-2",
+        ),
+        rx.el.div(
+            rx.el.input(
+                type="file",
+                id="resumable_input",
+                multiple=True,
+                accept=".avi,.mov,.mkv,.wmv,.mp4,.webm",
+                class_name="text-xs text-gray-600 min-w-0 flex-1",
+            ),
+            rx.el.button(
+                "Upload resumably",
+                on_click=[
+                    AppState.start_resumable_upload,
+                    rx.call_script(
+                        script, callback=AppState.stage_resumable_uploads
+                    ),
+                ],
+                disabled=AppState.is_uploading,
+                type="button",
+                class_name="px-3 py-1.5 rounded-lg text-xs font-medium bg-gray-100 text-gray-700 hover:bg-gray-200 disabled:opacity-50",
+            ),
+            rx.el.span(id="resumable_progress", class_name="text-xs text-gray-500"),
+            class_name="flex items-center gap-3",
+        ),
+        class_name="mt-4",
+    )
+
+
 def settings_panel() -> rx.Component:
     return rx.el.div(
         rx.cond(
@@ -29,7 +86,7 @@ def settings_panel() -> rx.Component:
                     rx.cond(
                         AppState.show_resolution_help,
                         rx.el.div(
-                            "Resolution controls output dimensions. 'Original' keeps the source size; 4K/1080p/720p/480p scale the video.",
+                            "Resolution controls output dimensions. 'Original' keeps the source size; 4K/1080p/720p/480p scale the video. Select several to get one file per resolution from a single conversion.",
                             class_name="absolute right-0 mt-2 w-64 text-xs text-gray-700 bg-white border border-gray-200 rounded-lg shadow-lg p-3 z-20",
                         ),
                         rx.el.span(),
@@ -43,9 +100,9 @@ def settings_panel() -> rx.Component:
                     AppState.resolution_options,
                     lambda res: rx.el.button(
                         res,
-                        on_click=lambda: AppState.set_resolution(res),
+                        on_click=lambda: AppState.toggle_resolution(res),
                         class_name=rx.cond(
-                            AppState.selected_resolution == res,
+                            AppState.selected_resolutions.contains(res),
                             "px-3 py-1.5 rounded-lg text-xs font-medium bg-indigo-600 text-white transition-all shadow-sm",
                             "px-3 py-1.5 rounded-lg text-xs font-medium bg-gray-100 text-gray-600 hover:bg-gray-200 transition-all",
                         ),
@@ -72,7 +129,7 @@ def settings_panel() -> rx.Component:
                     rx.cond(
                         AppState.show_quality_help,
                         rx.el.div(
-                            "Quality presets control compression: Standard (faster, smaller), High (balanced), Maximum (best quality, slowest).",
+                            "Quality presets control compression: Standard (faster, smaller), High (balanced), Maximum (best quality, slowest). Target Size aims for a file size using two-pass encoding; Max Bitrate keeps quality-based encoding but caps the bitrate.",
                             class_name="absolute right-0 mt-2 w-64 text-xs text-gray-700 bg-white border border-gray-200 rounded-lg shadow-lg p-3 z-20",
                         ),
                         rx.el.span(),
@@ -96,6 +153,26 @@ def settings_panel() -> rx.Component:
                 ),
                 class_name="flex flex-wrap gap-2",
             ),
+            rx.match(
+                AppState.selected_quality,
+                (
+                    "Target Size",
+                    limit_input(
+                        "Target size (MB)",
+                        AppState.target_size_mb,
+                        AppState.set_target_size_mb,
+                    ),
+                ),
+                (
+                    "Max Bitrate",
+                    limit_input(
+                        "Max bitrate (kbps)",
+                        AppState.max_bitrate_kbps,
+                        AppState.set_max_bitrate_kbps,
+                    ),
+                ),
+                None,
+            ),
         ),
         class_name="bg-gray-50/50 rounded-xl p-4 border border-gray-100",
     )
@@ -137,7 +214,7 @@ def upload_zone() -> rx.Component:
                                     class_name="text-xs uppercase tracking-wider text-gray-500",
                                 ),
                                 rx.el.span(
-                                    AppState.selected_resolution,
+                                    AppState.resolution_label,
                                     class_name="text-sm font-medium text-gray-900",
                                 ),
                                 class_name="flex justify-between",
@@ -148,7 +225,7 @@ def upload_zone() -> rx.Component:
                                     class_name="text-xs uppercase tracking-wider text-gray-500",
                                 ),
                                 rx.el.span(
-                                    AppState.selected_quality,
+                                    AppState.quality_label,
                                     class_name="text-sm font-medium text-gray-900",
                                 ),
                                 class_name="flex justify-between mt-2",
@@ -247,6 +324,7 @@ def upload_zone() -> rx.Component:
                         multiple=True,
                         class_name="w-full",
                     ),
+                    resumable_upload(),
                     class_name="bg-white rounded-2xl border border-gray-100 p-5",
                 ),
                 rx.el.div(
@@ -0,0 +1,356 @@
+"""Content-addressed storage for uploaded sources and conversion outputs.
+
+Identical uploads share one file in the upload directory and identical
+conversions (same input hash and encode settings) share one output. Both are
+reference counted; the file is deleted when the last job releases it. The
+bytes held are kept as a running total, updated together with the rows.
+"""
+
+import asyncio
+import hashlib
+import json
+import secrets
+import time
+from pathlib import Path
+from typing import Optional
+
+from video_to_mp4.services import containers, db, metrics
+from video_to_mp4.services.uploads import UPLOAD_CHUNK_SIZE, write_upload
+
+db.register_schema(
+    """
+    CREATE TABLE IF NOT EXISTS blobs (
+        content_hash TEXT PRIMARY KEY,
+        stored_name TEXT NOT NULL UNIQUE,
+        size INTEGER NOT NULL,
+        refcount INTEGER NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS outputs (
+        output_key TEXT PRIMARY KEY,
+        content_hash TEXT NOT NULL,
+        converted_filename TEXT NOT NULL UNIQUE,
+        size INTEGER NOT NULL,
+        remuxed INTEGER NOT NULL,
+        refcount INTEGER NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS storage_usage (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        used_bytes INTEGER NOT NULL
+    );
+    -- Blob references held by uploads waiting in the confirm dialog.
+    CREATE TABLE IF NOT EXISTS staged_uploads (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        stored_name TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    """
+)
+# Last time an output was downloaded, for least recently used eviction.
+db.register_column("outputs", "last_access_at", "REAL")
+
+_TOTAL_SQL = (
+    "(SELECT COALESCE(SUM(size), 0) FROM blobs)"
+    " + (SELECT COALESCE(SUM(size), 0) FROM outputs)"
+)
+
+
+def _adjust_usage(conn, delta: int):
+    """Add delta to the running total, in the transaction that caused it.
+
+    The first call creates the total from the tables, which by then
+    already include the change.
+    """
+    conn.execute(
+        f"INSERT INTO storage_usage (id, used_bytes) VALUES (1, {_TOTAL_SQL})"
+        " ON CONFLICT (id) DO UPDATE SET used_bytes = used_bytes + ?",
+        (delta,),
+    )
+
+
+def used_bytes() -> int:
+    """Bytes of sources and outputs in the upload directory."""
+    with db.connect() as conn:
+        row = conn.execute("SELECT used_bytes FROM storage_usage").fetchone()
+        if row is not None:
+            return row["used_bytes"]
+        _adjust_usage(conn, 0)
+        return conn.execute("SELECT used_bytes FROM storage_usage").fetchone()[0]
+
+
+async def ingest_upload(
+    source, upload_dir: Path, filename: str, max_bytes: Optional[int] = None
+) -> tuple[str, int, str]:
+    """Stream source into the blob store, hashing it as it is written.
+
+    Returns (stored_name, size, content_hash). The caller owns one reference
+    to the blob and must hand it to a job or release it. Uploads larger
+    than max_bytes are rejected with UploadTooLarge, and files that are not
+    a supported container (judged from their first bytes) or are truncated
+    with InvalidContainer.
+    """
+    ext = Path(filename).suffix.lower()
+    temp_path = upload_dir / f".upload_{secrets.token_hex(8)}.part"
+    hasher = hashlib.sha256()
+    size = await write_upload(
+        source,
+        temp_path,
+        hasher=hasher,
+        max_bytes=max_bytes,
+        check_head=containers.check_head,
+    )
+    metrics.inc("ingested_bytes_total", size)
+    content_hash = hasher.hexdigest()
+    try:
+        await asyncio.to_thread(containers.check_complete, temp_path)
+        stored_name = _adopt_blob(
+            temp_path, upload_dir, Path(filename).stem, ext, size, content_hash
+        )
+    finally:
+        temp_path.unlink(missing_ok=True)
+    return stored_name, size, content_hash
+
+
+def adopt_file(path: Path, upload_dir: Path, filename: str) -> tuple[str, int, str]:
+    """Move a file already written in upload_dir into the blob store.
+
+    Like ingest_upload, but for files that arrived some other way, such as
+    resumable uploads. The file is hashed in place and renamed, not copied.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+            size += len(chunk)
+    metrics.inc("ingested_bytes_total", size)
+    content_hash = hasher.hexdigest()
+    try:
+        stored_name = _adopt_blob(
+            path,
+            upload_dir,
+            Path(filename).stem,
+            Path(filename).suffix.lower(),
+            size,
+            content_hash,
+        )
+    finally:
+        path.unlink(missing_ok=True)
+    return stored_name, size, content_hash
+
+
+def _adopt_blob(
+    temp_path: Path, upload_dir: Path, stem: str, ext: str, size: int, content_hash: str
+) -> str:
+    with db.connect() as conn:
+        row = conn.execute(
+            "SELECT stored_name, size FROM blobs WHERE content_hash = ?",
+            (content_hash,),
+        ).fetchone()
+        if row and (upload_dir / row["stored_name"]).exists():
+            conn.execute(
+                "UPDATE blobs SET refcount = refcount + 1 WHERE content_hash = ?",
+                (content_hash,),
+            )
+            return row["stored_name"]
+        stored_name = f"{stem}_{content_hash[:12]}{ext}"
+        temp_path.rename(upload_dir / stored_name)
+        conn.execute(
+            "INSERT OR REPLACE INTO blobs"
+            " (content_hash, stored_name, size, refcount, created_at)"
+            " VALUES (?, ?, ?, 1, ?)",
+            (content_hash, stored_name, size, time.time()),
+        )
+        # A row whose file had disappeared is replaced, not added to.
+        _adjust_usage(conn, size - (row["size"] if row else 0))
+        return stored_name
+
+
+def release_blob(upload_dir: Path, stored_name: str):
+    """Drop one reference to a stored upload, deleting it at zero."""
+    with db.connect() as conn:
+        row = conn.execute(
+            "SELECT refcount, size FROM blobs WHERE stored_name = ?", (stored_name,)
+        ).fetchone()
+        if row and row["refcount"] > 1:
+            conn.execute(
+                "UPDATE blobs SET refcount = refcount - 1 WHERE stored_name = ?",
+                (stored_name,),
+            )
+            return
+        conn.execute("DELETE FROM blobs WHERE stored_name = ?", (stored_name,))
+        if row:
+            _adjust_usage(conn, -row["size"])
+    (upload_dir / stored_name).unlink(missing_ok=True)
+
+
+def stage_blob(stored_name: str) -> int:
+    """Record that an upload's blob reference waits for confirmation.
+
+    Returns the stage id to pass to unstage_blob once the upload is
+    confirmed or dropped.
+    """
+    with db.connect() as conn:
+        cursor = conn.execute(
+            "INSERT INTO staged_uploads (stored_name, created_at) VALUES (?, ?)",
+            (stored_name, time.time()),
+        )
+    return cursor.lastrowid
+
+
+def unstage_blob(stage_id: int) -> bool:
+    """Take back a staged blob reference.
+
+    False means the retention sweeper already released it, so the blob may
+    be gone.
+    """
+    with db.connect() as conn:
+        cursor = conn.execute("DELETE FROM staged_uploads WHERE id = ?", (stage_id,))
+    return cursor.rowcount > 0
+
+
+def expired_stages(before: float, limit: int) -> list[dict]:
+    """Staged uploads waiting since before, oldest first."""
+    with db.connect() as conn:
+        rows = conn.execute(
+            "SELECT id, stored_name FROM staged_uploads WHERE created_at < ?"
+            " ORDER BY created_at LIMIT ?",
+            (before, limit),
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def output_key(content_hash: str, resolution: str, quality: str, encoder: dict) -> str:
+    """Key identifying a conversion result for an input and its settings."""
+    payload = json.dumps(
+        [content_hash, resolution, quality, encoder], sort_keys=True
+    ).encode()
+    return hashlib.sha256(payload).hexdigest()
+
+
+def acquire_output(upload_dir: Path, key: str) -> Optional[dict]:
+    """Take a reference to an existing output for key, if there is one.
+
+    Returns the outputs row as a dict, or None when the key has not been
+    converted before (or its file has since disappeared).
+    """
+    with db.connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM outputs WHERE output_key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if not (upload_dir / row["converted_filename"]).exists():
+            conn.execute("DELETE FROM outputs WHERE output_key = ?", (key,))
+            _adjust_usage(conn, -row["size"])
+            return None
+        conn.execute(
+            "UPDATE outputs SET refcount = refcount + 1 WHERE output_key = ?", (key,)
+        )
+        return dict(row)
+
+
+def register_output(
+    key: str, content_hash: str, converted_filename: str, size: int, remuxed: bool
+):
+    """Record a freshly converted output, owned by one job.
+
+    If another worker registered the same key concurrently, the job just
+    takes a reference to it.
+    """
+    with db.connect() as conn:
+        row = conn.execute(
+            "SELECT size FROM outputs WHERE output_key = ?", (key,)
+        ).fetchone()
+        conn.execute(
+            "INSERT INTO outputs"
+            " (output_key, content_hash, converted_filename, size, remuxed,"
+            " refcount, created_at)"
+            " VALUES (?, ?, ?, ?, ?, 1, ?)"
+            " ON CONFLICT (output_key) DO UPDATE SET refcount = refcount + 1,"
+            " size = excluded.size",
+            (key, content_hash, converted_filename, size, int(remuxed), time.time()),
+        )
+        # Both registrations wrote the same file, so only one copy is held.
+        _adjust_usage(conn, size - (row["size"] if row else 0))
+
+
+def get_output(converted_filename: str) -> Optional[dict]:
+    """The outputs row of a converted file, or None if it is not one."""
+    with db.connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM outputs WHERE converted_filename = ?",
+            (converted_filename,),
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def release_output(upload_dir: Path, converted_filename: str):
+    """Drop one reference to an output, deleting it at zero."""
+    with db.connect() as conn:
+        row = conn.execute(
+            "SELECT refcount, size FROM outputs WHERE converted_filename = ?",
+            (converted_filename,),
+        ).fetchone()
+        if row and row["refcount"] > 1:
+            conn.execute(
+                "UPDATE outputs SET refcount = refcount - 1"
+                " WHERE converted_filename = ?",
+                (converted_filename,),
+            )
+            return
+        conn.execute(
+            "DELETE FROM outputs WHERE converted_filename = ?", (converted_filename,)
+        )
+        if row:
+            _adjust_usage(conn, -row["size"])
+    (upload_dir / converted_filename).unlink(missing_ok=True)
+
+
+def touch_output(converted_filename: str):
+    """Record that an output was downloaded."""
+    with db.connect() as conn:
+        conn.execute(
+            "UPDATE outputs SET last_access_at = ? WHERE converted_filename = ?",
+            (time.time(), converted_filename),
+        )
+
+
+def eviction_candidates(downloaded_only: bool) -> list[dict]:
+    """Outputs in eviction order, least recently downloaded first.
+
+    Outputs never downloaded count as accessed when they were created,
+    unless downloaded_only leaves them out.
+    """
+    where = " WHERE last_access_at IS NOT NULL" if downloaded_only else ""
+    with db.connect() as conn:
+        rows = conn.execute(
+            "SELECT converted_filename, size, refcount FROM outputs"
+            f"{where} ORDER BY COALESCE(last_access_at, created_at)"
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def evict_output(
+    upload_dir: Path, converted_filename: str, refcount: Optional[int] = None
+) -> Optional[int]:
+    """Delete an output whatever its reference count; returns bytes freed.
+
+    With refcount the output is only deleted if it still has exactly that
+    many references, so one taken since it was picked keeps it. Returns
+    None when nothing was deleted.
+    """
+    with db.connect() as conn:
+        row = conn.execute(
+            "SELECT size, refcount FROM outputs WHERE converted_filename = ?",
+            (converted_filename,),
+        ).fetchone()
+        if row is None or (refcount is not None and row["refcount"] != refcount):
+            return None
+        conn.execute(
+            "DELETE FROM outputs WHERE converted_filename = ?", (converted_filename,)
+        )
+        _adjust_usage(conn, -row["size"])
+    (upload_dir / converted_filename).unlink(missing_ok=True)
+    return row["size"]
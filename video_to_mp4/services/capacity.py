@@ -0,0 +1,154 @@
+"""Storage quota for the upload directory.
+
+Usage is the running total kept by the blob store plus the predicted
+output size of every job that has not finished yet and the full length of
+resumable uploads in progress, so nothing here scans
+the directory. Uploads and new jobs are turned away when they would take
+usage over the quota. Once usage passes the eviction threshold, converted
+outputs are deleted in the order the eviction policy gives until it is
+back under it.
+"""
+
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+from video_to_mp4 import settings
+from video_to_mp4.services import blob_store, job_store, resumable
+from video_to_mp4.services.converter import (
+    MAX_BITRATE,
+    TARGET_SIZE,
+    job_resolutions,
+)
+from video_to_mp4.services.media import can_remux, duration_from_probe, has_audio
+from video_to_mp4.services.media_index import get_probe
+from video_to_mp4.services.transcode import RESOLUTION_HEIGHTS
+
+EVICTED_MESSAGE = "Output deleted to free storage space; retry to convert again."
+
+# Audio bitrate (kbit/s) assumed when predicting Max Bitrate outputs.
+_AUDIO_KBPS = 128
+
+# Eviction is check-then-delete across several tables, so one thread of
+# this process runs it at a time.
+_evict_lock = threading.Lock()
+
+
+class QuotaExceeded(Exception):
+    """Raised when an upload or conversion does not fit in the quota."""
+
+
+def _source_height(probe: Optional[dict]) -> Optional[int]:
+    for stream in (probe or {}).get("streams", []):
+        if stream.get("codec_type") == "video" and stream.get("height"):
+            return int(stream["height"])
+    return None
+
+
+def predict_output_size(
+    source: Path,
+    size: int,
+    resolution: str,
+    quality: str,
+    target_size: Optional[int] = None,
+    max_bitrate: Optional[int] = None,
+) -> int:
+    """Expected bytes of all outputs of a job converting source.
+
+    Size limited modes are predicted from their limit. Otherwise an output
+    is assumed to be no larger than the source, scaled by the change in
+    pixel count; remuxes are the source size.
+    """
+    try:
+        probe = get_probe(source)
+    except OSError:
+        probe = None
+    duration = duration_from_probe(probe)
+    height = _source_height(probe)
+    total = 0
+    for resolution_mode in job_resolutions({"resolution": resolution}):
+        if quality == TARGET_SIZE and target_size:
+            total += target_size
+        elif quality == MAX_BITRATE and max_bitrate and duration:
+            kbps = max_bitrate + (_AUDIO_KBPS if has_audio(probe) else 0)
+            total += int(kbps * 1000 / 8 * duration)
+        elif can_remux(probe, resolution_mode):
+            total += size
+        else:
+            scale = 1.0
+            target_height = RESOLUTION_HEIGHTS.get(resolution_mode)
+            if target_height and height:
+                scale = min(1.0, (target_height / height) ** 2)
+            total += int(size * scale)
+    return total
+
+
+def usage() -> tuple[int, int]:
+    """(bytes stored, bytes reserved by unfinished jobs and uploads)."""
+    reserved = job_store.reserved_bytes() + resumable.reserved_bytes()
+    return blob_store.used_bytes(), reserved
+
+
+def _evict(upload_dir: Path, needed: int) -> int:
+    """Delete outputs per the eviction policy until needed bytes are freed."""
+    if settings.EVICTION_POLICY not in ("lru", "downloaded"):
+        return 0
+    freed = 0
+    evicted = []
+    downloaded_only = settings.EVICTION_POLICY == "downloaded"
+    for candidate in blob_store.eviction_candidates(downloaded_only):
+        if freed >= needed:
+            break
+        name = candidate["converted_filename"]
+        # Outputs reused by jobs that have not completed yet are left alone;
+        # those jobs would complete pointing at a deleted file.
+        if candidate["refcount"] > job_store.complete_references(name):
+            continue
+        size = blob_store.evict_output(upload_dir, name, candidate["refcount"])
+        if size is not None:
+            freed += size
+            evicted.append(name)
+    # The jobs that pointed at evicted outputs let go of everything else
+    # they held as well, so that a retry starts clean.
+    for name in job_store.expire_outputs(evicted, EVICTED_MESSAGE):
+        blob_store.release_output(upload_dir, name)
+    if evicted:
+        logging.warning(
+            f"Evicted {len(evicted)} output(s), {freed} bytes, to free space"
+        )
+    return freed
+
+
+def ensure_space(upload_dir: Path, needed: int) -> bool:
+    """Whether needed more bytes fit in the quota, evicting to make room.
+
+    Outputs are evicted when usage including needed would pass the
+    eviction threshold, down to the threshold where possible.
+    """
+    if not settings.MAX_CAPACITY_BYTES:
+        return True
+    threshold = settings.MAX_CAPACITY_BYTES * settings.EVICTION_THRESHOLD // 100
+    with _evict_lock:
+        used, reserved = usage()
+        excess = used + reserved + needed - threshold
+        if excess > 0:
+            _evict(upload_dir, excess)
+            used, reserved = usage()
+    return used + reserved + needed <= settings.MAX_CAPACITY_BYTES
+
+
+def upload_allowance(
+    upload_dir: Path, size_hint: Optional[int] = None
+) -> Optional[int]:
+    """Bytes an upload may write, or None without a quota.
+
+    size_hint, when the upload's size is known up front, is checked and
+    made room for before any byte is written.
+    """
+    if not settings.MAX_CAPACITY_BYTES:
+        return None
+    if size_hint and not ensure_space(upload_dir, size_hint):
+        raise QuotaExceeded("Not enough storage space for this upload")
+    used, reserved = usage()
+    return max(0, settings.MAX_CAPACITY_BYTES - used - reserved)
@@ -0,0 +1,167 @@
+"""Cheap container checks on uploads, before anything is queued.
+
+The first bytes of an upload are matched against the magic numbers of the
+supported containers, so a renamed archive or document is rejected while
+it is still streaming in. Once the whole file is there its top-level
+structure is walked with a few small reads to catch truncated files,
+which ffmpeg would otherwise only fail on after the job waited its turn.
+"""
+
+import os
+import struct
+from pathlib import Path
+from typing import Optional
+
+# Bytes of an upload inspected before the rest is accepted.
+SNIFF_BYTES = 4096
+
+AVI = "avi"
+ISO_BMFF = "iso-bmff"  # MP4 and QuickTime MOV
+MATROSKA = "matroska"  # MKV and WebM
+ASF = "asf"  # WMV
+
+_ASF_HEADER_GUID = bytes.fromhex("3026b2758e66cf11a6d900aa0062ce6c")
+_EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+_SEGMENT_ID = 0x18538067
+# Box types a QuickTime or ISO base media file may start with.
+_FIRST_BOXES = {b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot"}
+# Top-level boxes walked at most when checking a finished file.
+_MAX_BOXES = 10000
+
+
+class InvalidContainer(ValueError):
+    """Raised for uploads that are not a supported, complete video file."""
+
+
+def _box_header(data: bytes) -> Optional[tuple[int, bytes, int]]:
+    """(box size, type, header length) of an ISO BMFF box, or None.
+
+    A size of 0 means the box runs to the end of the file.
+    """
+    if len(data) < 8:
+        return None
+    size, box_type = struct.unpack(">I4s", data[:8])
+    header = 8
+    if size == 1:
+        if len(data) < 16:
+            return None
+        size = struct.unpack(">Q", data[8:16])[0]
+        header = 16
+    if size != 0 and size < header:
+        return None
+    if not all(0x20 <= c < 0x7F for c in box_type):
+        return None
+    return size, box_type, header
+
+
+def detect_container(head: bytes) -> Optional[str]:
+    """The container the first bytes of a file belong to, if supported."""
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return AVI
+    if head[:16] == _ASF_HEADER_GUID:
+        return ASF
+    if head[:4] == _EBML_MAGIC:
+        # The DocType sits in the EBML header right after the magic.
+        if b"matroska" in head[:64] or b"webm" in head[:64]:
+            return MATROSKA
+        return None
+    box = _box_header(head)
+    if box and box[1] in _FIRST_BOXES:
+        return ISO_BMFF
+    return None
+
+
+def check_head(head: bytes):
+    """Reject an upload whose first bytes are not a supported container."""
+    if not head:
+        raise InvalidContainer("File is empty")
+    if detect_container(head) is None:
+        raise InvalidContainer(
+            "Not a supported video file (AVI, MOV, MKV, WMV, MP4 or WebM)"
+        )
+
+
+def _check_iso_bmff(f, size: int):
+    position = 0
+    boxes = set()
+    for _ in range(_MAX_BOXES):
+        if position >= size:
+            break
+        f.seek(position)
+        box = _box_header(f.read(16))
+        if box is None:
+            raise InvalidContainer("File is corrupt: invalid MP4 box")
+        box_size, box_type, _ = box
+        boxes.add(box_type)
+        if box_size == 0:
+            break
+        if position + box_size > size:
+            raise InvalidContainer("File is truncated")
+        position += box_size
+    if b"moov" not in boxes:
+        raise InvalidContainer("File is incomplete: it has no MP4 index (moov)")
+
+
+def _ebml_vint(data: bytes, position: int) -> Optional[tuple[int, int]]:
+    """(raw value, length) of the EBML variable size integer at position.
+
+    The raw value keeps the length marker bit, as element IDs are written.
+    None if data ends first.
+    """
+    if position >= len(data) or data[position] == 0:
+        return None
+    length = 9 - data[position].bit_length()
+    if position + length > len(data):
+        return None
+    return int.from_bytes(data[position : position + length], "big"), length
+
+
+def _check_matroska(head: bytes, size: int):
+    # Top-level elements are walked within the head up to the Segment,
+    # which holds everything else and declares its size up front.
+    position = 0
+    while True:
+        element_id = _ebml_vint(head, position)
+        element_size = element_id and _ebml_vint(head, position + element_id[1])
+        if not element_size:
+            if len(head) < size:
+                return  # The Segment starts past the head; nothing to check.
+            raise InvalidContainer("File is truncated")
+        (id_value, id_length), (raw_size, size_length) = element_id, element_size
+        marker = 1 << (7 * size_length)
+        data_size = raw_size - marker
+        data_start = position + id_length + size_length
+        if data_size == marker - 1:
+            return  # Unknown size, as written by live streams.
+        if data_start + data_size > size:
+            raise InvalidContainer("File is truncated")
+        if id_value == _SEGMENT_ID:
+            return
+        position = data_start + data_size
+        if position >= size:
+            raise InvalidContainer("File is incomplete: it has no Matroska segment")
+
+
+def check_complete(path: Path):
+    """Reject a fully written upload that is corrupt or truncated.
+
+    Only the top-level structure is read: box headers of MP4 and MOV
+    files, the Segment size of MKV and WebM files and the declared sizes
+    of AVI and ASF headers.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+        check_head(head)
+        container = detect_container(head)
+        if container == ISO_BMFF:
+            _check_iso_bmff(f, size)
+        elif container == MATROSKA:
+            _check_matroska(head, size)
+        elif container == AVI:
+            riff_size = struct.unpack("<I", head[4:8])[0]
+            if riff_size + 8 > size:
+                raise InvalidContainer("File is truncated")
+        elif container == ASF:
+            if len(head) < 24 or struct.unpack("<Q", head[16:24])[0] > size:
+                raise InvalidContainer("File is truncated")
@@ -0,0 +1,42 @@
+import asyncio
+
+from video_to_mp4 import settings
+
+
+class ConversionPool:
+    """Admission control for ffmpeg encodes.
+
+    At most max_concurrent jobs hold a slot at once. Each slot comes with a
+    thread budget for the encoder so that the running jobs together do not
+    oversubscribe the CPU. With a fixed threads_per_job of 0 the budget is
+    the core count divided by the number of jobs competing for slots when
+    the job is admitted, so a lone job can use the whole machine.
+    """
+
+    def __init__(self, max_concurrent: int, threads_per_job: int, cpu_count: int):
+        self.max_concurrent = max_concurrent
+        self.threads_per_job = threads_per_job
+        self.cpu_count = cpu_count
+        self.running = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def acquire(self):
+        """Wait for a free encode slot."""
+        await self._semaphore.acquire()
+        self.running += 1
+
+    def release(self):
+        self.running -= 1
+        self._semaphore.release()
+
+    def thread_budget(self, backlog: int) -> int:
+        """Encoder threads for a job admitted with backlog jobs still queued."""
+        if self.threads_per_job:
+            return self.threads_per_job
+        competing = min(self.max_concurrent, self.running + backlog)
+        return max(1, self.cpu_count // max(1, competing))
+
+
+conversion_pool = ConversionPool(
+    settings.MAX_CONCURRENT_ENCODES, settings.THREADS_PER_JOB, settings.CPU_COUNT
+)
@@ -0,0 +1,562 @@
+"""The conversion pipeline for a single job, independent of who runs it."""
+
+import contextlib
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import Callable, Optional, TypedDict
+
+import ffmpeg
+
+from video_to_mp4 import settings
+from video_to_mp4.services.blob_store import (
+    acquire_output,
+    output_key,
+    register_output,
+    release_output,
+)
+from video_to_mp4.services.media import (
+    can_remux,
+    duration_from_probe,
+    has_audio,
+    start_time_from_probe,
+)
+from video_to_mp4.services.media_index import get_probe
+from video_to_mp4.services.segmented import run_segmented_encode
+from video_to_mp4.services.transcode import (
+    FASTSTART,
+    FRAGMENTED,
+    RESOLUTION_HEIGHTS,
+    ConversionCancelled,
+    EncodeStats,
+    encode_streams,
+    run_ffmpeg,
+    run_renditions,
+    run_two_pass,
+)
+
+# Quality modes that limit the output size instead of targeting a CRF.
+TARGET_SIZE = "Target Size"
+MAX_BITRATE = "Max Bitrate"
+
+# Resolutions and quality modes a conversion can ask for, in the order they
+# are offered. Original keeps the input's resolution.
+RESOLUTION_OPTIONS = ["Original", *RESOLUTION_HEIGHTS]
+QUALITY_OPTIONS = ["Standard", "High", "Maximum", TARGET_SIZE, MAX_BITRATE]
+
+# Audio bitrate (kbit/s) set aside when a target size is split between
+# audio and video, and the lowest video bitrate a target may come to.
+_TARGET_AUDIO_KBPS = 128
+_MIN_VIDEO_KBPS = 64
+
+
+class Rendition(TypedDict):
+    resolution: str
+    converted_filename: str
+    converted_size: int
+    remuxed: bool
+    # True when an earlier identical conversion was reused.
+    reused: bool
+
+
+class ConversionResult(TypedDict):
+    # The job's first output; renditions lists all of them in the order of
+    # the job's resolutions.
+    converted_filename: str
+    converted_size: int
+    remuxed: bool
+    # True when no output had to be converted.
+    reused: bool
+    # x264 preset the outputs were encoded with; None if all were remuxed.
+    preset: Optional[str]
+    duration: Optional[float]
+    renditions: list[Rendition]
+
+
+def encode_settings(quality_mode: str) -> tuple[int, str]:
+    """Map a quality preset to its libx264 (crf, preset)."""
+    if quality_mode == "High":
+        return 18, "slow"
+    if quality_mode == "Maximum":
+        return 15, "veryslow"
+    if quality_mode == "Standard":
+        return 28, "fast"
+    return 23, "medium"
+
+
+def target_video_kbps(target_size: int, duration: float, audio: bool) -> int:
+    """Average video bitrate that gives an output of about target_size bytes."""
+    # Keep about 2% of the budget for the MP4 container.
+    total_kbps = target_size * 8 / 1000 / duration * 0.98
+    if audio:
+        total_kbps -= _TARGET_AUDIO_KBPS
+    return max(_MIN_VIDEO_KBPS, int(total_kbps))
+
+
+def job_resolutions(job: dict) -> list[str]:
+    """The resolutions a job asks for; several are stored comma separated."""
+    resolutions = (part.strip() for part in job["resolution"].split(","))
+    return list(dict.fromkeys(r for r in resolutions if r))
+
+
+def passlog_prefix(job_id: str) -> Path:
+    """Where the two-pass statistics of job_id are written."""
+    return settings.WORK_DIR / f"passlog_{job_id}"
+
+
+def partial_output_path(upload_dir: Path, job_id: str, index: int = 0) -> Path:
+    """Where a job's output is written before it is moved into place.
+
+    index numbers the outputs of a job with several resolutions.
+    """
+    if index:
+        return upload_dir / f".partial_{job_id}_{index}.mp4"
+    return upload_dir / f".partial_{job_id}.mp4"
+
+
+def cleanup_partial_outputs(upload_dir: Path, job_id: str):
+    """Remove everything an interrupted conversion of job_id left behind."""
+    for path in upload_dir.glob(f".partial_{job_id}*.mp4"):
+        path.unlink(missing_ok=True)
+    if settings.WORK_DIR.exists():
+        for work_dir in settings.WORK_DIR.glob(f"segments_{job_id}_*"):
+            shutil.rmtree(work_dir, ignore_errors=True)
+        for path in settings.WORK_DIR.glob(f"{passlog_prefix(job_id).name}*"):
+            path.unlink(missing_ok=True)
+
+
+# Serialises conversions of the same output key within this process so a
+# second identical job waits for the first and then reuses its output.
+_key_locks: dict[str, list] = {}
+_key_locks_guard = threading.Lock()
+
+
+@contextlib.contextmanager
+def _output_key_lock(key: str):
+    with _key_locks_guard:
+        entry = _key_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _key_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _key_locks[key]
+
+
+def _rate_control(
+    quality_mode: str,
+    duration_seconds: Optional[float],
+    audio: bool,
+    target_size: Optional[int],
+    max_bitrate: Optional[int],
+) -> tuple[Optional[int], str, Optional[int], Optional[dict]]:
+    """(crf, x264 preset, two-pass video kbps, extra video options)."""
+    crf, preset = encode_settings(quality_mode)
+    two_pass_kbps = None
+    video_options = None
+    if quality_mode == TARGET_SIZE:
+        if not target_size:
+            raise ValueError("Target Size mode needs a target size")
+        if not duration_seconds:
+            raise ValueError("Target Size mode needs an input with a known duration")
+        two_pass_kbps = target_video_kbps(target_size, duration_seconds, audio)
+        crf = None
+    elif quality_mode == MAX_BITRATE:
+        if not max_bitrate:
+            raise ValueError("Max Bitrate mode needs a bitrate")
+        # CRF quality, but VBV keeps peaks under the cap.
+        video_options = {
+            "maxrate": f"{max_bitrate}k",
+            "bufsize": f"{max_bitrate * 2}k",
+        }
+    return crf, preset, two_pass_kbps, video_options
+
+
+def _encode_one(
+    input_path: Path,
+    output_path: Path,
+    resolution_mode: str,
+    crf,
+    preset: str,
+    duration_seconds: Optional[float],
+    progress_callback,
+    threads: int,
+    audio: bool,
+    start_time: float,
+    job_id: str,
+    two_pass_kbps: Optional[int],
+    video_options: Optional[dict],
+    movflags: str,
+    cancel: Optional[threading.Event],
+    stats_callback,
+):
+    """Encode one resolution of an input with whichever path suits it."""
+    # Rate control needs to see the whole video, so size limited modes
+    # are never split into segments. Segments only become a file at the
+    # end, which would leave nothing to stream while encoding.
+    segmented = (
+        not two_pass_kbps
+        and not video_options
+        and not settings.FRAGMENTED_MP4
+        and threads >= 2
+        and duration_seconds
+        and duration_seconds >= settings.SEGMENT_MIN_DURATION
+    )
+    if segmented:
+        run_segmented_encode(
+            input_path,
+            output_path,
+            resolution_mode,
+            crf,
+            preset,
+            duration_seconds,
+            progress_callback,
+            threads,
+            audio,
+            start_time,
+            work_prefix=f"segments_{job_id}_",
+            cancel=cancel,
+            stats_callback=stats_callback,
+        )
+    elif two_pass_kbps:
+        settings.WORK_DIR.mkdir(parents=True, exist_ok=True)
+        run_two_pass(
+            encode_streams(ffmpeg.input(str(input_path)), resolution_mode, audio),
+            output_path,
+            two_pass_kbps,
+            preset,
+            duration_seconds,
+            progress_callback,
+            passlog_prefix(job_id),
+            threads=threads,
+            cancel=cancel,
+            stats_callback=stats_callback,
+            audio_kbps=_TARGET_AUDIO_KBPS,
+            movflags=movflags,
+        )
+    else:
+        run_ffmpeg(
+            encode_streams(ffmpeg.input(str(input_path)), resolution_mode, audio),
+            output_path,
+            crf,
+            preset,
+            duration_seconds,
+            progress_callback,
+            threads=threads,
+            cancel=cancel,
+            stats_callback=stats_callback,
+            video_options=video_options,
+            movflags=movflags,
+        )
+
+
+def _progress_share(progress_callback, index: int, count: int):
+    """Map 0-100 progress of step index of count onto the job's 0-100."""
+    if progress_callback is None or count == 1:
+        return progress_callback
+    return lambda pct: progress_callback((index + pct / 100) * 100 / count)
+
+
+def _convert_pending(
+    pending: list[dict],
+    input_path: Path,
+    probe: Optional[dict],
+    crf,
+    preset: str,
+    duration_seconds: Optional[float],
+    progress_callback,
+    threads: int,
+    job_id: str,
+    two_pass_kbps: Optional[int],
+    video_options: Optional[dict],
+    movflags: str,
+    cancel: Optional[threading.Event],
+    stats_callback,
+):
+    """Write each pending plan's output to its partial path."""
+    audio = has_audio(probe)
+    remuxes = [plan for plan in pending if plan["remux"]]
+    encodes = [plan for plan in pending if not plan["remux"]]
+    for plan in remuxes:
+        source = ffmpeg.input(str(input_path))
+        # V skips attached pictures, so cover art of MOV and MKV inputs
+        # does not become a second video track.
+        streams = [source["V:0"]]
+        if audio:
+            streams.append(source.audio)
+        # A remux takes seconds; progress comes from the encode, if any.
+        run_ffmpeg(
+            streams,
+            plan["partial"],
+            None,
+            None,
+            duration_seconds,
+            None if encodes else progress_callback,
+            threads=threads,
+            remux=True,
+            cancel=cancel,
+            stats_callback=None if encodes else stats_callback,
+            movflags=movflags,
+        )
+    if len(encodes) > 1 and not two_pass_kbps:
+        run_renditions(
+            ffmpeg.input(str(input_path)),
+            [(plan["partial"], plan["resolution"]) for plan in encodes],
+            crf,
+            preset,
+            duration_seconds,
+            progress_callback,
+            audio,
+            threads=threads,
+            cancel=cancel,
+            stats_callback=stats_callback,
+            video_options=video_options,
+            movflags=movflags,
+        )
+    else:
+        # Two-pass rate control keeps per-output statistics, so its
+        # renditions are encoded one after another.
+        for index, plan in enumerate(encodes):
+            _encode_one(
+                input_path,
+                plan["partial"],
+                plan["resolution"],
+                crf,
+                preset,
+                duration_seconds,
+                _progress_share(progress_callback, index, len(encodes)),
+                threads,
+                audio,
+                start_time_from_probe(probe),
+                job_id,
+                two_pass_kbps,
+                video_options,
+                movflags,
+                cancel,
+                stats_callback,
+            )
+    for plan in pending:
+        if not plan["partial"].exists():
+            raise Exception("Conversion failed: Output file not created")
+
+
+def convert_job(
+    job: dict,
+    upload_dir: Path,
+    threads: int,
+    progress_callback: Optional[Callable[[float], None]] = None,
+    cancel: Optional[threading.Event] = None,
+    preset: Optional[str] = None,
+    stats_callback: Optional[Callable[[EncodeStats], None]] = None,
+) -> ConversionResult:
+    """Convert a job's input to MP4, blocking until done.
+
+    job needs id, filename, content_hash, resolution and quality, plus
+    target_size (bytes) or max_bitrate (kbit/s) for the size limited
+    quality modes. A job may ask for several resolutions, which are
+    encoded from a single decode of the input. If the same input was
+    already converted with the same settings, the existing output is
+    reused and no encode runs. The caller owns one reference to each
+    returned output. preset overrides the x264 preset of the job's
+    quality option. stats_callback receives the encoder's progress
+    reports. Raises on failure, and ConversionCancelled once cancel
+    is set.
+    """
+    if not shutil.which("ffmpeg"):
+        raise RuntimeError("Server Error: FFmpeg not installed")
+    input_filename = job["filename"]
+    resolutions = job_resolutions(job)
+    quality_mode = job["quality"]
+    input_path = upload_dir / input_filename
+    if not input_path.exists():
+        raise FileNotFoundError(f"Input file {input_filename} not found")
+    probe = get_probe(input_path)
+    duration_seconds = duration_from_probe(probe)
+    audio = has_audio(probe)
+    size_limited = quality_mode in (TARGET_SIZE, MAX_BITRATE)
+    crf, quality_preset, two_pass_kbps, video_options = _rate_control(
+        quality_mode,
+        duration_seconds,
+        audio,
+        job.get("target_size"),
+        job.get("max_bitrate"),
+    )
+    preset = preset or quality_preset
+    encoder = {
+        "vcodec": "libx264",
+        "acodec": "aac",
+        "crf": crf,
+        "preset": preset,
+    }
+    if two_pass_kbps:
+        encoder.update(two_pass_kbps=two_pass_kbps, audio_kbps=_TARGET_AUDIO_KBPS)
+    if video_options:
+        encoder.update(video_options)
+    movflags = FASTSTART
+    if settings.FRAGMENTED_MP4:
+        movflags = FRAGMENTED
+    plans = []
+    for index, resolution_mode in enumerate(resolutions):
+        # A copied stream keeps whatever bitrate the source has.
+        remux = not size_limited and can_remux(probe, resolution_mode)
+        plan_encoder = {"remux": True} if remux else dict(encoder)
+        if settings.FRAGMENTED_MP4:
+            plan_encoder["movflags"] = movflags
+        key = output_key(
+            job["content_hash"], resolution_mode, quality_mode, plan_encoder
+        )
+        label = f"_{resolution_mode}" if len(resolutions) > 1 else ""
+        plans.append(
+            {
+                "resolution": resolution_mode,
+                "remux": remux,
+                "key": key,
+                "filename": f"converted_{Path(input_filename).stem}{label}"
+                f"_{key[:8]}.mp4",
+                "partial": partial_output_path(upload_dir, job["id"], index),
+            }
+        )
+    renditions: dict[str, Rendition] = {}
+    with contextlib.ExitStack() as locks:
+        for key in sorted(plan["key"] for plan in plans):
+            locks.enter_context(_output_key_lock(key))
+        try:
+            if cancel is not None and cancel.is_set():
+                raise ConversionCancelled()
+            pending = []
+            for plan in plans:
+                existing = acquire_output(upload_dir, plan["key"])
+                if existing is None:
+                    pending.append(plan)
+                    continue
+                renditions[plan["resolution"]] = {
+                    "resolution": plan["resolution"],
+                    "converted_filename": existing["converted_filename"],
+                    "converted_size": existing["size"],
+                    "remuxed": bool(existing["remuxed"]),
+                    "reused": True,
+                }
+            _convert_pending(
+                pending,
+                input_path,
+                probe,
+                crf,
+                preset,
+                duration_seconds,
+                progress_callback if duration_seconds else None,
+                threads,
+                job["id"],
+                two_pass_kbps,
+                video_options,
+                movflags,
+                cancel,
+                stats_callback,
+            )
+            for plan in pending:
+                output_path = upload_dir / plan["filename"]
+                os.replace(plan["partial"], output_path)
+                converted_size = output_path.stat().st_size
+                register_output(
+                    plan["key"],
+                    job["content_hash"],
+                    plan["filename"],
+                    converted_size,
+                    plan["remux"],
+                )
+                renditions[plan["resolution"]] = {
+                    "resolution": plan["resolution"],
+                    "converted_filename": plan["filename"],
+                    "converted_size": converted_size,
+                    "remuxed": plan["remux"],
+                    "reused": False,
+                }
+        except BaseException:
+            # Give back the outputs this job had already taken.
+            for rendition in renditions.values():
+                release_output(upload_dir, rendition["converted_filename"])
+            raise
+        finally:
+            for plan in plans:
+                plan["partial"].unlink(missing_ok=True)
+    ordered = [renditions[resolution] for resolution in resolutions]
+    first = ordered[0]
+    return {
+        "converted_filename": first["converted_filename"],
+        "converted_size": first["converted_size"],
+        "remuxed": first["remuxed"],
+        "reused": all(r["reused"] for r in ordered),
+        "preset": None if all(r["remuxed"] for r in ordered) else preset,
+        "duration": duration_seconds,
+        "renditions": ordered,
+    }
+
+
+def convert_file(
+    input_path: Path,
+    outputs: list[tuple[str, Path]],
+    quality_mode: str,
+    threads: int,
+    target_size: Optional[int] = None,
+    max_bitrate: Optional[int] = None,
+    progress_callback: Optional[Callable[[float], None]] = None,
+    cancel: Optional[threading.Event] = None,
+    stats_callback: Optional[Callable[[EncodeStats], None]] = None,
+) -> list[bool]:
+    """Convert a file to MP4s at the given paths, outside the job store.
+
+    outputs pairs each resolution with the path its MP4 goes to. Encodes
+    run exactly as for a job, but nothing is deduplicated or registered.
+    Each output is moved into place only once complete, so a failed or
+    cancelled conversion leaves no partial file behind. Returns, per
+    output, whether it was remuxed rather than encoded.
+    """
+    if not shutil.which("ffmpeg"):
+        raise RuntimeError("FFmpeg not installed")
+    probe = get_probe(input_path)
+    duration_seconds = duration_from_probe(probe)
+    crf, preset, two_pass_kbps, video_options = _rate_control(
+        quality_mode,
+        duration_seconds,
+        has_audio(probe),
+        target_size,
+        max_bitrate,
+    )
+    size_limited = quality_mode in (TARGET_SIZE, MAX_BITRATE)
+    # Names the partial outputs and work files of this conversion.
+    work_id = f"file_{uuid.uuid4().hex[:12]}"
+    plans = [
+        {
+            "resolution": resolution_mode,
+            "remux": not size_limited and can_remux(probe, resolution_mode),
+            "partial": partial_output_path(output_path.parent, work_id, index),
+        }
+        for index, (resolution_mode, output_path) in enumerate(outputs)
+    ]
+    try:
+        _convert_pending(
+            plans,
+            input_path,
+            probe,
+            crf,
+            preset,
+            duration_seconds,
+            progress_callback if duration_seconds else None,
+            threads,
+            work_id,
+            two_pass_kbps,
+            video_options,
+            FASTSTART,
+            cancel,
+            stats_callback,
+        )
+        for plan, (_, output_path) in zip(plans, outputs):
+            os.replace(plan["partial"], output_path)
+    finally:
+        for output_dir in {output_path.parent for _, output_path in outputs}:
+            cleanup_partial_outputs(output_dir, work_id)
+    return [plan["remux"] for plan in plans]
@@ -0,0 +1,61 @@
+import contextlib
+import sqlite3
+import threading
+
+from video_to_mp4 import settings
+
+_schemas: list[str] = []
+_columns: list[tuple[str, str, str]] = []
+# Number of schemas and columns applied so far.
+_applied = (0, 0)
+_schema_lock = threading.Lock()
+
+
+def register_schema(sql: str):
+    """Register CREATE ... IF NOT EXISTS statements to run on first connect."""
+    _schemas.append(sql)
+
+
+def register_column(table: str, column: str, definition: str):
+    """Register a column added to an existing table after its first release.
+
+    The column is added on first connect if the table does not have it yet.
+    Must be registered after the table's schema.
+    """
+    _columns.append((table, column, definition))
+
+
+def _apply_schemas(conn: sqlite3.Connection):
+    global _applied
+    if _applied == (len(_schemas), len(_columns)):
+        return
+    with _schema_lock:
+        for sql in _schemas[_applied[0] :]:
+            conn.executescript(sql)
+        for table, column, definition in _columns[_applied[1] :]:
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column in existing:
+                continue
+            try:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            except sqlite3.OperationalError as e:
+                # Another process added it first.
+                if "duplicate column" not in str(e):
+                    raise
+        _applied = (len(_schemas), len(_columns))
+
+
+@contextlib.contextmanager
+def connect():
+    """Open the backend database; the block runs as a single transaction."""
+    settings.DATA_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(settings.DATABASE_PATH, timeout=30)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _apply_schemas(conn)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
@@ -0,0 +1,360 @@
+"""Runs queued conversions from the durable job store."""
+
+import asyncio
+import contextlib
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import ffmpeg
+import reflex as rx
+
+from video_to_mp4 import settings
+from video_to_mp4.services import job_store, metrics
+from video_to_mp4.services.blob_store import release_output
+from video_to_mp4.services.conversion_pool import ConversionPool, conversion_pool
+from video_to_mp4.services.converter import (
+    cleanup_partial_outputs,
+    convert_job,
+    encode_settings,
+    job_resolutions,
+)
+from video_to_mp4.services.preset_controller import PresetController
+from video_to_mp4.services.progress import ProgressEstimator, ProgressThrottle
+from video_to_mp4.services.transcode import (
+    ConversionCancelled,
+    EncodeStats,
+    get_media_duration,
+)
+
+_HOSTNAME = socket.gethostname()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _dead_local_workers(workers: list[str]) -> list[str]:
+    """Workers on this host whose process no longer exists."""
+    dead = []
+    for worker in workers:
+        host, _, pid = worker.rpartition(":")
+        if host == _HOSTNAME and pid.isdigit() and not _pid_alive(int(pid)):
+            dead.append(worker)
+    return dead
+
+
+def _failure_reason(error: Exception) -> str:
+    """Coarse failure category used as a metrics label."""
+    if isinstance(error, FileNotFoundError):
+        return "input_missing"
+    if isinstance(error, ffmpeg.Error) or "ffmpeg exited" in str(error):
+        return "ffmpeg"
+    if "FFmpeg not installed" in str(error):
+        return "ffmpeg_missing"
+    return "other"
+
+
+def _record_completion(result: dict, seconds: float):
+    if result["reused"]:
+        outcome = "reused"
+    elif result["remuxed"]:
+        outcome = "remuxed"
+    else:
+        outcome = "encoded"
+    metrics.observe("encode_duration_seconds", seconds, result=outcome)
+    metrics.inc("jobs_completed_total", result=outcome)
+    produced = sum(
+        rendition["converted_size"]
+        for rendition in result["renditions"]
+        if not rendition["reused"]
+    )
+    if produced:
+        metrics.inc("produced_bytes_total", produced)
+
+
+def _recover_interrupted_jobs(upload_dir: Path) -> list[str]:
+    """Requeue jobs abandoned by dead workers and delete their partial output."""
+    dead_workers = _dead_local_workers(job_store.processing_workers())
+    job_ids = job_store.requeue_interrupted_jobs(
+        settings.JOB_STALE_AFTER, dead_workers
+    )
+    for job_id in job_ids:
+        cleanup_partial_outputs(upload_dir, job_id)
+    if job_ids:
+        logging.warning(f"Requeued {len(job_ids)} interrupted job(s): {job_ids}")
+    return job_ids
+
+
+class JobRunner:
+    """Claims queued jobs and converts them, one pool slot per job.
+
+    Jobs are claimed only once a slot is free, so they stay Queued until
+    there is capacity to run them.
+    """
+
+    def __init__(
+        self,
+        pool: ConversionPool,
+        worker_id: Optional[str] = None,
+        presets: Optional[PresetController] = None,
+    ):
+        self.pool = pool
+        # Speeds up the x264 preset under load when set.
+        self.presets = presets
+        # Defaults to host:pid, resolved when the runner starts so that it
+        # names the process that actually runs the jobs.
+        self.worker_id = worker_id
+        self._wake = asyncio.Event()
+        self._running: dict[str, asyncio.Task] = {}
+        # Set to stop the conversion of a job; its ffmpeg processes are
+        # terminated and the job's thread and slot are freed.
+        self._cancel_events: dict[str, threading.Event] = {}
+        # Latest encoder report of each running job, for the metrics.
+        self._encode_stats: dict[str, EncodeStats] = {}
+        self._claiming: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def notify(self):
+        """Wake the runner after a job was queued."""
+        self._wake.set()
+
+    def cancel(self, job_id: str):
+        """Stop job_id right away if this runner is converting it.
+
+        Jobs running elsewhere notice the cancellation on their next
+        progress update or heartbeat.
+        """
+        event = self._cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+
+    def stop(self):
+        """Stop claiming jobs; run() returns once the running ones finish."""
+        self._stopping = True
+        if self._claiming is not None:
+            self._claiming.cancel()
+
+    async def run(self, upload_dir: Path):
+        if self.worker_id is None:
+            self.worker_id = f"{_HOSTNAME}:{os.getpid()}"
+        await asyncio.to_thread(_recover_interrupted_jobs, upload_dir)
+        heartbeat = asyncio.create_task(self._heartbeat(upload_dir))
+        self._claiming = asyncio.create_task(self._claim_jobs(upload_dir))
+        try:
+            try:
+                await self._claiming
+            except asyncio.CancelledError:
+                if not self._stopping:
+                    raise
+            if self._running:
+                logging.info(f"Waiting for {len(self._running)} running job(s)")
+                await asyncio.gather(*self._running.values(), return_exceptions=True)
+        finally:
+            self._claiming.cancel()
+            heartbeat.cancel()
+            # Kill the encoders so they do not outlive the runner; their
+            # jobs are requeued when the runner starts again.
+            for event in self._cancel_events.values():
+                event.set()
+            for task in self._running.values():
+                task.cancel()
+
+    async def _claim_jobs(self, upload_dir: Path):
+        while True:
+            await self.pool.acquire()
+            self._wake.clear()
+            try:
+                job = await asyncio.to_thread(
+                    job_store.claim_next_job, self.worker_id
+                )
+                backlog = await asyncio.to_thread(job_store.count_queued)
+            except Exception:
+                self.pool.release()
+                logging.exception("Failed to claim a job")
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+                continue
+            if job is None:
+                self.pool.release()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(
+                        self._wake.wait(), settings.JOB_POLL_INTERVAL
+                    )
+                continue
+            threads = self.pool.thread_budget(backlog)
+            self._cancel_events[job["id"]] = threading.Event()
+            task = asyncio.create_task(
+                self._process(job, upload_dir, threads, backlog)
+            )
+            self._running[job["id"]] = task
+            task.add_done_callback(
+                lambda _, job_id=job["id"]: self._finished(job_id)
+            )
+
+    def _finished(self, job_id: str):
+        self._running.pop(job_id, None)
+        self._cancel_events.pop(job_id, None)
+        self._encode_stats.pop(job_id, None)
+        self.pool.release()
+
+    async def _heartbeat(self, upload_dir: Path):
+        while True:
+            await asyncio.sleep(settings.JOB_HEARTBEAT_INTERVAL)
+            try:
+                running = list(self._running)
+                owned = await asyncio.to_thread(
+                    job_store.touch_jobs, self.worker_id, running
+                )
+                for job_id in running:
+                    if job_id not in owned:
+                        self.cancel(job_id)
+                if await asyncio.to_thread(_recover_interrupted_jobs, upload_dir):
+                    self.notify()
+                await asyncio.to_thread(self._report_encoder_stats)
+            except Exception:
+                logging.exception("Job heartbeat failed")
+
+    def _report_encoder_stats(self):
+        stats = list(self._encode_stats.values())
+        fps = sum(s["fps"] or 0.0 for s in stats)
+        speed = sum(s["speed"] or 0.0 for s in stats)
+        metrics.set_gauge("encoder_fps", fps, worker=self.worker_id)
+        metrics.set_gauge("encoder_speed", speed, worker=self.worker_id)
+
+    def _adapt_preset(
+        self, job: dict, duration: Optional[float], threads: int, backlog: int
+    ) -> Optional[str]:
+        _, preset = encode_settings(job["quality"])
+        if duration:
+            # Several resolutions are encoded side by side on one budget.
+            duration *= len(job_resolutions(job))
+        chosen = self.presets.choose(
+            preset,
+            duration,
+            threads,
+            backlog,
+            self.pool.max_concurrent,
+            job_store.queued_at(job),
+        )
+        if chosen != preset:
+            logging.info(
+                f"Encoding job {job['id']} with preset {chosen} instead of"
+                f" {preset} ({backlog} job(s) queued)"
+            )
+        return chosen
+
+    async def _process(self, job: dict, upload_dir: Path, threads: int, backlog: int):
+        job_id = job["id"]
+        cancel = self._cancel_events[job_id]
+        # Everything that touches the store runs inside the try, so that a
+        # failure there fails the job instead of leaving it Processing.
+        try:
+            # Best effort: observe logs and swallows database errors.
+            await asyncio.to_thread(
+                metrics.observe,
+                "queue_wait_seconds",
+                max(0.0, job["started_at"] - job_store.queued_at(job)),
+            )
+            duration = await asyncio.to_thread(
+                get_media_duration, upload_dir / job["filename"]
+            )
+            estimator = ProgressEstimator(duration)
+
+            def report(pct: float):
+                estimator.add_progress(pct)
+                if not job_store.update_progress(
+                    job_id, self.worker_id, pct, estimator.snapshot()
+                ):
+                    cancel.set()
+
+            def record_stats(stats: EncodeStats):
+                self._encode_stats[job_id] = stats
+                estimator.add_stats(stats)
+
+            progress = ProgressThrottle(report, settings.PROGRESS_UPDATE_HZ)
+            preset = None
+            if self.presets is not None:
+                preset = await asyncio.to_thread(
+                    self._adapt_preset, job, duration, threads, backlog
+                )
+            started = time.monotonic()
+            result = await asyncio.to_thread(
+                convert_job,
+                job,
+                upload_dir,
+                threads,
+                progress,
+                cancel,
+                preset,
+                stats_callback=record_stats,
+            )
+        except ConversionCancelled:
+            logging.info(f"Conversion of job {job_id} cancelled")
+            return
+        except Exception as e:
+            logging.exception(f"Conversion error for job {job_id}")
+            await asyncio.to_thread(
+                job_store.fail_job, job_id, self.worker_id, str(e)
+            )
+            await asyncio.to_thread(
+                metrics.inc, "job_failures_total", reason=_failure_reason(e)
+            )
+            return
+        elapsed = time.monotonic() - started
+        if self.presets is not None and result["preset"] and not result["reused"]:
+            # Every encoded rendition took a share of the thread budget.
+            encoded = sum(
+                1
+                for rendition in result["renditions"]
+                if not rendition["reused"] and not rendition["remuxed"]
+            )
+            self.presets.record(
+                result["preset"],
+                (result["duration"] or 0.0) * encoded,
+                threads,
+                elapsed,
+            )
+        await asyncio.to_thread(_record_completion, result, elapsed)
+        completed = await asyncio.to_thread(
+            job_store.complete_job,
+            job_id,
+            self.worker_id,
+            result["converted_filename"],
+            result["converted_size"],
+            result["remuxed"],
+            result["renditions"],
+        )
+        if not completed:
+            # The job was removed while it ran; drop its output references.
+            for rendition in result["renditions"]:
+                await asyncio.to_thread(
+                    release_output, upload_dir, rendition["converted_filename"]
+                )
+
+
+def adaptive_presets() -> Optional[PresetController]:
+    """The preset controller for a runner, if a turnaround target is set."""
+    if not settings.TURNAROUND_TARGET:
+        return None
+    return PresetController(settings.TURNAROUND_TARGET)
+
+
+job_runner = JobRunner(conversion_pool, presets=adaptive_presets())
+
+
+async def run_job_queue():
+    """Lifespan task running queued conversions inside the web backend."""
+    if not settings.INPROCESS_WORKER:
+        logging.info("In-process conversions disabled; waiting for workers")
+        return
+    await job_runner.run(rx.get_upload_dir())
@@ -0,0 +1,565 @@
+"""Durable job queue backed by the SQLite database.
+
+Jobs survive backend restarts: whoever runs conversions claims Queued rows,
+keeps a heartbeat on the rows it is working on, and jobs whose owner stopped
+heartbeating are put back in the queue.
+"""
+
+import time
+from typing import Optional
+
+from video_to_mp4.services import db
+
+# Statuses a job can be in.
+QUEUED = "Queued"
+PROCESSING = "Processing"
+COMPLETE = "Complete"
+ERROR = "Error"
+
+db.register_schema(
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        session TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        resolution TEXT NOT NULL,
+        quality TEXT NOT NULL,
+        status TEXT NOT NULL,
+        progress REAL NOT NULL DEFAULT 0,
+        converted_filename TEXT NOT NULL DEFAULT '',
+        converted_size INTEGER,
+        error_message TEXT,
+        remuxed INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        heartbeat_at REAL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS jobs_session ON jobs (session, created_at);
+    CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+    -- Live encoder estimates of Processing jobs. updated_at is the last
+    -- time the job's progress moved.
+    CREATE TABLE IF NOT EXISTS job_stats (
+        job_id TEXT PRIMARY KEY,
+        speed REAL,
+        fps REAL,
+        eta_seconds REAL,
+        projected_size INTEGER,
+        updated_at REAL NOT NULL
+    );
+    -- One row per output of a Complete job; jobs asking for several
+    -- resolutions have one per resolution.
+    CREATE TABLE IF NOT EXISTS job_outputs (
+        job_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        resolution TEXT NOT NULL,
+        converted_filename TEXT NOT NULL,
+        converted_size INTEGER NOT NULL,
+        remuxed INTEGER NOT NULL,
+        PRIMARY KEY (job_id, position)
+    );
+    -- Last time each browser session loaded or changed its job list.
+    CREATE TABLE IF NOT EXISTS sessions (
+        session TEXT PRIMARY KEY,
+        last_seen REAL NOT NULL
+    );
+    """
+)
+# Limits of the "Target Size" (bytes) and "Max Bitrate" (kbit/s) modes.
+db.register_column("jobs", "target_size", "INTEGER")
+db.register_column("jobs", "max_bitrate", "INTEGER")
+# Bytes the job's outputs are expected to take, held against the storage
+# quota while it is Queued or Processing.
+db.register_column("jobs", "predicted_size", "INTEGER")
+# When the retention sweeper released the source of a Complete job. The
+# filename is kept for display, but the job no longer holds the blob.
+db.register_column("jobs", "source_released_at", "REAL")
+# When the job last entered the queue: on creation, a retry, or a requeue
+# after its worker went away. NULL on rows from before the column, which
+# entered it at created_at.
+db.register_column("jobs", "queued_at", "REAL")
+
+
+def create_job(
+    job_id: str,
+    session: str,
+    filename: str,
+    content_hash: str,
+    size: int,
+    resolution: str,
+    quality: str,
+    target_size: Optional[int] = None,
+    max_bitrate: Optional[int] = None,
+    predicted_size: Optional[int] = None,
+):
+    now = time.time()
+    with db.connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, session, filename, content_hash, size,"
+            " resolution, quality, target_size, max_bitrate, predicted_size,"
+            " status, created_at, queued_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job_id,
+                session,
+                filename,
+                content_hash,
+                size,
+                resolution,
+                quality,
+                target_size,
+                max_bitrate,
+                predicted_size,
+                QUEUED,
+                now,
+                now,
+                now,
+            ),
+        )
+
+
+def queued_at(job: dict) -> float:
+    """When a job row last entered the queue."""
+    return job["queued_at"] or job["created_at"]
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    with db.connect() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def delete_job(job_id: str) -> Optional[dict]:
+    """Delete a job, returning the row it had.
+
+    The row's outputs key lists the converted filenames the job held.
+    """
+    with db.connect() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        outputs = conn.execute(
+            "SELECT converted_filename FROM job_outputs WHERE job_id = ?"
+            " ORDER BY position",
+            (job_id,),
+        ).fetchall()
+        conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        conn.execute("DELETE FROM job_stats WHERE job_id = ?", (job_id,))
+        conn.execute("DELETE FROM job_outputs WHERE job_id = ?", (job_id,))
+    if row is None:
+        return None
+    job = dict(row)
+    job["outputs"] = [output["converted_filename"] for output in outputs]
+    if not job["outputs"] and job["converted_filename"]:
+        job["outputs"] = [job["converted_filename"]]
+    return job
+
+
+def list_jobs(session: str, offset: int, limit: int) -> list[dict]:
+    """One page of a session's jobs, newest first."""
+    with db.connect() as conn:
+        rows = conn.execute(
+            "SELECT * FROM jobs WHERE session = ?"
+            " ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (session, limit, offset),
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def job_outputs(job_ids: list[str]) -> dict[str, list[dict]]:
+    """Outputs of each Complete job in job_ids, in the order requested."""
+    if not job_ids:
+        return {}
+    with db.connect() as conn:
+        rows = conn.execute(
+            "SELECT * FROM job_outputs"
+            f" WHERE job_id IN ({', '.join('?' * len(job_ids))})"
+            " ORDER BY job_id, position",
+            job_ids,
+        ).fetchall()
+    outputs: dict[str, list[dict]] = {}
+    for row in rows:
+        outputs.setdefault(row["job_id"], []).append(dict(row))
+    return outputs
+
+
+def count_jobs(session: str) -> int:
+    with db.connect() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE session = ?", (session,)
+        ).fetchone()[0]
+
+
+def session_activity(session: str) -> tuple[float, dict[str, dict], int]:
+    """Cheap change summary used to keep a browser session in sync.
+
+    Returns (last status change time, live state of Processing jobs by id,
+    number of Queued or Processing jobs). The live state holds progress,
+    started_at, heartbeat_at and the job_stats columns, which are None
+    until the encoder has reported.
+    """
+    with db.connect() as conn:
+        last_change = conn.execute(
+            "SELECT MAX(updated_at) FROM jobs WHERE session = ?", (session,)
+        ).fetchone()[0]
+        rows = conn.execute(
+            "SELECT j.id, j.status, j.progress, j.started_at, j.heartbeat_at,"
+            " s.speed, s.fps, s.eta_seconds, s.projected_size,"
+            " s.updated_at AS progress_at"
+            " FROM jobs j LEFT JOIN job_stats s ON s.job_id = j.id"
+            " WHERE j.session = ? AND j.status IN (?, ?)",
+            (session, QUEUED, PROCESSING),
+        ).fetchall()
+    live = {}
+    for row in rows:
+        if row["status"] == PROCESSING:
+            state = dict(row)
+            del state["id"], state["status"]
+            live[row["id"]] = state
+    return last_change or 0.0, live, len(rows)
+
+
+def count_queued() -> int:
+    with db.connect() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)
+        ).fetchone()[0]
+
+
+def count_by_status() -> dict[str, int]:
+    with db.connect() as conn:
+        rows = conn.execute(
+            "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"
+        ).fetchall()
+    return {row["status"]: row["n"] for row in rows}
+
+
+def reserved_bytes() -> int:
+    """Bytes expected to be written by Queued and Processing jobs.
+
+    A running job holds the larger of its prediction and the encoder's
+    live projection of its output size.
+    """
+    with db.connect() as conn:
+        return conn.execute(
+            "SELECT COALESCE(SUM(MAX(COALESCE(j.predicted_size, 0),"
+            " COALESCE(s.projected_size, 0))), 0)"
+            " FROM jobs j LEFT JOIN job_stats s ON s.job_id = j.id"
+            " WHERE j.status IN (?, ?)",
+            (QUEUED, PROCESSING),
+        ).fetchone()[0]
+
+
+def complete_references(converted_filename: str) -> int:
+    """How many references to an output Complete jobs hold.
+
+    Jobs that are still running may hold more, having reused the output
+    before they complete.
+    """
+    with db.connect() as conn:
+        return conn.execute(
+            "SELECT (SELECT COUNT(*) FROM job_outputs o JOIN jobs j"
+            " ON j.id = o.job_id WHERE j.status = ? AND o.converted_filename = ?)"
+            # Jobs from before job_outputs only name their single output.
+            " + (SELECT COUNT(*) FROM jobs j WHERE status = ?"
+            " AND converted_filename = ?"
+            " AND NOT EXISTS (SELECT 1 FROM job_outputs WHERE job_id = j.id))",
+            (COMPLETE, converted_filename, COMPLETE, converted_filename),
+        ).fetchone()[0]
+
+
+def expire_outputs(filenames: list[str], message: str) -> list[str]:
+    """Turn Complete jobs holding any of filenames into Error jobs.
+
+    Used when outputs were deleted from under their jobs. The jobs can be
+    retried to convert again. Returns the other outputs those jobs held,
+    one entry per reference, for the caller to release.
+    """
+    if not filenames:
+        return []
+    placeholders = ", ".join("?" * len(filenames))
+    now = time.time()
+    with db.connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT id, converted_filename FROM jobs WHERE status = ? AND"
+            f" (converted_filename IN ({placeholders}) OR id IN (SELECT job_id"
+            f" FROM job_outputs WHERE converted_filename IN ({placeholders})))",
+            (COMPLETE, *filenames, *filenames),
+        ).fetchall()
+        released = []
+        for row in rows:
+            held = [
+                output["converted_filename"]
+                for output in conn.execute(
+                    "SELECT converted_filename FROM job_outputs WHERE job_id = ?",
+                    (row["id"],),
+                )
+            ] or [row["converted_filename"]]
+            released.extend(name for name in held if name not in filenames)
+            conn.execute("DELETE FROM job_outputs WHERE job_id = ?", (row["id"],))
+            conn.execute(
+                "UPDATE jobs SET status = ?, error_message = ?,"
+                " converted_filename = '', converted_size = NULL, updated_at = ?"
+                " WHERE id = ?",
+                (ERROR, message, now, row["id"]),
+            )
+    return released
+
+
+def claim_next_job(worker: str) -> Optional[dict]:
+    """Atomically move the oldest Queued job to Processing for worker."""
+    now = time.time()
+    with db.connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+            (QUEUED,),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = ?, progress = 0, worker = ?, started_at = ?,"
+            " heartbeat_at = ?, updated_at = ? WHERE id = ?",
+            (PROCESSING, worker, now, now, now, row["id"]),
+        )
+        conn.execute("DELETE FROM job_stats WHERE job_id = ?", (row["id"],))
+    job = dict(row)
+    job.update(status=PROCESSING, worker=worker, started_at=now)
+    return job
+
+
+def requeue_job(job_id: str) -> bool:
+    """Put an errored job back in the queue.
+
+    False if it is not in Error or its source has been released.
+    """
+    now = time.time()
+    with db.connect() as conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, progress = 0, error_message = NULL,"
+            " remuxed = 0, worker = NULL, started_at = NULL, finished_at = NULL,"
+            " queued_at = ?, updated_at = ? WHERE id = ? AND status = ?"
+            " AND source_released_at IS NULL",
+            (QUEUED, now, now, job_id, ERROR),
+        )
+    return cursor.rowcount > 0
+
+
+def touch_session(session: str):
+    with db.connect() as conn:
+        conn.execute(
+            "INSERT INTO sessions (session, last_seen) VALUES (?, ?)"
+            " ON CONFLICT (session) DO UPDATE SET last_seen = excluded.last_seen",
+            (session, time.time()),
+        )
+
+
+def release_sources(before: float, limit: int) -> list[str]:
+    """Mark the sources of jobs Complete since before as released.
+
+    Returns their filenames, one per job, for the caller to release.
+    """
+    with db.connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT id, filename FROM jobs WHERE status = ? AND finished_at < ?"
+            " AND source_released_at IS NULL ORDER BY finished_at LIMIT ?",
+            (COMPLETE, before, limit),
+        ).fetchall()
+        conn.executemany(
+            "UPDATE jobs SET source_released_at = ? WHERE id = ?",
+            [(time.time(), row["id"]) for row in rows],
+        )
+    return [row["filename"] for row in rows]
+
+
+def abandoned_jobs(before: float, limit: int) -> list[str]:
+    """Finished jobs of sessions last seen before before.
+
+    Sessions from before sessions were tracked go by the job's own last
+    update. Session rows with no jobs left are dropped along the way.
+    """
+    with db.connect() as conn:
+        rows = conn.execute(
+            "SELECT j.id FROM jobs j LEFT JOIN sessions s ON s.session = j.session"
+            " WHERE j.status IN (?, ?) AND COALESCE(s.last_seen, j.updated_at) < ?"
+            " LIMIT ?",
+            (COMPLETE, ERROR, before, limit),
+        ).fetchall()
+        conn.execute(
+            "DELETE FROM sessions WHERE last_seen < ?"
+            " AND session NOT IN (SELECT session FROM jobs)",
+            (before,),
+        )
+    return [row["id"] for row in rows]
+
+
+def processing_job_ids() -> set[str]:
+    with db.connect() as conn:
+        rows = conn.execute(
+            "SELECT id FROM jobs WHERE status = ?", (PROCESSING,)
+        ).fetchall()
+    return {row["id"] for row in rows}
+
+
+def update_progress(
+    job_id: str, worker: str, progress: float, stats: Optional[dict] = None
+) -> bool:
+    """Record progress and refresh the job's heartbeat.
+
+    stats holds the job_stats columns speed, fps, eta_seconds and
+    projected_size. Progress is not a status change, so updated_at is left
+    alone. Returns False if the job no longer belongs to worker, which
+    means it was cancelled and the conversion should stop.
+    """
+    now = time.time()
+    with db.connect() as conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET progress = ?, heartbeat_at = ?"
+            " WHERE id = ? AND status = ? AND worker = ?",
+            (round(progress, 2), now, job_id, PROCESSING, worker),
+        )
+        if cursor.rowcount and stats is not None:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_stats (job_id, speed, fps,"
+                " eta_seconds, projected_size, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    stats.get("speed"),
+                    stats.get("fps"),
+                    stats.get("eta_seconds"),
+                    stats.get("projected_size"),
+                    now,
+                ),
+            )
+    return cursor.rowcount > 0
+
+
+def touch_jobs(worker: str, job_ids: list[str]) -> set[str]:
+    """Refresh the heartbeat of jobs worker is still working on.
+
+    Returns the ids that still belong to worker; the others were cancelled.
+    """
+    owned = set()
+    if not job_ids:
+        return owned
+    now = time.time()
+    with db.connect() as conn:
+        for job_id in job_ids:
+            cursor = conn.execute(
+                "UPDATE jobs SET heartbeat_at = ?"
+                " WHERE id = ? AND status = ? AND worker = ?",
+                (now, job_id, PROCESSING, worker),
+            )
+            if cursor.rowcount:
+                owned.add(job_id)
+    return owned
+
+
+def complete_job(
+    job_id: str,
+    worker: str,
+    converted_filename: str,
+    converted_size: int,
+    remuxed: bool,
+    outputs: Optional[list[dict]] = None,
+) -> bool:
+    """Mark a job Complete.
+
+    converted_filename, converted_size and remuxed describe the job's first
+    output; outputs lists all of them as dicts with the job_outputs columns
+    resolution, converted_filename, converted_size and remuxed. Returns
+    False if the job no longer belongs to worker, i.e. it was deleted or
+    requeued while running.
+    """
+    now = time.time()
+    with db.connect() as conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, progress = 100, converted_filename = ?,"
+            " converted_size = ?, remuxed = ?, finished_at = ?, updated_at = ?"
+            " WHERE id = ? AND status = ? AND worker = ?",
+            (
+                COMPLETE,
+                converted_filename,
+                converted_size,
+                int(remuxed),
+                now,
+                now,
+                job_id,
+                PROCESSING,
+                worker,
+            ),
+        )
+        if cursor.rowcount:
+            conn.execute("DELETE FROM job_stats WHERE job_id = ?", (job_id,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO job_outputs (job_id, position, resolution,"
+                " converted_filename, converted_size, remuxed)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        job_id,
+                        position,
+                        output["resolution"],
+                        output["converted_filename"],
+                        output["converted_size"],
+                        int(output["remuxed"]),
+                    )
+                    for position, output in enumerate(outputs or [])
+                ],
+            )
+    return cursor.rowcount > 0
+
+
+def fail_job(job_id: str, worker: str, error_message: str):
+    now = time.time()
+    with db.connect() as conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, error_message = ?, finished_at = ?,"
+            " updated_at = ? WHERE id = ? AND status = ? AND worker = ?",
+            (ERROR, error_message, now, now, job_id, PROCESSING, worker),
+        )
+        if cursor.rowcount:
+            conn.execute("DELETE FROM job_stats WHERE job_id = ?", (job_id,))
+
+
+def processing_workers() -> list[str]:
+    """Workers that currently own Processing jobs."""
+    with db.connect() as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT worker FROM jobs"
+            " WHERE status = ? AND worker IS NOT NULL",
+            (PROCESSING,),
+        ).fetchall()
+    return [row["worker"] for row in rows]
+
+
+def requeue_interrupted_jobs(
+    stale_after: float, dead_workers: Optional[list[str]] = None
+) -> list[str]:
+    """Put abandoned Processing jobs back in the queue.
+
+    A job is abandoned when its heartbeat is older than stale_after seconds
+    or its worker is listed in dead_workers. Returns the requeued job ids.
+    """
+    now = time.time()
+    dead_workers = dead_workers or []
+    with db.connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT id, worker FROM jobs WHERE status = ?"
+            " AND (heartbeat_at IS NULL OR heartbeat_at < ? OR worker IN"
+            f" ({', '.join('?' * len(dead_workers)) or 'NULL'}))",
+            (PROCESSING, now - stale_after, *dead_workers),
+        ).fetchall()
+        job_ids = [row["id"] for row in rows]
+        conn.executemany(
+            "UPDATE jobs SET status = ?, progress = 0, worker = NULL,"
+            " started_at = NULL, queued_at = ?, updated_at = ? WHERE id = ?",
+            [(QUEUED, now, now, job_id) for job_id in job_ids],
+        )
+    return job_ids
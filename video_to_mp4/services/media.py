@@ -0,0 +1,72 @@
+import logging
+from pathlib import Path
+from typing import Optional
+
+import ffmpeg
+
+# Containers whose H.264/AAC streams can be copied into MP4 unchanged.
+_REMUXABLE_FORMATS = {"mov", "mp4", "m4a", "3gp", "3g2", "mj2", "matroska", "webm"}
+
+
+def probe_media(path: Path) -> Optional[dict]:
+    """Run ffprobe on path, returning None if the file cannot be probed."""
+    try:
+        return ffmpeg.probe(str(path))
+    except Exception:
+        logging.exception(f"Failed to probe {path}")
+        return None
+
+
+def duration_from_probe(probe: Optional[dict]) -> Optional[float]:
+    if not probe:
+        return None
+    try:
+        if "format" in probe and "duration" in probe["format"]:
+            return float(probe["format"]["duration"])
+        for stream in probe.get("streams", []):
+            if "duration" in stream:
+                return float(stream["duration"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def start_time_from_probe(probe: Optional[dict]) -> float:
+    try:
+        return float(probe["format"]["start_time"])
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+
+def _video_streams(probe: dict) -> list[dict]:
+    return [
+        s
+        for s in probe.get("streams", [])
+        if s.get("codec_type") == "video"
+        and not s.get("disposition", {}).get("attached_pic")
+    ]
+
+
+def _audio_streams(probe: dict) -> list[dict]:
+    return [s for s in probe.get("streams", []) if s.get("codec_type") == "audio"]
+
+
+def can_remux(probe: Optional[dict], resolution_mode: str) -> bool:
+    """Whether the source can be stream-copied into MP4 without re-encoding.
+
+    True when the container is MOV/MP4/MKV, every video stream is H.264,
+    every audio stream is AAC and no scaling was requested.
+    """
+    if not probe or resolution_mode != "Original":
+        return False
+    format_names = set(probe.get("format", {}).get("format_name", "").split(","))
+    if not format_names & _REMUXABLE_FORMATS:
+        return False
+    video = _video_streams(probe)
+    if len(video) != 1 or video[0].get("codec_name") != "h264":
+        return False
+    return all(s.get("codec_name") == "aac" for s in _audio_streams(probe))
+
+
+def has_audio(probe: Optional[dict]) -> bool:
+    return bool(probe) and bool(_audio_streams(probe))
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Optional, TypedDict
+
+from video_to_mp4.services import db
+from video_to_mp4.services.media import duration_from_probe, probe_media
+
+# Bytes hashed from the start, middle and end of a file to fingerprint it.
+_SAMPLE_SIZE = 1024 * 1024
+
+db.register_schema(
+    """
+    CREATE TABLE IF NOT EXISTS media_index (
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        content_hash TEXT NOT NULL,
+        duration REAL,
+        format_name TEXT,
+        video_codec TEXT,
+        audio_codec TEXT,
+        width INTEGER,
+        height INTEGER,
+        frame_rate REAL,
+        video_bitrate INTEGER,
+        audio_bitrate INTEGER,
+        bit_rate INTEGER,
+        probe TEXT NOT NULL,
+        indexed_at REAL NOT NULL,
+        PRIMARY KEY (size, mtime_ns, content_hash)
+    );
+    """
+)
+
+
+class MediaInfo(TypedDict):
+    duration: Optional[float]
+    format_name: Optional[str]
+    video_codec: Optional[str]
+    audio_codec: Optional[str]
+    width: Optional[int]
+    height: Optional[int]
+    frame_rate: Optional[float]
+    video_bitrate: Optional[int]
+    audio_bitrate: Optional[int]
+    bit_rate: Optional[int]
+
+
+def content_fingerprint(path: Path, size: int) -> str:
+    """Hash of the file size plus samples from its start, middle and end.
+
+    Reading a bounded number of bytes keeps this O(1) in the file size.
+    """
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    offsets = {
+        0,
+        max(0, size // 2 - _SAMPLE_SIZE // 2),
+        max(0, size - _SAMPLE_SIZE),
+    }
+    with open(path, "rb") as f:
+        for offset in sorted(offsets):
+            f.seek(offset)
+            digest.update(f.read(_SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def file_identity(path: Path) -> tuple[int, int, str]:
+    stat = path.stat()
+    return stat.st_size, stat.st_mtime_ns, content_fingerprint(path, stat.st_size)
+
+
+def _to_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_rate(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        num, _, den = value.partition("/")
+        rate = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return round(rate, 3) if rate > 0 else None
+
+
+def media_info_from_probe(probe: dict) -> MediaInfo:
+    streams = probe.get("streams", [])
+    fmt = probe.get("format", {})
+    video = next(
+        (
+            s
+            for s in streams
+            if s.get("codec_type") == "video"
+            and not s.get("disposition", {}).get("attached_pic")
+        ),
+        {},
+    )
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+    return {
+        "duration": duration_from_probe(probe),
+        "format_name": fmt.get("format_name"),
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name"),
+        "width": _to_int(video.get("width")),
+        "height": _to_int(video.get("height")),
+        "frame_rate": _parse_rate(video.get("avg_frame_rate"))
+        or _parse_rate(video.get("r_frame_rate")),
+        "video_bitrate": _to_int(video.get("bit_rate")),
+        "audio_bitrate": _to_int(audio.get("bit_rate")),
+        "bit_rate": _to_int(fmt.get("bit_rate")),
+    }
+
+
+def _lookup(identity: tuple[int, int, str]) -> Optional[dict]:
+    with db.connect() as conn:
+        row = conn.execute(
+            "SELECT probe FROM media_index"
+            " WHERE size = ? AND mtime_ns = ? AND content_hash = ?",
+            identity,
+        ).fetchone()
+    return json.loads(row["probe"]) if row else None
+
+
+def _store(identity: tuple[int, int, str], probe: dict):
+    info = media_info_from_probe(probe)
+    columns = ["size", "mtime_ns", "content_hash", *info.keys(), "probe", "indexed_at"]
+    values = [*identity, *info.values(), json.dumps(probe), time.time()]
+    with db.connect() as conn:
+        conn.execute(
+            f"INSERT OR REPLACE INTO media_index ({', '.join(columns)})"
+            f" VALUES ({', '.join('?' * len(columns))})",
+            values,
+        )
+
+
+def get_probe(path: Path) -> Optional[dict]:
+    """Return ffprobe output for path, probing only on an index miss."""
+    identity = file_identity(path)
+    probe = _lookup(identity)
+    if probe is None:
+        probe = probe_media(path)
+        if probe is not None:
+            _store(identity, probe)
+    return probe
+
+
+def get_media_info(path: Path) -> Optional[MediaInfo]:
+    probe = get_probe(path)
+    return media_info_from_probe(probe) if probe else None
@@ -0,0 +1,216 @@
+"""Prometheus metrics for the job queue, the encoders and storage.
+
+Counters and histograms are kept in the SQLite database so that the web
+backend and every worker process add to the same series. The /metrics
+endpoint renders them together with gauges read at scrape time.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from video_to_mp4 import settings
+from video_to_mp4.services import db, job_store
+
+db.register_schema(
+    """
+    CREATE TABLE IF NOT EXISTS metrics (
+        name TEXT NOT NULL,
+        labels TEXT NOT NULL,
+        value REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (name, labels)
+    );
+    """
+)
+
+PREFIX = "video_to_mp4_"
+
+# Bucket bounds (seconds) of the queue wait and encode duration histograms.
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+
+# Type and help text of every metric, in the order they are rendered.
+_METRICS = {
+    "jobs": ("gauge", "Jobs in the store by status."),
+    "jobs_queued": ("gauge", "Jobs waiting for an encode slot."),
+    "jobs_running": ("gauge", "Jobs being converted."),
+    "queue_wait_seconds": (
+        "histogram",
+        "Time from upload until a runner started the job.",
+    ),
+    "encode_duration_seconds": (
+        "histogram",
+        "Wall time of conversions by how the output was produced.",
+    ),
+    "encoder_fps": (
+        "gauge",
+        "Frames per second summed over a worker's running encodes.",
+    ),
+    "encoder_speed": (
+        "gauge",
+        "Media seconds encoded per wall second, summed over a worker's"
+        " running encodes.",
+    ),
+    "jobs_completed_total": (
+        "counter",
+        "Completed jobs by how the output was produced.",
+    ),
+    "job_failures_total": ("counter", "Failed conversions by reason."),
+    "ingested_bytes_total": ("counter", "Bytes of source files uploaded."),
+    "produced_bytes_total": ("counter", "Bytes of MP4 output written."),
+    "upload_dir_bytes": ("gauge", "Bytes used by files in the upload directory."),
+    "upload_dir_files": ("gauge", "Files in the upload directory."),
+}
+
+# Gauges reported by runners; a series is dropped once its runner stops
+# refreshing it.
+_RUNNER_GAUGES = {"encoder_fps", "encoder_speed"}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    return ",".join(f'{key}="{_escape(labels[key])}"' for key in sorted(labels))
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _add(conn: sqlite3.Connection, name: str, labels: dict, amount: float):
+    conn.execute(
+        "INSERT INTO metrics (name, labels, value, updated_at) VALUES (?, ?, ?, ?)"
+        " ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value,"
+        " updated_at = excluded.updated_at",
+        (name, _format_labels(labels), amount, time.time()),
+    )
+
+
+def inc(name: str, amount: float = 1.0, **labels):
+    """Add amount to a counter.
+
+    Telemetry must never fail the work it measures, so database errors are
+    logged and dropped here and in the other recording functions.
+    """
+    try:
+        with db.connect() as conn:
+            _add(conn, name, labels, amount)
+    except sqlite3.Error:
+        logging.exception(f"Failed to record metric {name}")
+
+
+def observe(name: str, value: float, buckets=DURATION_BUCKETS, **labels):
+    """Record one observation in a histogram."""
+    try:
+        with db.connect() as conn:
+            # Every bucket gets a row, so that all of them are exported.
+            for bound in (*buckets, math.inf):
+                _add(
+                    conn,
+                    f"{name}_bucket",
+                    {**labels, "le": _format_value(bound)},
+                    1 if value <= bound else 0,
+                )
+            _add(conn, f"{name}_sum", labels, value)
+            _add(conn, f"{name}_count", labels, 1)
+    except sqlite3.Error:
+        logging.exception(f"Failed to record metric {name}")
+
+
+def set_gauge(name: str, value: float, **labels):
+    try:
+        with db.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO metrics (name, labels, value, updated_at)"
+                " VALUES (?, ?, ?, ?)",
+                (name, _format_labels(labels), value, time.time()),
+            )
+    except sqlite3.Error:
+        logging.exception(f"Failed to record metric {name}")
+
+
+def _upload_dir_usage(upload_dir: Path) -> tuple[int, int]:
+    total = files = 0
+    try:
+        entries = list(os.scandir(upload_dir))
+    except FileNotFoundError:
+        return 0, 0
+    for entry in entries:
+        try:
+            if entry.is_file():
+                total += entry.stat().st_size
+                files += 1
+        except FileNotFoundError:
+            continue
+    return total, files
+
+
+def _family(series_name: str) -> str:
+    for suffix in ("_bucket", "_sum", "_count"):
+        if series_name.endswith(suffix) and series_name[: -len(suffix)] in _METRICS:
+            return series_name[: -len(suffix)]
+    return series_name
+
+
+def _series_order(row) -> tuple:
+    # Histogram buckets must come out in increasing le order.
+    labels = row["labels"]
+    le = math.inf
+    if 'le="' in labels:
+        bound = labels.split('le="', 1)[1].split('"', 1)[0]
+        le = float(bound.replace("+Inf", "inf"))
+        labels = labels.replace(f'le="{bound}"', "")
+    suffix = ("_bucket", "_sum", "_count")
+    kind = next((i for i, s in enumerate(suffix) if row["name"].endswith(s)), 0)
+    return labels, kind, le
+
+
+def render(upload_dir: Path) -> str:
+    """All metrics in the Prometheus text exposition format."""
+    by_status = job_store.count_by_status()
+    used_bytes, used_files = _upload_dir_usage(upload_dir)
+    with db.connect() as conn:
+        rows = conn.execute("SELECT * FROM metrics").fetchall()
+    stale_before = time.time() - settings.JOB_STALE_AFTER
+    series: dict[str, list[tuple[str, str, float]]] = {name: [] for name in _METRICS}
+    for status in (
+        job_store.QUEUED,
+        job_store.PROCESSING,
+        job_store.COMPLETE,
+        job_store.ERROR,
+    ):
+        series["jobs"].append(
+            ("jobs", _format_labels({"status": status}), by_status.get(status, 0))
+        )
+    series["jobs_queued"].append(
+        ("jobs_queued", "", by_status.get(job_store.QUEUED, 0))
+    )
+    series["jobs_running"].append(
+        ("jobs_running", "", by_status.get(job_store.PROCESSING, 0))
+    )
+    series["upload_dir_bytes"].append(("upload_dir_bytes", "", used_bytes))
+    series["upload_dir_files"].append(("upload_dir_files", "", used_files))
+    for row in sorted(rows, key=_series_order):
+        family = _family(row["name"])
+        if family not in series:
+            continue
+        if family in _RUNNER_GAUGES and row["updated_at"] < stale_before:
+            continue
+        series[family].append((row["name"], row["labels"], row["value"]))
+    lines = []
+    for family, (kind, help_text) in _METRICS.items():
+        lines.append(f"# HELP {PREFIX}{family} {help_text}")
+        lines.append(f"# TYPE {PREFIX}{family} {kind}")
+        for name, labels, value in series[family]:
+            labels = f"{{{labels}}}" if labels else ""
+            lines.append(f"{PREFIX}{name}{labels} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
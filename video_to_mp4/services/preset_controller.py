@@ -0,0 +1,108 @@
+"""Load-adaptive choice of the x264 preset.
+
+When the queue backs up, jobs are encoded with a faster preset than their
+quality option asks for so that queued work still finishes within the
+turnaround target. CRF is left alone, so the visual quality target holds
+and the faster presets cost file size instead. Once the backlog clears,
+jobs go back to their own preset.
+"""
+
+import math
+import threading
+import time
+from typing import Optional
+
+# x264 presets from fastest to slowest.
+PRESETS = [
+    "ultrafast",
+    "superfast",
+    "veryfast",
+    "faster",
+    "fast",
+    "medium",
+    "slow",
+    "slower",
+    "veryslow",
+]
+
+# Rough encode speed of each preset relative to medium. Only the ratios
+# matter; the absolute speed is measured from finished encodes.
+_RELATIVE_SPEED = {
+    "ultrafast": 8.0,
+    "superfast": 5.5,
+    "veryfast": 3.5,
+    "faster": 2.2,
+    "fast": 1.5,
+    "medium": 1.0,
+    "slow": 0.6,
+    "slower": 0.3,
+    "veryslow": 0.12,
+}
+
+# Media seconds encoded per wall second by one medium-preset thread, used
+# until the first encode has been measured.
+_DEFAULT_SPEED = 0.5
+
+# Weight of the newest measurement in the moving averages.
+_SMOOTHING = 0.3
+
+
+def _smooth(average: Optional[float], value: float) -> float:
+    if average is None:
+        return value
+    return average + _SMOOTHING * (value - average)
+
+
+class PresetController:
+    """Picks the slowest preset that keeps turnaround under target_seconds.
+
+    Speed is tracked as media seconds per wall second for one encoder
+    thread at the medium preset, averaged over finished encodes.
+    """
+
+    def __init__(self, target_seconds: float):
+        self.target_seconds = target_seconds
+        self._speed: Optional[float] = None
+        self._job_duration: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _encode_time(self, preset: str, duration: float, threads: int) -> float:
+        speed = self._speed or _DEFAULT_SPEED
+        return duration / (speed * _RELATIVE_SPEED[preset] * max(1, threads))
+
+    def choose(
+        self,
+        preset: str,
+        duration: Optional[float],
+        threads: int,
+        backlog: int,
+        slots: int,
+        queued_at: float,
+    ) -> str:
+        """Preset to encode a job with, never slower than the requested one.
+
+        The estimate covers both the job itself, which has already waited
+        since queued_at, and the backlog queued behind it, which is
+        assumed to run slots at a time with jobs of typical length.
+        """
+        if preset not in _RELATIVE_SPEED or not duration:
+            return preset
+        with self._lock:
+            typical = self._job_duration or duration
+            waves = math.ceil((backlog + 1) / max(1, slots))
+            waited = time.time() - queued_at
+            for candidate in reversed(PRESETS[: PRESETS.index(preset) + 1]):
+                own = waited + self._encode_time(candidate, duration, threads)
+                queue = waves * self._encode_time(candidate, typical, threads)
+                if max(own, queue) <= self.target_seconds:
+                    return candidate
+        return PRESETS[0]
+
+    def record(self, preset: str, duration: float, threads: int, seconds: float):
+        """Feed back a finished encode of duration media seconds."""
+        if preset not in _RELATIVE_SPEED or duration <= 0 or seconds <= 0:
+            return
+        speed = duration / seconds / _RELATIVE_SPEED[preset] / max(1, threads)
+        with self._lock:
+            self._speed = _smooth(self._speed, speed)
+            self._job_duration = _smooth(self._job_duration, duration)
@@ -0,0 +1,165 @@
+"""Thumbnails and sprite sheets of uploaded sources.
+
+Previews decode keyframes only (-skip_frame nokey), which keeps them cheap
+on large inputs, and are cached on disk under the source's file identity.
+They are generated on first request by a small thread pool of their own
+running single-threaded, low-priority ffmpeg, so they stay out of the way
+of the encode queue.
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import os
+import secrets
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import ffmpeg
+
+from video_to_mp4 import settings
+from video_to_mp4.services.media import duration_from_probe
+from video_to_mp4.services.media_index import file_identity, get_probe
+
+THUMBNAIL = "thumbnail"
+SPRITE = "sprite"
+KINDS = (THUMBNAIL, SPRITE)
+
+_THUMBNAIL_WIDTH = 320
+# Point in the input, as a share of its duration, the thumbnail is taken at.
+_THUMBNAIL_POSITION = 0.1
+
+# Sprite sheets are a grid of evenly spaced frames.
+_SPRITE_COLUMNS = 5
+_SPRITE_ROWS = 5
+_SPRITE_TILE_WIDTH = 160
+
+# Seconds one preview may take before ffmpeg is stopped.
+_TIMEOUT = 120
+# Seconds a failed generation is remembered before it is tried again, so
+# a passing failure (memory pressure, a killed ffmpeg) is not permanent.
+_FAILURE_TTL = 3600
+
+_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=settings.PREVIEW_WORKERS, thread_name_prefix="preview"
+)
+# Generations queued or running, by cache path.
+_pending: dict[Path, concurrent.futures.Future] = {}
+_pending_lock = threading.Lock()
+
+
+def _cache_path(source: Path, kind: str) -> Path:
+    size, mtime_ns, fingerprint = file_identity(source)
+    key = hashlib.blake2b(
+        f"{size}:{mtime_ns}:{fingerprint}".encode(), digest_size=16
+    ).hexdigest()
+    return settings.PREVIEW_DIR / f"{key}_{kind}.jpg"
+
+
+def _lower_priority():
+    os.nice(10)
+
+
+def _thumbnail(source: Path, duration: Optional[float]):
+    seek = (duration or 0) * _THUMBNAIL_POSITION
+    return ffmpeg.input(
+        str(source), ss=seek, skip_frame="nokey", threads=1
+    ).filter("scale", _THUMBNAIL_WIDTH, -2)
+
+
+def _sprite(source: Path, duration: Optional[float]):
+    frames = _SPRITE_COLUMNS * _SPRITE_ROWS
+    interval = (duration or frames * 10) / frames
+    return (
+        ffmpeg.input(str(source), skip_frame="nokey", threads=1)
+        # Repeats or drops keyframes to land one frame on every interval.
+        .filter("fps", f"1/{interval:.3f}")
+        .filter("scale", _SPRITE_TILE_WIDTH, -2)
+        .filter("tile", f"{_SPRITE_COLUMNS}x{_SPRITE_ROWS}")
+    )
+
+
+def _generate(source: Path, kind: str, path: Path):
+    duration = duration_from_probe(get_probe(source))
+    stream = _thumbnail(source, duration) if kind == THUMBNAIL else _sprite(
+        source, duration
+    )
+    temp_path = path.with_name(f".{path.stem}_{secrets.token_hex(4)}.jpg")
+    args = (
+        stream.output(str(temp_path), vframes=1, threads=1, **{"q:v": 4})
+        .global_args("-loglevel", "error")
+        .overwrite_output()
+        .compile()
+    )
+    try:
+        subprocess.run(
+            args,
+            capture_output=True,
+            check=True,
+            timeout=_TIMEOUT,
+            preexec_fn=_lower_priority if hasattr(os, "nice") else None,
+        )
+        if not temp_path.exists():
+            raise RuntimeError("ffmpeg wrote no frame")
+        os.replace(temp_path, path)
+        path.with_suffix(".failed").unlink(missing_ok=True)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def _failed_recently(path: Path) -> bool:
+    marker = path.with_suffix(".failed")
+    try:
+        return time.time() - marker.stat().st_mtime < _FAILURE_TTL
+    except FileNotFoundError:
+        return False
+
+
+def _build(source: Path, kind: str, path: Path) -> Optional[Path]:
+    if path.exists():
+        return path
+    settings.PREVIEW_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        _generate(source, kind, path)
+    except (OSError, RuntimeError, subprocess.SubprocessError, ffmpeg.Error):
+        logging.exception(f"Failed to generate {kind} for {source.name}")
+        # Remember the failure so the same file is not retried on every view.
+        path.with_suffix(".failed").touch()
+        return None
+    return path
+
+
+def _submit(source: Path, kind: str, path: Path) -> concurrent.futures.Future:
+    with _pending_lock:
+        future = _pending.get(path)
+        if future is not None:
+            return future
+        future = _pool.submit(_build, source, kind, path)
+        _pending[path] = future
+    future.add_done_callback(lambda done: _forget(path, done))
+    return future
+
+
+def _forget(path: Path, future: concurrent.futures.Future):
+    with _pending_lock:
+        if _pending.get(path) is future:
+            del _pending[path]
+
+
+async def get_preview(source: Path, kind: str) -> Optional[Path]:
+    """Path of the cached kind preview of source, generating it if missing.
+
+    Returns None when no preview can be made, e.g. for audio-only inputs.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown preview kind {kind}")
+    path = await asyncio.to_thread(_cache_path, source, kind)
+    if path.exists():
+        return path
+    if _failed_recently(path):
+        return None
+    return await asyncio.wrap_future(_submit(source, kind, path))
@@ -0,0 +1,92 @@
+import threading
+import time
+from typing import Callable, Optional
+
+
+class ProgressThrottle:
+    """Forwards progress values to callback at most hz times per second.
+
+    Intermediate values are dropped; callers publish the final state
+    themselves when the work finishes. Safe to call from several threads.
+    """
+
+    def __init__(self, callback: Callable[[float], None], hz: float):
+        self._callback = callback
+        self._interval = 1.0 / hz if hz > 0 else 0.0
+        self._last_sent = float("-inf")
+        self._lock = threading.Lock()
+
+    def __call__(self, value: float):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sent < self._interval:
+                return
+            self._last_sent = now
+        self._callback(value)
+
+
+class ProgressEstimator:
+    """Smoothed encode speed, ETA and projected output size of one job.
+
+    Fed with the job's progress percentages and ffmpeg's progress reports
+    (dicts with fps, speed, total_size and out_time), possibly from several
+    threads. With the input's duration the output size is projected from
+    how much media has been written, which stays right when the progress
+    percentage also covers other work such as a first encoding pass.
+    """
+
+    def __init__(self, duration: Optional[float] = None, smoothing: float = 0.2):
+        self._duration = duration
+        self._smoothing = smoothing
+        self._lock = threading.Lock()
+        self._last: Optional[tuple[float, float]] = None
+        self._rate: Optional[float] = None
+        self._percent = 0.0
+        self._speed: Optional[float] = None
+        self._fps: Optional[float] = None
+        self._total_size: Optional[int] = None
+        self._out_time = 0.0
+
+    def _smooth(self, average: Optional[float], value: float) -> float:
+        if average is None:
+            return value
+        return average + self._smoothing * (value - average)
+
+    def add_progress(self, percent: float):
+        now = time.monotonic()
+        with self._lock:
+            if self._last is not None:
+                last_time, last_percent = self._last
+                if now > last_time and percent >= last_percent:
+                    rate = (percent - last_percent) / (now - last_time)
+                    self._rate = self._smooth(self._rate, rate)
+            self._last = (now, percent)
+            self._percent = percent
+
+    def add_stats(self, stats: dict):
+        with self._lock:
+            if stats.get("speed") is not None:
+                self._speed = self._smooth(self._speed, stats["speed"])
+            if stats.get("fps") is not None:
+                self._fps = self._smooth(self._fps, stats["fps"])
+            if stats.get("total_size"):
+                self._total_size = stats["total_size"]
+                self._out_time = stats.get("out_time") or 0.0
+
+    def snapshot(self) -> dict:
+        """Current speed, fps, eta_seconds and projected_size; None if unknown."""
+        with self._lock:
+            eta = None
+            if self._rate:
+                eta = max(0.0, (100.0 - self._percent) / self._rate)
+            projected = None
+            if self._total_size and self._duration and self._out_time >= 1.0:
+                projected = int(self._total_size * self._duration / self._out_time)
+            elif self._total_size and self._percent >= 1.0:
+                projected = int(self._total_size * 100.0 / self._percent)
+            return {
+                "speed": self._speed,
+                "fps": self._fps,
+                "eta_seconds": eta,
+                "projected_size": projected,
+            }
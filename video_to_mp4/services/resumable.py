@@ -0,0 +1,205 @@
+"""Resumable uploads, following the core and creation parts of tus 1.0.
+
+A client creates an upload with its total length and then sends the bytes
+as offset-addressed chunks. Chunks are written at their offset in the
+upload's file with positional writes, and the committed offset is only
+advanced once the bytes are on disk. A client whose connection dropped
+asks for the offset and continues from there instead of starting over.
+Finished uploads are moved into the blob store like any other upload.
+"""
+
+import asyncio
+import os
+import secrets
+import time
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from video_to_mp4.services import blob_store, containers, db
+from video_to_mp4.services.uploads import UPLOAD_CHUNK_SIZE
+
+db.register_schema(
+    """
+    CREATE TABLE IF NOT EXISTS resumable_uploads (
+        id TEXT PRIMARY KEY,
+        filename TEXT NOT NULL,
+        length INTEGER NOT NULL,
+        committed INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    """
+)
+
+
+class UploadNotFound(Exception):
+    """Raised for an upload id that does not exist (any more)."""
+
+
+class OffsetMismatch(Exception):
+    """Raised when a chunk does not start at the committed offset."""
+
+    def __init__(self, committed: int):
+        super().__init__(f"Upload is at offset {committed}")
+        self.committed = committed
+
+
+class UploadIncomplete(Exception):
+    """Raised when finishing an upload that still misses bytes."""
+
+
+def upload_path(upload_dir: Path, upload_id: str) -> Path:
+    return upload_dir / f".resumable_{upload_id}.part"
+
+
+def create_upload(upload_dir: Path, filename: str, length: int) -> str:
+    """Start an upload of length bytes; returns its id."""
+    upload_id = secrets.token_hex(16)
+    upload_path(upload_dir, upload_id).touch(exist_ok=False)
+    now = time.time()
+    with db.connect() as conn:
+        conn.execute(
+            "INSERT INTO resumable_uploads"
+            " (id, filename, length, committed, created_at, updated_at)"
+            " VALUES (?, ?, ?, 0, ?, ?)",
+            (upload_id, filename, length, now, now),
+        )
+    return upload_id
+
+
+def get_upload(upload_id: str) -> Optional[dict]:
+    with db.connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM resumable_uploads WHERE id = ?", (upload_id,)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def reserved_bytes() -> int:
+    """Bytes unfinished uploads hold and will hold once complete."""
+    with db.connect() as conn:
+        return conn.execute(
+            "SELECT COALESCE(SUM(length), 0) FROM resumable_uploads"
+        ).fetchone()[0]
+
+
+def _pwrite_all(fd: int, data: bytes, position: int):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, position)
+        view = view[written:]
+        position += written
+
+
+def _commit(upload_id: str, offset: int, committed: int) -> int:
+    """Advance the committed offset of an upload from offset."""
+    with db.connect() as conn:
+        cursor = conn.execute(
+            "UPDATE resumable_uploads SET committed = ?, updated_at = ?"
+            " WHERE id = ? AND committed = ?",
+            (committed, time.time(), upload_id, offset),
+        )
+    if cursor.rowcount == 0:
+        # Another request for the same offset got there first.
+        upload = get_upload(upload_id)
+        if upload is None:
+            raise UploadNotFound(upload_id)
+        raise OffsetMismatch(upload["committed"])
+    return committed
+
+
+async def write_chunk(
+    upload_dir: Path, upload_id: str, offset: int, body: AsyncIterator[bytes]
+) -> int:
+    """Write a request body at offset; returns the new committed offset.
+
+    Whatever arrived before the body broke off is kept and committed, so
+    the client resends only what is missing. Once the first SNIFF_BYTES
+    are in, an upload that is not a supported container is dropped with
+    InvalidContainer.
+    """
+    upload = await asyncio.to_thread(get_upload, upload_id)
+    if upload is None:
+        raise UploadNotFound(upload_id)
+    if offset != upload["committed"]:
+        raise OffsetMismatch(upload["committed"])
+    head_size = min(containers.SNIFF_BYTES, upload["length"])
+    fd = os.open(upload_path(upload_dir, upload_id), os.O_RDWR)
+    position = offset
+    pending = bytearray()
+    try:
+        async for chunk in body:
+            if position + len(pending) + len(chunk) > upload["length"]:
+                raise ValueError("Chunk runs past the upload length")
+            pending += chunk
+            if len(pending) >= UPLOAD_CHUNK_SIZE:
+                await asyncio.to_thread(_pwrite_all, fd, bytes(pending), position)
+                position += len(pending)
+                pending.clear()
+    finally:
+        try:
+            if pending:
+                await asyncio.to_thread(_pwrite_all, fd, bytes(pending), position)
+                position += len(pending)
+            if position > offset:
+                await asyncio.to_thread(os.fdatasync, fd)
+            if offset < head_size <= position:
+                head = await asyncio.to_thread(os.pread, fd, head_size, 0)
+        finally:
+            os.close(fd)
+        if offset < head_size <= position:
+            try:
+                containers.check_head(head)
+            except containers.InvalidContainer:
+                await asyncio.to_thread(delete_upload, upload_dir, upload_id)
+                raise
+        if position > offset:
+            await asyncio.to_thread(_commit, upload_id, offset, position)
+    return position
+
+
+def delete_upload(upload_dir: Path, upload_id: str) -> bool:
+    """Drop an upload and its bytes; False if it did not exist."""
+    with db.connect() as conn:
+        cursor = conn.execute(
+            "DELETE FROM resumable_uploads WHERE id = ?", (upload_id,)
+        )
+    upload_path(upload_dir, upload_id).unlink(missing_ok=True)
+    return cursor.rowcount > 0
+
+
+def finish_upload(upload_dir: Path, upload_id: str) -> tuple[str, int, str]:
+    """Move a fully received upload into the blob store.
+
+    Returns (stored_name, size, content_hash) like ingest_upload, with the
+    caller owning one reference to the blob.
+    """
+    with db.connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM resumable_uploads WHERE id = ?", (upload_id,)
+        ).fetchone()
+        if row is None:
+            raise UploadNotFound(upload_id)
+        if row["committed"] != row["length"]:
+            raise UploadIncomplete(
+                f"Upload has {row['committed']} of {row['length']} bytes"
+            )
+        conn.execute("DELETE FROM resumable_uploads WHERE id = ?", (upload_id,))
+    path = upload_path(upload_dir, upload_id)
+    try:
+        containers.check_complete(path)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return blob_store.adopt_file(path, upload_dir, row["filename"])
+
+
+def expired_uploads(before: float, limit: int) -> list[str]:
+    """Ids of uploads that received nothing since before."""
+    with db.connect() as conn:
+        rows = conn.execute(
+            "SELECT id FROM resumable_uploads WHERE updated_at < ?"
+            " ORDER BY updated_at LIMIT ?",
+            (before, limit),
+        ).fetchall()
+    return [row["id"] for row in rows]
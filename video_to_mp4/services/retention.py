@@ -0,0 +1,146 @@
+"""Retention sweeper for the upload directory.
+
+Files nobody will ask for again are deleted on a timer: uploads staged in
+a confirm dialog that was never answered, resumable uploads that stopped
+receiving chunks, temporary files of interrupted uploads and conversions,
+sources of jobs that completed a while ago, and finished jobs of browser
+sessions that have gone away. Every step claims
+its rows in the database before deleting anything, so sweeps are safe
+next to running jobs and to sweepers of other processes.
+
+Deletions go in batches paced to RETENTION_DELETE_RATE files per second,
+so that unlinking many large files does not take disk bandwidth from
+running encodes all at once.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+
+import reflex as rx
+
+from video_to_mp4 import settings
+from video_to_mp4.services import blob_store, job_store, resumable
+
+
+def release_job_files(upload_dir: Path, job: dict):
+    """Release the source and outputs held by a job returned by delete_job."""
+    if job["filename"] and not job["source_released_at"]:
+        blob_store.release_blob(upload_dir, job["filename"])
+    for converted_filename in job["outputs"]:
+        blob_store.release_output(upload_dir, converted_filename)
+
+
+def _sweep_stages(upload_dir: Path, before: float, limit: int) -> int:
+    stages = blob_store.expired_stages(before, limit)
+    for stage in stages:
+        # The dialog may have been answered since the stage was listed.
+        if blob_store.unstage_blob(stage["id"]):
+            blob_store.release_blob(upload_dir, stage["stored_name"])
+    return len(stages)
+
+
+def _sweep_resumable(upload_dir: Path, before: float, limit: int) -> int:
+    upload_ids = resumable.expired_uploads(before, limit)
+    for upload_id in upload_ids:
+        resumable.delete_upload(upload_dir, upload_id)
+    return len(upload_ids)
+
+
+def _sweep_sources(upload_dir: Path, before: float, limit: int) -> int:
+    stored_names = job_store.release_sources(before, limit)
+    for stored_name in stored_names:
+        blob_store.release_blob(upload_dir, stored_name)
+    return len(stored_names)
+
+
+def _sweep_sessions(upload_dir: Path, before: float, limit: int) -> int:
+    job_ids = job_store.abandoned_jobs(before, limit)
+    for job_id in job_ids:
+        job = job_store.delete_job(job_id)
+        if job:
+            release_job_files(upload_dir, job)
+    return len(job_ids)
+
+
+def _stale_temp_files(upload_dir: Path, before: float) -> list[Path]:
+    """Interrupted upload and output temp files last written before before."""
+    processing = job_store.processing_job_ids()
+    try:
+        entries = list(os.scandir(upload_dir))
+    except FileNotFoundError:
+        return []
+    stale = []
+    for entry in entries:
+        name = entry.name
+        if name.startswith(".partial_"):
+            if any(
+                name.startswith((f".partial_{job_id}.", f".partial_{job_id}_"))
+                for job_id in processing
+            ):
+                continue
+        elif not (name.startswith(".upload_") and name.endswith(".part")):
+            continue
+        try:
+            if entry.stat().st_mtime >= before:
+                continue
+        except FileNotFoundError:
+            continue
+        stale.append(Path(entry.path))
+    return stale
+
+
+def _unlink_all(paths: list[Path]):
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+async def _pause(count: int):
+    await asyncio.sleep(count / settings.RETENTION_DELETE_RATE)
+
+
+async def sweep(upload_dir: Path) -> int:
+    """Run one retention pass; returns the number of jobs and files swept."""
+    now = time.time()
+    batch = settings.RETENTION_DELETE_RATE
+    steps = []
+    if settings.STAGED_TTL:
+        steps.append((_sweep_stages, now - settings.STAGED_TTL))
+        steps.append((_sweep_resumable, now - settings.STAGED_TTL))
+    if settings.SOURCE_TTL:
+        steps.append((_sweep_sources, now - settings.SOURCE_TTL))
+    if settings.SESSION_TTL:
+        steps.append((_sweep_sessions, now - settings.SESSION_TTL))
+    swept = 0
+    for step, before in steps:
+        while True:
+            count = await asyncio.to_thread(step, upload_dir, before, batch)
+            swept += count
+            await _pause(count)
+            if count < batch:
+                break
+    if settings.STAGED_TTL:
+        stale = await asyncio.to_thread(
+            _stale_temp_files, upload_dir, now - settings.STAGED_TTL
+        )
+        for start in range(0, len(stale), batch):
+            chunk = stale[start : start + batch]
+            await asyncio.to_thread(_unlink_all, chunk)
+            swept += len(chunk)
+            await _pause(len(chunk))
+    if swept:
+        logging.info(f"Retention sweep removed {swept} jobs and files")
+    return swept
+
+
+async def run_retention_sweeper():
+    """Lifespan task sweeping the upload directory every RETENTION_INTERVAL."""
+    upload_dir = rx.get_upload_dir()
+    while True:
+        try:
+            await sweep(upload_dir)
+        except Exception:
+            logging.exception("Retention sweep failed")
+        await asyncio.sleep(settings.RETENTION_INTERVAL)
@@ -0,0 +1,220 @@
+"""Split-encode-concat conversion for long inputs.
+
+The source is cut at keyframes into segments that are encoded by parallel
+ffmpeg processes, then joined without re-encoding by the concat demuxer.
+Audio is encoded once over the whole file alongside the video segments so
+there are no AAC priming gaps at the segment joins.
+"""
+
+import logging
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+import ffmpeg
+
+from video_to_mp4 import settings
+from video_to_mp4.services.transcode import (
+    FASTSTART,
+    EncodeStats,
+    run_ffmpeg,
+    run_ffmpeg_output,
+    scale_stream,
+)
+
+# How far past a target cut point (seconds) to look for the next keyframe.
+_KEYFRAME_SEARCH_WINDOW = 20
+
+
+def _next_keyframe(
+    input_path: Path, target: float, start_time: float
+) -> Optional[float]:
+    """Timestamp of the first video keyframe at or after target seconds."""
+    try:
+        probe = ffmpeg.probe(
+            str(input_path),
+            select_streams="v:0",
+            read_intervals=f"{target + start_time}%+{_KEYFRAME_SEARCH_WINDOW}",
+            show_entries="packet=pts_time,flags",
+        )
+    except ffmpeg.Error:
+        logging.exception(f"Keyframe scan failed for {input_path} at {target}s")
+        return None
+    for packet in probe.get("packets", []):
+        if "K" not in packet.get("flags", ""):
+            continue
+        try:
+            pts = float(packet["pts_time"]) - start_time
+        except (KeyError, ValueError):
+            continue
+        if pts >= target:
+            return pts
+    return None
+
+
+def keyframe_boundaries(
+    input_path: Path,
+    duration_seconds: float,
+    segment_count: int,
+    start_time: float = 0.0,
+) -> list[float]:
+    """Cut points for segment_count roughly equal segments, snapped to keyframes.
+
+    Returns an increasing list starting at 0 and ending at duration_seconds.
+    Cut points that would produce segments shorter than SEGMENT_MIN_LENGTH
+    are dropped, so fewer segments than requested may come back.
+    """
+    min_length = settings.SEGMENT_MIN_LENGTH
+    boundaries = [0.0]
+    for i in range(1, segment_count):
+        target = max(duration_seconds * i / segment_count, boundaries[-1] + min_length)
+        keyframe = _next_keyframe(input_path, target, start_time)
+        if keyframe is None or keyframe > duration_seconds - min_length:
+            break
+        boundaries.append(keyframe)
+    boundaries.append(duration_seconds)
+    return boundaries
+
+
+class _SegmentProgress:
+    """Combines per-segment progress into one percentage of the whole file.
+
+    Encoder stats are combined too: fps and speed add up over the segments
+    still encoding, sizes over all of them.
+    """
+
+    def __init__(
+        self,
+        duration_seconds: float,
+        callback: Optional[Callable],
+        stats_callback: Optional[Callable[[EncodeStats], None]] = None,
+    ):
+        self._duration = duration_seconds
+        self._callback = callback
+        self._stats_callback = stats_callback
+        self._done: dict[int, float] = {}
+        self._stats: dict[int, EncodeStats] = {}
+        self._lock = threading.Lock()
+
+    def for_segment(self, index: int, length: float):
+        def update(pct: float):
+            with self._lock:
+                self._done[index] = length * pct / 100
+                total = sum(self._done.values())
+            if self._callback:
+                self._callback(min(99.99, total / self._duration * 100))
+
+        return update
+
+    def stats_for_segment(self, index: int):
+        if self._stats_callback is None:
+            return None
+
+        def update(stats: EncodeStats):
+            with self._lock:
+                self._stats[index] = stats
+                running = [s for s in self._stats.values() if not s["finished"]]
+                combined: EncodeStats = {
+                    "fps": sum(s["fps"] or 0.0 for s in running),
+                    "speed": sum(s["speed"] or 0.0 for s in running),
+                    "bitrate_kbps": None,
+                    "total_size": sum(
+                        s["total_size"] or 0 for s in self._stats.values()
+                    ),
+                    "out_time": sum(s["out_time"] for s in self._stats.values()),
+                    "finished": False,
+                }
+            self._stats_callback(combined)
+
+        return update
+
+
+def _concat_list_line(path: Path) -> str:
+    escaped = str(path).replace("'", "'\\''")
+    return f"file '{escaped}'\n"
+
+
+def run_segmented_encode(
+    input_path: Path,
+    output_path: Path,
+    resolution_mode: str,
+    crf: int,
+    preset: str,
+    duration_seconds: float,
+    progress_callback: Optional[Callable],
+    workers: int,
+    include_audio: bool,
+    start_time: float = 0.0,
+    work_prefix: str = "segments_",
+    cancel: Optional[threading.Event] = None,
+    stats_callback: Optional[Callable[[EncodeStats], None]] = None,
+):
+    """Encode input_path to output_path using up to workers ffmpeg processes.
+
+    The thread pool only supervises the ffmpeg subprocesses, which do the
+    actual encoding in parallel. Each encoder runs single-threaded so that
+    the workers together use about one core each. Setting cancel stops all
+    of them.
+    """
+    # Twice as many segments as workers evens out differences in how hard
+    # each part of the video is to encode.
+    boundaries = keyframe_boundaries(
+        input_path, duration_seconds, workers * 2, start_time
+    )
+    segments = list(zip(boundaries, boundaries[1:]))
+    settings.WORK_DIR.mkdir(parents=True, exist_ok=True)
+    work_dir = Path(tempfile.mkdtemp(prefix=work_prefix, dir=settings.WORK_DIR))
+    progress = _SegmentProgress(duration_seconds, progress_callback, stats_callback)
+    try:
+        segment_paths = [
+            work_dir / f"segment_{i:04d}.mkv" for i in range(len(segments))
+        ]
+        audio_path = work_dir / "audio.m4a"
+        with ThreadPoolExecutor(max_workers=workers + 1) as pool:
+            futures = []
+            if include_audio:
+                audio = ffmpeg.input(str(input_path)).audio
+                futures.append(
+                    pool.submit(
+                        run_ffmpeg_output,
+                        ffmpeg.output(audio, str(audio_path), acodec="aac"),
+                        cancel,
+                    )
+                )
+            for i, (start, end) in enumerate(segments):
+                # Cutting a hair before the next keyframe keeps the boundary
+                # frame out of this segment; it starts the next one.
+                source = ffmpeg.input(
+                    str(input_path), ss=start, t=end - start - 0.001
+                )
+                stream = scale_stream(source.video, resolution_mode)
+                futures.append(
+                    pool.submit(
+                        run_ffmpeg,
+                        stream,
+                        segment_paths[i],
+                        crf,
+                        preset,
+                        end - start,
+                        progress.for_segment(i, end - start),
+                        threads=1,
+                        cancel=cancel,
+                        stats_callback=progress.stats_for_segment(i),
+                    )
+                )
+            for future in futures:
+                future.result()
+        list_path = work_dir / "segments.txt"
+        list_path.write_text("".join(_concat_list_line(p) for p in segment_paths))
+        streams = [ffmpeg.input(str(list_path), f="concat", safe=0).video]
+        if include_audio:
+            streams.append(ffmpeg.input(str(audio_path)).audio)
+        run_ffmpeg_output(
+            ffmpeg.output(*streams, str(output_path), c="copy", movflags=FASTSTART),
+            cancel,
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,382 @@
+import collections
+import os
+import re
+import subprocess
+import threading
+from pathlib import Path
+from typing import Callable, Optional, TypedDict
+
+import ffmpeg
+
+from video_to_mp4.services.media import duration_from_probe
+from video_to_mp4.services.media_index import get_probe
+
+# Output height for each resolution option; "Original" keeps the source size.
+RESOLUTION_HEIGHTS = {"4K": 2160, "1080p": 1080, "720p": 720, "480p": 480}
+
+_TIME_RE = re.compile(r"time=(\d+):(\d+):(\d+(?:\.\d+)?)")
+_OUT_TIME_MS_RE = re.compile(r"out_time_ms=(\d+)")
+
+# Seconds ffmpeg gets to exit after SIGTERM before it is killed.
+_TERMINATE_TIMEOUT = 5
+
+# Share of the progress bar given to the first of two passes, which is
+# faster than the second.
+_FIRST_PASS_SHARE = 35.0
+
+# MP4 muxer flags that move the moov atom to the front of the file once it
+# is written, so players can start before the whole file has downloaded.
+FASTSTART = "+faststart"
+
+# Fragmented MP4: an empty moov up front and a fragment at every keyframe,
+# so the file is playable while it is still being written.
+FRAGMENTED = "+frag_keyframe+empty_moov+default_base_moof"
+
+
+class ConversionCancelled(Exception):
+    """Raised when an ffmpeg run was stopped because its job was cancelled."""
+
+
+class EncodeStats(TypedDict):
+    """One -progress report from a running ffmpeg."""
+
+    fps: Optional[float]
+    # Media seconds encoded per wall second.
+    speed: Optional[float]
+    bitrate_kbps: Optional[float]
+    total_size: Optional[int]
+    out_time: float
+    # True for the last report, sent when ffmpeg is done.
+    finished: bool
+
+
+def _parse_number(value: Optional[str], suffix: str = "") -> Optional[float]:
+    """Parse a -progress value such as "1.5x" or "N/A"."""
+    if not value:
+        return None
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[: -len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _encode_stats(fields: dict[str, str]) -> EncodeStats:
+    total_size = _parse_number(fields.get("total_size"))
+    out_time_us = _parse_number(fields.get("out_time_us") or fields.get("out_time_ms"))
+    return {
+        "fps": _parse_number(fields.get("fps")),
+        "speed": _parse_number(fields.get("speed"), "x"),
+        "bitrate_kbps": _parse_number(fields.get("bitrate"), "kbits/s"),
+        "total_size": int(total_size) if total_size is not None else None,
+        "out_time": max(0.0, (out_time_us or 0) / 1_000_000),
+        "finished": fields.get("progress") == "end",
+    }
+
+
+def _parse_ffmpeg_time(line: str) -> Optional[float]:
+    match = _TIME_RE.search(line)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def scale_stream(stream, resolution_mode: str):
+    """Apply the scale filter for resolution_mode, if it has one."""
+    height = RESOLUTION_HEIGHTS.get(resolution_mode)
+    if height is None:
+        return stream
+    return stream.filter("scale", -1, height)
+
+
+def encode_streams(source, resolution_mode: str, audio: bool) -> list:
+    """Streams of an input node to encode at resolution_mode.
+
+    A filtered input only yields video, so when the video is scaled the
+    audio is mapped next to it explicitly.
+    """
+    if resolution_mode not in RESOLUTION_HEIGHTS:
+        return [source]
+    streams = [scale_stream(source, resolution_mode)]
+    if audio:
+        streams.append(source.audio)
+    return streams
+
+
+def _drain_lines(pipe, sink):
+    for line in iter(pipe.readline, b""):
+        sink.append(line.decode("utf-8", errors="ignore").strip())
+    pipe.close()
+
+
+def _stop_process(process: subprocess.Popen):
+    """Terminate process, killing it if it does not exit in time."""
+    process.terminate()
+    try:
+        process.wait(timeout=_TERMINATE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def _watch_cancel(process: subprocess.Popen, cancel: threading.Event):
+    while process.poll() is None:
+        if cancel.wait(0.2):
+            _stop_process(process)
+            return
+
+
+def _start_cancel_watch(process, cancel: Optional[threading.Event]):
+    if cancel is not None:
+        threading.Thread(
+            target=_watch_cancel, args=(process, cancel), daemon=True
+        ).start()
+
+
+def run_ffmpeg_output(output, cancel: Optional[threading.Event] = None):
+    """Run a prepared ffmpeg output node to completion.
+
+    Setting cancel stops ffmpeg and raises ConversionCancelled.
+    """
+    if cancel is not None and cancel.is_set():
+        raise ConversionCancelled()
+    process = output.run_async(
+        pipe_stdout=True, pipe_stderr=True, overwrite_output=True
+    )
+    _start_cancel_watch(process, cancel)
+    _, stderr = process.communicate()
+    if cancel is not None and cancel.is_set():
+        raise ConversionCancelled()
+    if process.returncode != 0:
+        raise ffmpeg.Error("ffmpeg", b"", stderr)
+
+
+def get_media_duration(path: Path) -> Optional[float]:
+    try:
+        return duration_from_probe(get_probe(path))
+    except (OSError, ffmpeg.Error):
+        return None
+
+
+def _output_options(
+    output_file: str,
+    crf,
+    preset,
+    threads: Optional[int],
+    remux: bool,
+    video_options: Optional[dict],
+    movflags: str,
+) -> dict:
+    output_kwargs = {}
+    if output_file.endswith(".mp4"):
+        output_kwargs["movflags"] = movflags
+    if remux:
+        output_kwargs["c"] = "copy"
+    else:
+        output_kwargs.update(vcodec="libx264", preset=preset, acodec="aac")
+        if crf is not None:
+            output_kwargs["crf"] = crf
+        if threads:
+            output_kwargs["threads"] = threads
+        output_kwargs.update(video_options or {})
+    return output_kwargs
+
+
+def _run_with_progress(
+    stream,
+    duration_seconds,
+    progress_callback,
+    cancel: Optional[threading.Event],
+    stats_callback: Optional[Callable[[EncodeStats], None]],
+):
+    if not (duration_seconds and (progress_callback or stats_callback)):
+        run_ffmpeg_output(stream, cancel)
+        return
+    if cancel is not None and cancel.is_set():
+        raise ConversionCancelled()
+    stream = stream.global_args("-progress", "pipe:1", "-nostats")
+    process = stream.run_async(
+        pipe_stdout=True, pipe_stderr=True, overwrite_output=True
+    )
+    _start_cancel_watch(process, cancel)
+    # Drain stderr concurrently so a chatty ffmpeg cannot fill the pipe
+    # and stall; the tail is kept for the error message.
+    stderr_tail = collections.deque(maxlen=20)
+    drain = threading.Thread(
+        target=_drain_lines, args=(process.stderr, stderr_tail), daemon=True
+    )
+    drain.start()
+    last_percent = 0.0
+    fields: dict[str, str] = {}
+    while True:
+        line = process.stdout.readline()
+        if not line:
+            if process.poll() is not None:
+                break
+            continue
+        text = line.decode("utf-8", errors="ignore").strip()
+        key, _, value = text.partition("=")
+        fields[key] = value
+        # Each report is a block of key=value lines ending in progress=.
+        if key == "progress" and stats_callback:
+            stats_callback(_encode_stats(fields))
+        match = _OUT_TIME_MS_RE.match(text)
+        if not match or not progress_callback:
+            continue
+        out_time_ms = int(match.group(1))
+        elapsed = out_time_ms / 1_000_000
+        percent = min(99.99, max(0.0, (elapsed / duration_seconds) * 100))
+        if percent - last_percent >= 0.01:
+            last_percent = percent
+            progress_callback(percent)
+    process.wait()
+    drain.join()
+    if cancel is not None and cancel.is_set():
+        raise ConversionCancelled()
+    if process.returncode != 0:
+        detail = " ".join(stderr_tail)
+        raise RuntimeError(f"ffmpeg exited with code {process.returncode}: {detail}")
+
+
+def run_ffmpeg(
+    stream,
+    output_path,
+    crf,
+    preset,
+    duration_seconds,
+    progress_callback,
+    threads: Optional[int] = None,
+    remux: bool = False,
+    cancel: Optional[threading.Event] = None,
+    stats_callback: Optional[Callable[[EncodeStats], None]] = None,
+    video_options: Optional[dict] = None,
+    movflags: str = FASTSTART,
+):
+    """Helper to run ffmpeg synchronously with optional progress callback.
+
+    stream may be a single stream or a list of streams to map into the
+    output. threads caps the encoder's worker threads; None leaves it to
+    ffmpeg. crf may be None when video_options sets a bitrate instead;
+    video_options are extra output options for the encode. With remux the
+    streams are copied as-is and crf/preset are ignored. MP4 outputs are
+    written with movflags, faststart by default. Setting cancel
+    stops ffmpeg and raises ConversionCancelled. stats_callback receives
+    ffmpeg's periodic progress reports.
+    """
+    output_file = str(output_path)
+    streams = stream if isinstance(stream, (list, tuple)) else [stream]
+    output_kwargs = _output_options(
+        output_file, crf, preset, threads, remux, video_options, movflags
+    )
+    stream = ffmpeg.output(*streams, output_file, **output_kwargs)
+    _run_with_progress(
+        stream, duration_seconds, progress_callback, cancel, stats_callback
+    )
+
+
+def run_renditions(
+    source,
+    outputs: list[tuple[Path, str]],
+    crf,
+    preset,
+    duration_seconds,
+    progress_callback,
+    audio: bool,
+    threads: Optional[int] = None,
+    cancel: Optional[threading.Event] = None,
+    stats_callback: Optional[Callable[[EncodeStats], None]] = None,
+    video_options: Optional[dict] = None,
+    movflags: str = FASTSTART,
+):
+    """Encode several resolutions of an input in a single ffmpeg run.
+
+    source is an input node; it is decoded once and split into one scaled
+    libx264 branch per (output_path, resolution_mode) in outputs, each with
+    the audio when audio is set. threads is shared between the branches.
+    The other arguments are as for run_ffmpeg.
+    """
+    branches = source.filter_multi_output("split", len(outputs))
+    branch_threads = max(1, threads // len(outputs)) if threads else None
+    nodes = []
+    for i, (output_path, resolution_mode) in enumerate(outputs):
+        streams = [scale_stream(branches.stream(i), resolution_mode)]
+        if audio:
+            streams.append(source.audio)
+        output_kwargs = _output_options(
+            str(output_path),
+            crf,
+            preset,
+            branch_threads,
+            False,
+            video_options,
+            movflags,
+        )
+        nodes.append(ffmpeg.output(*streams, str(output_path), **output_kwargs))
+    _run_with_progress(
+        ffmpeg.merge_outputs(*nodes),
+        duration_seconds,
+        progress_callback,
+        cancel,
+        stats_callback,
+    )
+
+
+def run_two_pass(
+    stream,
+    output_path,
+    bitrate_kbps: int,
+    preset: str,
+    duration_seconds,
+    progress_callback,
+    passlog_prefix: Path,
+    threads: Optional[int] = None,
+    cancel: Optional[threading.Event] = None,
+    stats_callback: Optional[Callable[[EncodeStats], None]] = None,
+    audio_kbps: int = 128,
+    movflags: str = FASTSTART,
+):
+    """Two-pass libx264 encode averaging bitrate_kbps of video.
+
+    The first pass only analyses the video and writes its statistics next
+    to passlog_prefix; the second encodes with them and writes the output
+    with movflags. Progress runs across both passes as one 0-100 range.
+    """
+
+    def scaled_progress(offset: float, share: float):
+        if progress_callback is None:
+            return None
+        return lambda pct: progress_callback(offset + pct * share / 100)
+
+    options = {"b:v": f"{bitrate_kbps}k", "passlogfile": str(passlog_prefix)}
+    try:
+        run_ffmpeg(
+            stream,
+            os.devnull,
+            None,
+            preset,
+            duration_seconds,
+            scaled_progress(0.0, _FIRST_PASS_SHARE),
+            threads=threads,
+            cancel=cancel,
+            stats_callback=stats_callback,
+            video_options={**options, "pass": 1, "an": None, "f": "null"},
+        )
+        run_ffmpeg(
+            stream,
+            output_path,
+            None,
+            preset,
+            duration_seconds,
+            scaled_progress(_FIRST_PASS_SHARE, 100 - _FIRST_PASS_SHARE),
+            threads=threads,
+            cancel=cancel,
+            stats_callback=stats_callback,
+            video_options={**options, "pass": 2, "b:a": f"{audio_kbps}k"},
+            movflags=movflags,
+        )
+    finally:
+        for path in passlog_prefix.parent.glob(f"{passlog_prefix.name}*"):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,137 @@
+import asyncio
+import base64
+import binascii
+import inspect
+import re
+from pathlib import Path
+from typing import Callable, Optional
+
+from video_to_mp4.services.containers import SNIFF_BYTES
+
+# Uploads are copied to disk in slices of this size so memory stays flat
+# regardless of how large the source file is.
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+_BASE64_RE = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload runs past the bytes it was allowed."""
+
+
+async def _read_chunk(source, size: int) -> bytes:
+    if inspect.iscoroutinefunction(source.read):
+        return await source.read(size)
+    data = await asyncio.to_thread(source.read, size)
+    if inspect.isawaitable(data):
+        data = await data
+    return data
+
+
+def _iter_sliced(data, size: int):
+    view = memoryview(data)
+    for start in range(0, len(view), size):
+        yield view[start : start + size]
+
+
+def _iter_int_list(data: list, size: int):
+    for start in range(0, len(data), size):
+        yield bytes(data[start : start + size])
+
+
+def _iter_base64(text: str, size: int):
+    if len(text) % 4 or not _BASE64_RE.fullmatch(text):
+        yield from _iter_sliced(text.encode("utf-8"), size)
+        return
+    # Decode in slices whose length is a multiple of 4 so each slice is valid
+    # base64 on its own.
+    step = max(4, size // 3 * 4)
+    for start in range(0, len(text), step):
+        try:
+            yield base64.b64decode(text[start : start + step])
+        except binascii.Error as e:
+            raise ValueError(f"Invalid base64 upload payload: {e}") from e
+
+
+def _iter_path(path: Path, size: int):
+    with open(path, "rb") as src:
+        while chunk := src.read(size):
+            yield chunk
+
+
+async def _iter_in_thread(chunks):
+    # Reading a file or decoding base64 blocks, so each chunk is produced
+    # on a worker thread rather than on the event loop.
+    while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+        yield chunk
+
+
+async def _iter_upload_chunks(source, size: int):
+    if isinstance(source, Path):
+        chunks = _iter_path(source, size)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        chunks = _iter_sliced(source, size)
+    elif isinstance(source, list):
+        chunks = _iter_int_list(source, size)
+    elif isinstance(source, str):
+        chunks = _iter_base64(source, size)
+    elif hasattr(source, "read"):
+        while chunk := await _read_chunk(source, size):
+            yield chunk
+        return
+    else:
+        raise ValueError(f"Unsupported upload source {type(source).__name__}")
+    try:
+        async for chunk in _iter_in_thread(chunks):
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def _write_chunk(f, hasher, chunk):
+    f.write(chunk)
+    if hasher is not None:
+        hasher.update(chunk)
+
+
+async def write_upload(
+    source,
+    file_path: Path,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+    hasher=None,
+    max_bytes: Optional[int] = None,
+    check_head: Optional[Callable[[bytes], None]] = None,
+) -> int:
+    """Copy an upload source to file_path in bounded chunks.
+
+    source may be a file-like object (sync or async read), a Path, raw bytes,
+    a list of byte values or a base64 string. If hasher is given (a hashlib
+    object) it is fed every chunk as it is written. check_head is called
+    with the first SNIFF_BYTES of the upload (all of it, if shorter) as soon
+    as they have arrived, and may raise to abort the copy. Past max_bytes
+    the copy stops with UploadTooLarge. Returns the number of bytes written.
+    A partially written file is removed on failure.
+    """
+    written = 0
+    head = b""
+    try:
+        with open(file_path, "wb") as f:
+            async for chunk in _iter_upload_chunks(source, chunk_size):
+                if check_head is not None and len(head) < SNIFF_BYTES:
+                    head += bytes(chunk[: SNIFF_BYTES - len(head)])
+                    if len(head) == SNIFF_BYTES:
+                        check_head(head)
+                if max_bytes is not None and written + len(chunk) > max_bytes:
+                    raise UploadTooLarge(
+                        f"Upload exceeds the {max_bytes} bytes of storage left"
+                    )
+                # Writing and hashing a chunk of a large upload would hold
+                # up every other session if done on the event loop.
+                await asyncio.to_thread(_write_chunk, f, hasher, chunk)
+                written += len(chunk)
+            if check_head is not None and len(head) < SNIFF_BYTES:
+                check_head(head)
+    except BaseException:
+        Path(file_path).unlink(missing_ok=True)
+        raise
+    return written
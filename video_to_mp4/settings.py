@@ -0,0 +1,96 @@
+"""Runtime settings, read from VIDEO_TO_MP4_* environment variables."""
+
+import os
+from pathlib import Path
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    return int(value)
+
+
+CPU_COUNT = os.cpu_count() or 1
+
+# Number of ffmpeg encodes allowed to run at the same time.
+MAX_CONCURRENT_ENCODES = max(1, _env_int("VIDEO_TO_MP4_MAX_ENCODES", CPU_COUNT))
+
+# Encoder threads handed to each running job. 0 shares the cores between
+# the jobs that are running or waiting when the job starts.
+THREADS_PER_JOB = max(0, _env_int("VIDEO_TO_MP4_THREADS_PER_JOB", 0))
+
+# Backend-private storage (SQLite database, caches). Kept outside the upload
+# directory because everything in there is publicly downloadable.
+DATA_DIR = Path(os.environ.get("VIDEO_TO_MP4_DATA_DIR", ".video_to_mp4"))
+DATABASE_PATH = DATA_DIR / "video_to_mp4.sqlite3"
+
+# Inputs at least this long (seconds) are split at keyframes and their
+# segments encoded in parallel when the job's thread budget allows it.
+SEGMENT_MIN_DURATION = _env_int("VIDEO_TO_MP4_SEGMENT_MIN_DURATION", 600)
+
+# Shortest segment (seconds) produced when splitting an input.
+SEGMENT_MIN_LENGTH = _env_int("VIDEO_TO_MP4_SEGMENT_MIN_LENGTH", 30)
+
+WORK_DIR = DATA_DIR / "work"
+
+# Storage quota (GiB) for sources and outputs in the upload directory. 0
+# turns the quota off.
+MAX_CAPACITY_GB = max(0.0, float(os.environ.get("VIDEO_TO_MP4_MAX_CAPACITY_GB", "100")))
+MAX_CAPACITY_BYTES = int(MAX_CAPACITY_GB * 1024**3)
+
+# Which converted outputs may be deleted to make room once usage passes
+# EVICTION_THRESHOLD percent of the quota: "lru" takes the least recently
+# downloaded (or created) first, "downloaded" only ever takes outputs that
+# have been downloaded, and "none" never deletes anything.
+EVICTION_POLICY = os.environ.get("VIDEO_TO_MP4_EVICTION_POLICY", "lru")
+EVICTION_THRESHOLD = min(100, max(1, _env_int("VIDEO_TO_MP4_EVICTION_THRESHOLD", 90)))
+
+# Retention sweeper: seconds between sweeps, and how long files are kept.
+# Staged uploads never confirmed (and interrupted temporary files) go after
+# STAGED_TTL, sources of Complete jobs after SOURCE_TTL, and finished jobs
+# with their outputs once their browser session has not been seen for
+# SESSION_TTL. 0 keeps that kind of file forever. Deletions are paced at
+# RETENTION_DELETE_RATE files per second.
+RETENTION_INTERVAL = max(1, _env_int("VIDEO_TO_MP4_RETENTION_INTERVAL", 600))
+STAGED_TTL = max(0, _env_int("VIDEO_TO_MP4_STAGED_TTL", 3600))
+SOURCE_TTL = max(0, _env_int("VIDEO_TO_MP4_SOURCE_TTL", 86400))
+SESSION_TTL = max(0, _env_int("VIDEO_TO_MP4_SESSION_TTL", 7 * 86400))
+RETENTION_DELETE_RATE = max(1, _env_int("VIDEO_TO_MP4_RETENTION_DELETE_RATE", 20))
+
+# Cached thumbnails and sprite sheets, and the threads that generate them
+# apart from the encode slots.
+PREVIEW_DIR = DATA_DIR / "previews"
+PREVIEW_WORKERS = max(1, _env_int("VIDEO_TO_MP4_PREVIEW_WORKERS", 1))
+
+# Maximum progress updates per second pushed to the browser for each job,
+# at least one every ten seconds.
+PROGRESS_UPDATE_HZ = max(0.1, float(os.environ.get("VIDEO_TO_MP4_PROGRESS_HZ", "4")))
+
+# Rows per page in the job table.
+JOBS_PER_PAGE = max(1, _env_int("VIDEO_TO_MP4_JOBS_PER_PAGE", 20))
+
+# Seconds between heartbeats on running jobs, and how old a heartbeat may
+# get before the job is considered abandoned and requeued.
+JOB_HEARTBEAT_INTERVAL = _env_int("VIDEO_TO_MP4_JOB_HEARTBEAT", 5)
+JOB_STALE_AFTER = _env_int("VIDEO_TO_MP4_JOB_STALE_AFTER", 60)
+
+# Seconds without progress after which a running job is shown as stalled.
+JOB_STALL_AFTER = _env_int("VIDEO_TO_MP4_JOB_STALL_AFTER", 60)
+
+# Seconds an idle job runner waits before checking the queue again.
+JOB_POLL_INTERVAL = _env_int("VIDEO_TO_MP4_JOB_POLL_INTERVAL", 2)
+
+# Turnaround target (seconds) for a job from upload to finished output. When
+# set, runners switch to faster x264 presets while the queue is too long to
+# meet it. 0 always uses the quality option's own preset.
+TURNAROUND_TARGET = max(0, _env_int("VIDEO_TO_MP4_TURNAROUND_TARGET", 0))
+
+# Whether the web backend runs conversions itself. Set to 0 when dedicated
+# workers (python -m video_to_mp4.worker) pull jobs from the queue instead.
+INPROCESS_WORKER = _env_int("VIDEO_TO_MP4_INPROCESS_WORKERS", 1) != 0
+
+# Write outputs as fragmented MP4 so they can be downloaded from
+# /stream/<job id> while the encode is still running. Long inputs are then
+# encoded in one piece instead of in parallel segments.
+FRAGMENTED_MP4 = _env_int("VIDEO_TO_MP4_FRAGMENTED_MP4", 0) != 0
@@ -1,16 +1,67 @@
 import reflex as rx
-import random
 from typing import TypedDict, Optional
 import datetime
 import tempfile
-import base64
-import os
 import asyncio
 from pathlib import Path
-import ffmpeg
 import logging
-import shutil
-import re
+import time
+import uuid
+from video_to_mp4 import settings
+from video_to_mp4.services import capacity, job_store, resumable
+from video_to_mp4.services.converter import (
+    MAX_BITRATE,
+    QUALITY_OPTIONS,
+    RESOLUTION_OPTIONS,
+    TARGET_SIZE,
+    job_resolutions,
+)
+from video_to_mp4.services.blob_store import (
+    ingest_upload,
+    release_blob,
+    stage_blob,
+    unstage_blob,
+)
+from video_to_mp4.services.job_runner import job_runner
+from video_to_mp4.services.retention import release_job_files
+
+
+# Client tokens of the sessions a watch_jobs task is syncing. Kept in
+# process memory rather than in the state, so that a backend restart does
+# not bring back the flag of a watcher that died with it.
+_watched_sessions: set[str] = set()
+
+
+def _fetch_job_page(session: str, page: int) -> dict:
+    """Read a page of a session's jobs, clamped to the pages there are."""
+    job_store.touch_session(session)
+    count = job_store.count_jobs(session)
+    page = max(0, min(page, -(-count // settings.JOBS_PER_PAGE) - 1))
+    rows = job_store.list_jobs(
+        session, page * settings.JOBS_PER_PAGE, settings.JOBS_PER_PAGE
+    )
+    used, reserved = capacity.usage()
+    return {
+        "count": count,
+        "page": page,
+        "rows": rows,
+        "outputs": job_store.job_outputs([row["id"] for row in rows]),
+        "used_bytes": used + reserved,
+    }
+
+
+def _release_staged(upload_dir: Path, staged: list[dict]):
+    """Let go of blobs held for a confirm dialog that was dismissed."""
+    for item in staged:
+        stored_name = item.get("stored_name")
+        if stored_name and unstage_blob(item["stage_id"]):
+            release_blob(upload_dir, stored_name)
+
+
+class JobOutput(TypedDict):
+    resolution: str
+    converted_filename: str
+    converted_size_str: str
 
 
 class FileJob(TypedDict):
@@ -21,10 +72,25 @@ class FileJob(TypedDict):
     progress: float
     uploaded_at: str
     resolution: str
+    # The resolutions on their own, in the order of the job's outputs.
+    resolutions: list[str]
     quality: str
     converted_filename: str
     converted_size_str: Optional[str]
+    # One entry per resolution once the job is Complete.
+    outputs: list[JobOutput]
     error_message: Optional[str]
+    remuxed: bool
+    content_hash: str
+
+
+class JobProgress(TypedDict):
+    progress: float
+    # Empty until the encoder has reported enough to estimate them.
+    speed_str: str
+    eta_str: str
+    projected_size_str: str
+    stalled: bool
 
 
 class AppState(rx.State):
@@ -36,28 +102,323 @@ class AppState(rx.State):
     show_confirm_dialog: bool = False
     pending_files: list[str] = []
     staged_files: list[dict] = []
-    selected_resolution: str = "Original"
+    selected_resolutions: list[str] = ["Original"]
     selected_quality: str = "High"
-    resolution_options: list[str] = ["Original", "4K", "1080p", "720p", "480p"]
-    quality_options: list[str] = ["Standard", "High", "Maximum"]
+    resolution_options: list[str] = list(RESOLUTION_OPTIONS)
+    quality_options: list[str] = list(QUALITY_OPTIONS)
+    # Limits used by the Target Size and Max Bitrate quality modes.
+    target_size_mb: int = 100
+    max_bitrate_kbps: int = 5000
     allowed_extensions: list[str] = ["avi", "mov", "mkv", "wmv", "mp4", "webm"]
-    recent_jobs: list[FileJob] = []
 
-    async def _update_job_progress(self, job_id: str, progress: float):
+    # The page of the session's jobs currently shown, newest first. The full
+    # history stays in the job store and never reaches the browser.
+    page_jobs: list[FileJob] = []
+    job_page: int = 0
+    job_count: int = 0
+
+    # Live progress of running jobs, kept apart from the job rows so that a
+    # progress tick only sends this small dict to the browser instead of
+    # the whole job list.
+    job_progress: dict[str, JobProgress] = {}
+
+    # Bytes held in the upload directory plus those reserved by unfinished
+    # jobs, against the storage quota.
+    used_capacity_bytes: int = 0
+    MAX_CAPACITY_GB: float = settings.MAX_CAPACITY_GB
+
+    @rx.var
+    def page_count(self) -> int:
+        return max(1, -(-self.job_count // settings.JOBS_PER_PAGE))
+
+    @rx.var
+    def used_capacity_gb(self) -> float:
+        return round(self.used_capacity_bytes / 1024**3, 1)
+
+    @rx.var
+    def remaining_capacity_gb(self) -> float:
+        return round(max(0.0, self.MAX_CAPACITY_GB - self.used_capacity_gb), 1)
+
+    @rx.var
+    def usage_percentage(self) -> float:
+        if not self.MAX_CAPACITY_GB:
+            return 0.0
+        return round(min(100.0, self.used_capacity_gb / self.MAX_CAPACITY_GB * 100), 1)
+
+    @rx.var
+    def usage_color(self) -> str:
+        if self.usage_percentage > 90:
+            return "bg-red-500"
+        if self.usage_percentage > 75:
+            return "bg-amber-500"
+        return "bg-indigo-600"
+
+    @rx.var
+    def resolution_label(self) -> str:
+        return ", ".join(self._ordered_resolutions())
+
+    @rx.var
+    def quality_label(self) -> str:
+        return self._quality_label(
+            self.selected_quality,
+            self.target_size_mb * 1024 * 1024,
+            self.max_bitrate_kbps,
+        )
+
+    def _quality_label(
+        self, quality: str, target_size: Optional[int], max_bitrate: Optional[int]
+    ) -> str:
+        if quality == TARGET_SIZE and target_size:
+            return f"Target {self._format_size(target_size)}"
+        if quality == MAX_BITRATE and max_bitrate:
+            return f"Max {max_bitrate} kbps"
+        return quality
+
+    @property
+    def _session(self) -> str:
+        return self.router.session.client_token
+
+    def _ordered_resolutions(self) -> list[str]:
+        return [r for r in self.resolution_options if r in self.selected_resolutions]
+
+    def _to_file_job(self, row: dict, outputs: list[dict]) -> FileJob:
+        converted_size = row["converted_size"]
+        if not outputs and row["converted_filename"]:
+            outputs = [row]
+        return {
+            "id": row["id"],
+            "filename": row["filename"],
+            "size_str": self._format_size(row["size"]),
+            "status": row["status"],
+            "progress": row["progress"],
+            "uploaded_at": datetime.datetime.fromtimestamp(
+                row["created_at"]
+            ).strftime("%H:%M"),
+            "resolution": row["resolution"],
+            "resolutions": job_resolutions(row),
+            "quality": self._quality_label(
+                row["quality"], row["target_size"], row["max_bitrate"]
+            ),
+            "converted_filename": row["converted_filename"],
+            "converted_size_str": (
+                self._format_size(converted_size)
+                if converted_size is not None
+                else None
+            ),
+            "outputs": [
+                {
+                    "resolution": output["resolution"],
+                    "converted_filename": output["converted_filename"],
+                    "converted_size_str": self._format_size(
+                        output["converted_size"] or 0
+                    ),
+                }
+                for output in outputs
+            ],
+            "error_message": row["error_message"],
+            "remuxed": bool(row["remuxed"]),
+            "content_hash": row["content_hash"],
+        }
+
+    def _to_job_progress(self, state: dict) -> JobProgress:
+        # Once the encoder reports, its reports must keep coming. Before that
+        # (waiting for another job's identical output, or an input without
+        # a known duration that never reports) the runner's heartbeat shows
+        # the job is alive.
+        last_activity = (
+            state["progress_at"]
+            or state["heartbeat_at"]
+            or state["started_at"]
+            or time.time()
+        )
+        eta = state["eta_seconds"]
+        return {
+            "progress": state["progress"],
+            "speed_str": f"{state['speed']:.2f}x" if state["speed"] else "",
+            "eta_str": self._format_duration(eta) if eta is not None else "",
+            "projected_size_str": (
+                "~" + self._format_size(state["projected_size"])
+                if state["projected_size"]
+                else ""
+            ),
+            "stalled": time.time() - last_activity > settings.JOB_STALL_AFTER,
+        }
+
+    def _apply_job_page(self, page: dict):
+        self.job_count = page["count"]
+        self.job_page = page["page"]
+        self.page_jobs = [
+            self._to_file_job(row, page["outputs"].get(row["id"], []))
+            for row in page["rows"]
+        ]
+        self.used_capacity_bytes = page["used_bytes"]
+
+    async def _refresh_job_page(self):
+        self._apply_job_page(
+            await asyncio.to_thread(_fetch_job_page, self._session, self.job_page)
+        )
+
+    async def _refresh_capacity(self):
+        used, reserved = await asyncio.to_thread(capacity.usage)
+        self.used_capacity_bytes = used + reserved
+
+    async def _add_job(self, stored_name: str, size: int, content_hash: str) -> str:
+        """Queue a job for an ingested blob, which the job then owns.
+
+        If the job cannot be queued the blob is released. Raises
+        QuotaExceeded when the job's predicted output does not fit in the
+        storage quota.
+        """
+        upload_dir = rx.get_upload_dir()
+        resolution = ", ".join(self._ordered_resolutions())
+        target_size = (
+            self.target_size_mb * 1024 * 1024
+            if self.selected_quality == TARGET_SIZE
+            else None
+        )
+        max_bitrate = (
+            self.max_bitrate_kbps if self.selected_quality == MAX_BITRATE else None
+        )
+        try:
+            # Probing the source and evicting outputs to make room both hit
+            # the disk, so they stay off the event loop.
+            predicted_size = await asyncio.to_thread(
+                capacity.predict_output_size,
+                upload_dir / stored_name,
+                size,
+                resolution,
+                self.selected_quality,
+                target_size,
+                max_bitrate,
+            )
+            if not await asyncio.to_thread(
+                capacity.ensure_space, upload_dir, predicted_size
+            ):
+                raise capacity.QuotaExceeded(
+                    "Not enough storage space for the converted output"
+                )
+            job_id = f"job_{uuid.uuid4().hex[:12]}"
+            job_store.create_job(
+                job_id,
+                self._session,
+                stored_name,
+                content_hash,
+                size,
+                resolution,
+                self.selected_quality,
+                target_size=target_size,
+                max_bitrate=max_bitrate,
+                predicted_size=predicted_size,
+            )
+        except BaseException:
+            release_blob(upload_dir, stored_name)
+            raise
+        return job_id
+
+    def _start_watching(self):
+        """Return the event that syncs job changes, unless one is running."""
+        if self._session in _watched_sessions:
+            return None
+        _watched_sessions.add(self._session)
+        return AppState.watch_jobs
+
+    @rx.event
+    async def load_jobs(self):
+        await self._refresh_job_page()
+        _, _, active = await asyncio.to_thread(
+            job_store.session_activity, self._session
+        )
+        if active:
+            return self._start_watching()
+
+    @rx.event(background=True)
+    async def watch_jobs(self):
+        """Mirror job store changes for this session into the state.
+
+        Runs while the session has Queued or Processing jobs, polling at
+        the progress update rate. Status changes refresh the visible page;
+        progress ticks only touch job_progress.
+        """
         async with self:
-            for idx, job in enumerate(self.recent_jobs):
-                if job["id"] == job_id:
-                    self.recent_jobs[idx]["progress"] = round(progress, 2)
-                    break
+            session = self._session
+        last_change = None
+        try:
+            while True:
+                # The store is read before taking the state lock, which is
+                # then only held to assign the results.
+                async with self:
+                    page_index = self.job_page
+                try:
+                    change, progress, active = await asyncio.to_thread(
+                        job_store.session_activity, session
+                    )
+                    page = None
+                    if change != last_change:
+                        page = await asyncio.to_thread(
+                            _fetch_job_page, session, page_index
+                        )
+                except Exception:
+                    logging.exception("Failed to poll job activity")
+                    await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+                    continue
+                async with self:
+                    # A page the user has since moved away from is fetched
+                    # again on the next poll.
+                    if page is not None and self.job_page == page_index:
+                        last_change = change
+                        self._apply_job_page(page)
+                    live = {
+                        job_id: self._to_job_progress(state)
+                        for job_id, state in progress.items()
+                    }
+                    if live != self.job_progress:
+                        self.job_progress = live
+                    if not active:
+                        return
+                await asyncio.sleep(1 / settings.PROGRESS_UPDATE_HZ)
+        finally:
+            _watched_sessions.discard(session)
+
+    @rx.event
+    async def next_job_page(self):
+        if self.job_page + 1 < self.page_count:
+            self.job_page += 1
+            await self._refresh_job_page()
+
+    @rx.event
+    async def prev_job_page(self):
+        if self.job_page > 0:
+            self.job_page -= 1
+            await self._refresh_job_page()
 
     @rx.event
-    def set_resolution(self, resolution: str):
-        self.selected_resolution = resolution
+    def toggle_resolution(self, resolution: str):
+        """Add or remove a resolution; at least one stays selected."""
+        if resolution not in self.selected_resolutions:
+            self.selected_resolutions = self.selected_resolutions + [resolution]
+        elif len(self.selected_resolutions) > 1:
+            self.selected_resolutions = [
+                r for r in self.selected_resolutions if r != resolution
+            ]
 
     @rx.event
     def set_quality(self, quality: str):
         self.selected_quality = quality
 
+    @rx.event
+    def set_target_size_mb(self, value: str):
+        try:
+            self.target_size_mb = max(1, int(value))
+        except ValueError:
+            pass
+
+    @rx.event
+    def set_max_bitrate_kbps(self, value: str):
+        try:
+            self.max_bitrate_kbps = max(100, int(value))
+        except ValueError:
+            pass
+
     @rx.event
     def toggle_resolution_help(self):
         self.show_resolution_help = not self.show_resolution_help
@@ -88,44 +449,92 @@ class AppState(rx.State):
         for file in files:
             filename = "unknown"
             try:
-                filename, upload_data = await self._read_upload_file(file)
-                base_name = Path(filename).stem
+                filename, source = await self._open_upload_file(file)
                 ext = Path(filename).suffix.lower()
                 if ext[1:] not in self.allowed_extensions:
                     errors.append(f"{filename}: Invalid file type {ext}")
                     continue
-                unique_filename = f"{base_name}_{random.randint(1000, 9999)}{ext}"
-                file_path = upload_dir / unique_filename
-                with open(file_path, "wb") as f:
-                    f.write(upload_data)
-                self.pending_files.append(filename)
-                self.staged_files.append(
-                    {
-                        "original_name": filename,
-                        "stored_name": unique_filename,
-                        "size": len(upload_data),
-                    }
+                max_bytes = await asyncio.to_thread(
+                    capacity.upload_allowance, upload_dir, getattr(file, "size", None)
                 )
+                stored_name, file_size, content_hash = await ingest_upload(
+                    source, upload_dir, filename, max_bytes
+                )
+                self._stage_file(filename, stored_name, file_size, content_hash)
             except Exception as e:
                 logging.exception(f"Failed to stage {filename}: {str(e)}")
                 errors.append(f"Failed to stage {filename}: {str(e)}")
         for err in errors:
             yield rx.toast.error(err)
+        await self._refresh_capacity()
         if not self.staged_files:
             return
         self.show_confirm_dialog = True
 
+    def _stage_file(
+        self, filename: str, stored_name: str, size: int, content_hash: str
+    ):
+        """Hold an ingested blob for the confirm dialog."""
+        self.pending_files.append(filename)
+        self.staged_files.append(
+            {
+                "original_name": filename,
+                "stored_name": stored_name,
+                "stage_id": stage_blob(stored_name),
+                "size": size,
+                "content_hash": content_hash,
+            }
+        )
+
     @rx.event
-    def close_confirm(self):
-        self.show_confirm_dialog = False
+    def start_resumable_upload(self):
+        self.is_uploading = True
+
+    @rx.event
+    async def stage_resumable_uploads(self, uploads: list[dict]):
+        """Stage files sent through the resumable upload routes.
+
+        uploads holds what the browser client reports per file: its
+        filename and either the upload id or the error that stopped it.
+        """
+        self.is_uploading = False
+        upload_dir = rx.get_upload_dir()
+        self.pending_files = []
+        self.staged_files = []
+        errors = []
+        for upload in uploads or []:
+            filename = upload.get("filename") or "unknown"
+            if upload.get("error") or not upload.get("upload_id"):
+                errors.append(f"Failed to upload {filename}: {upload.get('error')}")
+                continue
+            ext = Path(filename).suffix.lower()
+            if ext[1:] not in self.allowed_extensions:
+                resumable.delete_upload(upload_dir, upload["upload_id"])
+                errors.append(f"{filename}: Invalid file type {ext}")
+                continue
+            try:
+                stored_name, file_size, content_hash = await asyncio.to_thread(
+                    resumable.finish_upload, upload_dir, upload["upload_id"]
+                )
+                self._stage_file(filename, stored_name, file_size, content_hash)
+            except Exception as e:
+                logging.exception(f"Failed to stage {filename}: {str(e)}")
+                errors.append(f"Failed to stage {filename}: {str(e)}")
+        for err in errors:
+            yield rx.toast.error(err)
+        await self._refresh_capacity()
         if self.staged_files:
-            upload_dir = rx.get_upload_dir()
-            for item in self.staged_files:
-                stored_name = item.get("stored_name")
-                if stored_name:
-                    (upload_dir / stored_name).unlink(missing_ok=True)
+            self.show_confirm_dialog = True
+
+    @rx.event
+    async def close_confirm(self):
+        self.show_confirm_dialog = False
+        staged = self.staged_files
         self.pending_files = []
         self.staged_files = []
+        if staged:
+            await asyncio.to_thread(_release_staged, rx.get_upload_dir(), staged)
+        await self._refresh_capacity()
 
     @rx.event
     async def confirm_upload(self):
@@ -137,60 +546,77 @@ class AppState(rx.State):
             yield rx.toast.error("No files to convert.")
             return
         uploaded_count = 0
-        jobs_to_process = []
+        errors = []
         for item in staged:
             stored_name = item.get("stored_name")
-            original_name = item.get("original_name", stored_name)
             size = item.get("size", 0)
+            content_hash = item.get("content_hash", "")
             if not stored_name:
                 continue
-            job_id = f"job_{random.randint(10000, 99999)}"
-            new_job: FileJob = {
-                "id": job_id,
-                "filename": stored_name,
-                "size_str": self._format_size(size),
-                "status": "Queued",
-                "progress": 0.0,
-                "uploaded_at": datetime.datetime.now().strftime("%H:%M"),
-                "resolution": self.selected_resolution,
-                "quality": self.selected_quality,
-                "converted_filename": "",
-                "converted_size_str": None,
-                "error_message": None,
-            }
-            self.recent_jobs.insert(0, new_job)
+            if not unstage_blob(item["stage_id"]):
+                errors.append(
+                    f"{item.get('original_name')}: Upload expired, please upload"
+                    " it again"
+                )
+                continue
+            try:
+                await self._add_job(stored_name, size, content_hash)
+            except capacity.QuotaExceeded as e:
+                errors.append(f"{item.get('original_name')}: {e}")
+                continue
+            except Exception as e:
+                logging.exception(f"Failed to queue {item.get('original_name')}")
+                errors.append(f"Failed to queue {item.get('original_name')}: {e}")
+                continue
             uploaded_count += 1
-            jobs_to_process.append(job_id)
+        await self._refresh_job_page()
         if uploaded_count > 0:
+            job_runner.notify()
             yield rx.toast.success(f"Successfully uploaded {uploaded_count} file(s).")
-            for job_id in jobs_to_process:
-                yield AppState.process_job(job_id)
+            yield self._start_watching()
+        for err in errors:
+            yield rx.toast.error(err)
 
     @rx.event
-    def remove_job(self, job_id: str):
-        job = next((j for j in self.recent_jobs if j["id"] == job_id), None)
+    async def remove_job(self, job_id: str):
+        # Deleting the row is what cancels the job: a Queued job can no
+        # longer be claimed and a running one is stopped by its runner.
+        job = await asyncio.to_thread(job_store.delete_job, job_id)
         if job:
+            job_runner.cancel(job_id)
             try:
-                upload_dir = rx.get_upload_dir()
-                if job["filename"]:
-                    (upload_dir / job["filename"]).unlink(missing_ok=True)
-                if job.get("converted_filename"):
-                    (upload_dir / job["converted_filename"]).unlink(missing_ok=True)
+                await asyncio.to_thread(release_job_files, rx.get_upload_dir(), job)
             except Exception as e:
                 logging.exception(f"Error removing files for job {job_id}: {e}")
-        self.recent_jobs = [j for j in self.recent_jobs if j["id"] != job_id]
+        await self._refresh_job_page()
+        if job and job["status"] in (job_store.QUEUED, job_store.PROCESSING):
+            return rx.toast.info("Job cancelled.")
 
     @rx.event
-    def retry_job(self, job_id: str):
-        for job in self.recent_jobs:
-            if job["id"] == job_id:
-                job["status"] = "Queued"
-                job["progress"] = 0.0
-                job["error_message"] = None
-                yield AppState.process_job(job_id)
-                break
+    async def retry_job(self, job_id: str):
+        job = job_store.get_job(job_id)
+        if job and job["source_released_at"]:
+            yield rx.toast.error("The source file was deleted; upload it again.")
+            return
+        if job and not await asyncio.to_thread(
+            capacity.ensure_space, rx.get_upload_dir(), job["predicted_size"] or 0
+        ):
+            yield rx.toast.error("Not enough storage space to convert this job.")
+            return
+        if job_store.requeue_job(job_id):
+            job_runner.notify()
+            await self._refresh_job_page()
+            yield self._start_watching()
         yield rx.toast.info("Job requeued for processing.")
 
+    def _format_duration(self, seconds: float) -> str:
+        seconds = int(seconds)
+        if seconds < 60:
+            return f"{seconds}s"
+        if seconds < 3600:
+            return f"{seconds // 60}m {seconds % 60:02d}s"
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
     def _format_size(self, size_bytes: int) -> str:
         for unit in ["B", "KB", "MB", "GB", "TB"]:
             if size_bytes < 1024.0:
@@ -198,85 +624,73 @@ class AppState(rx.State):
             size_bytes /= 1024.0
         return f"{size_bytes:.1f} PB"
 
-    async def _read_upload_file(self, file) -> tuple[str, bytes]:
-        logging.error(
+    async def _open_upload_file(self, file) -> tuple[str, object]:
+        """Resolve an upload payload to its filename and a streamable source.
+
+        The source is handed to write_upload, which copies it to disk in
+        bounded chunks instead of materialising the whole file in memory.
+        """
+        logging.debug(
             "Upload payload type: %s", type(file).__name__
         )
         if hasattr(file, "read"):
-            upload_data = await file.read()
-            filename = getattr(file, "name", "unknown")
-            return filename, upload_data
+            filename = getattr(file, "name", None) or "unknown"
+            return filename, file
         if isinstance(file, dict):
-            logging.error("Upload payload keys: %s", list(file.keys()))
-            logging.error("Upload payload headers: %s", file.get("headers"))
+            logging.debug("Upload payload keys: %s", list(file.keys()))
             filename = (
                 file.get("name")
                 or file.get("filename")
                 or Path(file.get("path", "")).name
                 or "unknown"
             )
-            logging.error("Derived filename: %s", filename)
+            logging.debug("Derived filename: %s", filename)
             if "file" in file:
                 inner_file = file["file"]
-                logging.error(
+                logging.debug(
                     "Inner file type: %s", type(inner_file).__name__
                 )
                 if hasattr(inner_file, "read"):
-                    upload_data = await inner_file.read()
-                    return filename, upload_data
-                if isinstance(inner_file, (bytes, bytearray)):
-                    return filename, bytes(inner_file)
-                if isinstance(inner_file, list):
-                    return filename, bytes(inner_file)
+                    return filename, inner_file
+                if isinstance(inner_file, (bytes, bytearray, list)):
+                    return filename, inner_file
                 if isinstance(inner_file, str):
                     inner_path = inner_file
                     if inner_path:
-                        logging.error("Inner file string value: %s", inner_path)
+                        logging.debug("Inner file string value: %s", inner_path)
                         path = Path(inner_path)
                         if not path.is_absolute():
                             path = rx.get_upload_dir() / path
                         if path.exists():
-                            return filename or path.name, path.read_bytes()
+                            return filename or path.name, path
                 if isinstance(inner_file, dict):
-                    logging.error(
+                    logging.debug(
                         "Inner file keys: %s", list(inner_file.keys())
                     )
                     inner_path = inner_file.get("path") or inner_file.get("file_path")
                     if inner_path:
-                        logging.error("Inner file path: %s", inner_path)
+                        logging.debug("Inner file path: %s", inner_path)
                         path = Path(inner_path)
                         if not path.is_absolute():
                             path = rx.get_upload_dir() / path
                         if path.exists():
-                            return filename or path.name, path.read_bytes()
+                            return filename or path.name, path
                     inner_data = (
                         inner_file.get("data")
                         or inner_file.get("content")
                         or inner_file.get("contents")
                     )
-                    if isinstance(inner_data, list):
-                        return filename, bytes(inner_data)
-                    if isinstance(inner_data, str):
-                        try:
-                            return filename, base64.b64decode(inner_data)
-                        except Exception:
-                            return filename, inner_data.encode("utf-8")
+                    if isinstance(inner_data, (list, str)):
+                        return filename, inner_data
             upload_data = file.get("data") or file.get("content") or file.get("contents")
-            logging.error(
+            logging.debug(
                 "Inline data type: %s", type(upload_data).__name__
             )
-            if isinstance(upload_data, list):
-                upload_data = bytes(upload_data)
-            if isinstance(upload_data, str):
-                try:
-                    upload_data = base64.b64decode(upload_data)
-                except Exception:
-                    upload_data = upload_data.encode("utf-8")
-            if isinstance(upload_data, bytes):
+            if isinstance(upload_data, (bytes, bytearray, list, str)):
                 return filename, upload_data
             path_value = file.get("path") or file.get("file_path") or file.get("filepath")
             if path_value:
-                logging.error("Payload path: %s", path_value)
+                logging.debug("Payload path: %s", path_value)
                 path = Path(path_value)
                 candidate_paths = []
                 if path.is_absolute():
@@ -293,14 +707,14 @@ class AppState(rx.State):
                             Path(tempfile.gettempdir()) / path,
                         ]
                     )
-                logging.error(
+                logging.debug(
                     "Upload candidate paths: %s",
                     [str(p) for p in candidate_paths],
                 )
                 for candidate in candidate_paths:
                     if candidate.exists():
-                        return filename or candidate.name, candidate.read_bytes()
-            logging.error(
+                        return filename or candidate.name, candidate
+            logging.warning(
                 "Unsupported upload file payload keys: %s", list(file.keys())
             )
         raise ValueError("Unsupported upload file payload")
@@ -311,196 +725,32 @@ class AppState(rx.State):
         self.is_uploading = True
         uploaded_count = 0
         errors = []
-        jobs_to_process = []
         upload_dir = rx.get_upload_dir()
-        logging.error("Upload dir: %s", upload_dir)
-        try:
-            logging.error(
-                "Upload dir contents: %s",
-                [p.name for p in upload_dir.iterdir()],
-            )
-        except Exception as e:
-            logging.error("Failed to list upload dir: %s", e)
         upload_dir.mkdir(parents=True, exist_ok=True)
         for file in files:
             filename = "unknown"
             try:
-                filename, upload_data = await self._read_upload_file(file)
-                base_name = Path(filename).stem
+                filename, source = await self._open_upload_file(file)
                 ext = Path(filename).suffix.lower()
                 if ext[1:] not in self.allowed_extensions:
                     errors.append(f"{filename}: Invalid file type {ext}")
                     continue
-                unique_filename = f"{base_name}_{random.randint(1000, 9999)}{ext}"
-                file_path = upload_dir / unique_filename
-                file_size = len(upload_data)
-                with open(file_path, "wb") as f:
-                    f.write(upload_data)
-                job_id = f"job_{random.randint(10000, 99999)}"
-                new_job: FileJob = {
-                    "id": job_id,
-                    "filename": unique_filename,
-                    "size_str": self._format_size(file_size),
-                    "status": "Queued",
-                    "progress": 0.0,
-                    "uploaded_at": datetime.datetime.now().strftime("%H:%M"),
-                    "resolution": self.selected_resolution,
-                    "quality": self.selected_quality,
-                    "converted_filename": "",
-                    "converted_size_str": None,
-                    "error_message": None,
-                }
-                self.recent_jobs.insert(0, new_job)
+                max_bytes = await asyncio.to_thread(
+                    capacity.upload_allowance, upload_dir, getattr(file, "size", None)
+                )
+                unique_filename, file_size, content_hash = await ingest_upload(
+                    source, upload_dir, filename, max_bytes
+                )
+                await self._add_job(unique_filename, file_size, content_hash)
                 uploaded_count += 1
-                jobs_to_process.append(job_id)
             except Exception as e:
                 logging.exception(f"Failed to upload {filename}: {str(e)}")
                 errors.append(f"Failed to upload {filename}: {str(e)}")
         self.is_uploading = False
+        await self._refresh_job_page()
         if uploaded_count > 0:
+            job_runner.notify()
             yield rx.toast.success(f"Successfully uploaded {uploaded_count} file(s).")
-            for job_id in jobs_to_process:
-                yield AppState.process_job(job_id)
+            yield self._start_watching()
         for err in errors:
             yield rx.toast.error(err)
-
-    @rx.event(background=True)
-    async def process_job(self, job_id: str):
-        """Process the conversion job in the background."""
-        async with self:
-            job_idx = -1
-            for i, job in enumerate(self.recent_jobs):
-                if job["id"] == job_id:
-                    job_idx = i
-                    break
-            if job_idx == -1:
-                return
-            if not shutil.which("ffmpeg"):
-                self.recent_jobs[job_idx]["status"] = "Error"
-                self.recent_jobs[job_idx]["error_message"] = (
-                    "Server Error: FFmpeg not installed"
-                )
-                return
-            job = self.recent_jobs[job_idx]
-            self.recent_jobs[job_idx]["status"] = "Processing"
-            self.recent_jobs[job_idx]["progress"] = 5.0
-            input_filename = job["filename"]
-            resolution_mode = job["resolution"]
-            quality_mode = job["quality"]
-        upload_dir = rx.get_upload_dir()
-        input_path = upload_dir / input_filename
-        output_filename = f"converted_{Path(input_filename).stem}.mp4"
-        output_path = upload_dir / output_filename
-        try:
-            if not input_path.exists():
-                raise FileNotFoundError(f"Input file {input_filename} not found")
-            duration_seconds = get_media_duration(input_path)
-            stream = ffmpeg.input(input_path)
-            if resolution_mode == "4K":
-                stream = stream.filter("scale", -1, 2160)
-            elif resolution_mode == "1080p":
-                stream = stream.filter("scale", -1, 1080)
-            elif resolution_mode == "720p":
-                stream = stream.filter("scale", -1, 720)
-            elif resolution_mode == "480p":
-                stream = stream.filter("scale", -1, 480)
-            crf = 23
-            preset = "medium"
-            if quality_mode == "High":
-                crf = 18
-                preset = "slow"
-            elif quality_mode == "Maximum":
-                crf = 15
-                preset = "veryslow"
-            elif quality_mode == "Standard":
-                crf = 28
-                preset = "fast"
-            async with self:
-                self.recent_jobs[job_idx]["progress"] = 10.0
-            loop = asyncio.get_running_loop()
-            progress_callback = None
-            if duration_seconds and duration_seconds > 0:
-                def progress_callback(pct: float):
-                    asyncio.run_coroutine_threadsafe(
-                        self._update_job_progress(job_id, pct), loop
-                    )
-            await asyncio.to_thread(
-                run_ffmpeg,
-                stream,
-                output_path,
-                crf,
-                preset,
-                duration_seconds,
-                progress_callback,
-            )
-            if not output_path.exists():
-                raise Exception("Conversion failed: Output file not created")
-            converted_size = output_path.stat().st_size
-            async with self:
-                self.recent_jobs[job_idx]["status"] = "Complete"
-                self.recent_jobs[job_idx]["progress"] = 100.0
-                self.recent_jobs[job_idx]["converted_filename"] = output_filename
-                self.recent_jobs[job_idx]["converted_size_str"] = self._format_size(
-                    converted_size
-                )
-        except Exception as e:
-            logging.exception(f"Conversion error for job {job_id}")
-            async with self:
-                self.recent_jobs[job_idx]["status"] = "Error"
-                self.recent_jobs[job_idx]["error_message"] = str(e)
-
-
-_TIME_RE = re.compile(r"time=(\d+):(\d+):(\d+(?:\.\d+)?)")
-_OUT_TIME_MS_RE = re.compile(r"out_time_ms=(\d+)")
-
-
-def _parse_ffmpeg_time(line: str) -> Optional[float]:
-    match = _TIME_RE.search(line)
-    if not match:
-        return None
-    hours, minutes, seconds = match.groups()
-    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
-
-
-def get_media_duration(path: Path) -> Optional[float]:
-    try:
-        probe = ffmpeg.probe(str(path))
-        if "format" in probe and "duration" in probe["format"]:
-            return float(probe["format"]["duration"])
-        for stream in probe.get("streams", []):
-            if "duration" in stream:
-                return float(stream["duration"])
-    except Exception:
-        return None
-    return None
-
-
-def run_ffmpeg(stream, output_path, crf, preset, duration_seconds, progress_callback):
-    """Helper to run ffmpeg synchronously with optional progress callback."""
-    output_file = str(output_path)
-    stream = ffmpeg.output(
-        stream, output_file, vcodec="libx264", crf=crf, preset=preset, acodec="aac"
-    )
-    if duration_seconds and progress_callback:
-        stream = stream.global_args("-progress", "pipe:1", "-nostats")
-        process = stream.run_async(pipe_stdout=True, pipe_stderr=True, overwrite_output=True)
-        last_percent = 0.0
-        while True:
-            line = process.stdout.readline()
-            if not line:
-                if process.poll() is not None:
-                    break
-                continue
-            text = line.decode("utf-8", errors="ignore").strip()
-            match = _OUT_TIME_MS_RE.match(text)
-            if not match:
-                continue
-            out_time_ms = int(match.group(1))
-            elapsed = out_time_ms / 1_000_000
-            percent = min(99.99, max(0.0, (elapsed / duration_seconds) * 100))
-            if percent - last_percent >= 0.01:
-                last_percent = percent
-                progress_callback(percent)
-        process.wait()
-    else:
-        stream.run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
\ No newline at end of file
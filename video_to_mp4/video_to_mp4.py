@@ -1,6 +1,12 @@
 import reflex as rx
+from video_to_mp4 import settings
+from video_to_mp4.components.capacity_indicator import capacity_card
 from video_to_mp4.components.upload_zone import upload_zone
+from video_to_mp4.api import api
 from video_to_mp4.components.job_list import job_list
+from video_to_mp4.services.job_runner import run_job_queue
+from video_to_mp4.services.retention import run_retention_sweeper
+from video_to_mp4.states.app_state import AppState
 
 
 def index() -> rx.Component:
@@ -21,6 +27,11 @@ def index() -> rx.Component:
                 rx.el.div(
                     upload_zone(),
                     rx.el.div(class_name="h-6"),
+                    *(
+                        (capacity_card(), rx.el.div(class_name="h-6"))
+                        if settings.MAX_CAPACITY_BYTES
+                        else ()
+                    ),
                     job_list(),
                     class_name="flex flex-col pb-12",
                 ),
@@ -38,5 +49,9 @@ app = rx.App(
     stylesheets=[
         "https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap"
     ],
+    head_components=[rx.script(src="/resumable_upload.js")],
+    api_transformer=api,
 )
-app.add_page(index, route="/")
\ No newline at end of file
+app.add_page(index, route="/", on_load=AppState.load_jobs)
+app.register_lifespan_task(run_job_queue)
+app.register_lifespan_task(run_retention_sweeper)
\ No newline at end of file
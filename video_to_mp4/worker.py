@@ -0,0 +1,83 @@
+"""Standalone conversion worker.
+
+Runs queued conversions outside the web backend, pulling jobs from the
+same SQLite queue and reporting progress through it:
+
+    python -m video_to_mp4.worker
+
+Start as many as the machine (or machines sharing the data and upload
+directories) can take, and set VIDEO_TO_MP4_INPROCESS_WORKERS=0 on the
+web backend so it only serves the UI. SIGTERM stops claiming new jobs
+and waits for the running ones; a second signal exits at once.
+"""
+
+import argparse
+import asyncio
+import logging
+import signal
+from pathlib import Path
+
+import reflex as rx
+
+from video_to_mp4 import settings
+from video_to_mp4.services.conversion_pool import ConversionPool
+from video_to_mp4.services.job_runner import JobRunner, adaptive_presets
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--max-encodes",
+        type=int,
+        default=settings.MAX_CONCURRENT_ENCODES,
+        help="conversions this worker runs at once (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--threads-per-job",
+        type=int,
+        default=settings.THREADS_PER_JOB,
+        help="encoder threads per conversion, 0 for auto (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--upload-dir",
+        type=Path,
+        default=None,
+        help="directory holding uploads and outputs (default: Reflex upload dir)",
+    )
+    return parser.parse_args(argv)
+
+
+async def _run(runner: JobRunner, upload_dir: Path):
+    loop = asyncio.get_running_loop()
+
+    def stop():
+        logging.info("Stopping worker after the running jobs finish")
+        # Let a second signal take its default action.
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        runner.stop()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop)
+    await runner.run(upload_dir)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    upload_dir = args.upload_dir or rx.get_upload_dir()
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    pool = ConversionPool(
+        max(1, args.max_encodes), max(0, args.threads_per_job), settings.CPU_COUNT
+    )
+    runner = JobRunner(pool, presets=adaptive_presets())
+    logging.info(
+        f"Worker started: {pool.max_concurrent} slot(s), uploads in {upload_dir}"
+    )
+    asyncio.run(_run(runner, upload_dir))
+
+
+if __name__ == "__main__":
+    main()